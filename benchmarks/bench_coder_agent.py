@@ -0,0 +1,73 @@
+"""Micro-benchmark of the per-step overhead of the react coder agent.
+
+Compares building the react agent for every implementation step (the old
+behaviour) with reusing the subgraph returned by ``get_coder_agent``. The
+chat model is a zero-latency stub, so the numbers are pure framework cost.
+
+    python benchmarks/bench_coder_agent.py --steps 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+os.environ["LLM_CACHE_MODE"] = "off"
+os.environ["ROUTER_RULES"] = "off"
+os.chdir(tempfile.mkdtemp(prefix="bench_coder_"))
+
+from langchain.globals import set_debug, set_verbose  # noqa: E402
+from langgraph.prebuilt import create_react_agent  # noqa: E402
+
+import agent.graph as graph  # noqa: E402
+from fake_llm import ScriptedChatModel  # noqa: E402
+from prompts.prompt import coder_system_prompt  # noqa: E402
+
+
+def _messages(i: int) -> dict:
+    return {"messages": [{"role": "user", "content": f"Task: step {i}\nFile: step_{i}.js\n"}]}
+
+
+def per_step_build(steps: int) -> float:
+    start = time.perf_counter()
+    for i in range(steps):
+        react_agent = create_react_agent(graph.llm, graph.CODER_TOOLS, prompt=coder_system_prompt())
+        react_agent.invoke(_messages(i))
+    return (time.perf_counter() - start) / steps
+
+
+def shared_agent(steps: int) -> float:
+    start = time.perf_counter()
+    for i in range(steps):
+        graph.get_coder_agent().invoke(_messages(i))
+    return (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-step coder agent overhead")
+    parser.add_argument("--steps", type=int, default=100, help="Implementation steps per variant (default: 100)")
+    args = parser.parse_args()
+
+    set_debug(False)
+    set_verbose(False)
+    graph.llm = ScriptedChatModel()
+
+    # Warm up imports and lazily initialised LangChain internals.
+    per_step_build(3)
+    shared_agent(3)
+
+    before = per_step_build(args.steps)
+    after = shared_agent(args.steps)
+    print(f"steps per variant:        {args.steps}")
+    print(f"build agent every step:   {before * 1000:8.2f} ms/step")
+    print(f"shared compiled agent:    {after * 1000:8.2f} ms/step")
+    print(f"overhead saved per step:  {(before - after) * 1000:8.2f} ms ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
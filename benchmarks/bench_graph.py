@@ -0,0 +1,193 @@
+"""End-to-end benchmark of the agent graph against a scripted local model.
+
+Runs ``agent`` on synthetic plans (5, 50 and 500 files by default) with
+``ScriptedChatModel`` in place of ChatGroq, so the numbers measure the
+pipeline's own overhead: graph supersteps, checkpointing, react agent
+turns and file tools. Every size runs in a fresh subprocess, which keeps
+peak RSS per size. Results are stored in benchmarks/results/<commit>.json;
+pass --compare to diff them against an earlier results file.
+
+    python benchmarks/bench_graph.py
+    python benchmarks/bench_graph.py --sizes 5 50 --compare benchmarks/results/abc1234.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _dir_stats(root: Path):
+    # The manifest of the generation (see agent/incremental.py) is not part of the project
+    files = [p for p in root.rglob("*") if p.is_file() and p.relative_to(root).parts[0] != ".generator"]
+    return len(files), sum(p.stat().st_size for p in files)
+
+
+def run_single(n_files: int, max_concurrency: int, latency: float) -> dict:
+    """Runs one generation in this process and returns its measurements."""
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_graph_{n_files}_"))
+    os.chdir(workdir)
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+    os.environ["LLM_CACHE_MODE"] = "off"
+    os.environ["PLAN_STORE_MODE"] = "off"
+    os.environ["ROUTER_RULES"] = "off"
+    os.environ["RUNS_DIR"] = str(workdir / "runs")
+    os.environ.pop("CHECKPOINT_DB", None)
+    sys.path.insert(0, str(BENCH_DIR))
+    sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+
+    started = time.perf_counter()
+    import agent.graph as graph
+    from agent.metrics import get_run_metrics
+    from fake_llm import ScriptedChatModel
+    from tools.tools import PROJECT_ROOT
+    import_time = time.perf_counter() - started
+
+    graph.llm = ScriptedChatModel(n_files=n_files, latency=latency)
+    run_id = f"bench-{n_files}"
+    config = graph.run_config(run_id, recursion_limit=2 * n_files + 20, max_concurrency=max_concurrency)
+
+    started, started_at = time.perf_counter(), time.time()
+    graph.get_agent().invoke({"user_prompt": "Synthetic benchmark project"}, config)
+    wall_time = time.perf_counter() - started
+
+    metrics = get_run_metrics(run_id)
+    nodes = {}
+    for node, total in metrics.summary().items():
+        nodes[node] = {
+            **total,
+            "mean_wall_time": round(total["wall_time"] / max(total["spans"], 1), 6),
+        }
+    tools = {}
+    for span in metrics.spans:
+        for name, stats in span.tool_calls.items():
+            agg = tools.setdefault(name, {"count": 0, "seconds": 0.0})
+            agg["count"] += stats["count"]
+            agg["seconds"] = round(agg["seconds"] + stats["seconds"], 6)
+
+    # Speculative coding overlaps the first coder steps with the architect
+    first_file = min(
+        (s.started_at + s.wall_time for s in metrics.spans if s.node == "coder"), default=started_at
+    ) - started_at
+
+    files_written, bytes_written = _dir_stats(PROJECT_ROOT)
+    checkpoint_bytes = Path(graph.CHECKPOINT_DB).stat().st_size
+    return {
+        "files": n_files,
+        "max_concurrency": max_concurrency,
+        "model_latency": latency,
+        "import_time": round(import_time, 6),
+        "wall_time": round(wall_time, 6),
+        "files_per_second": round(n_files / wall_time, 3),
+        "time_to_first_file": round(first_file, 6),
+        "model_calls": graph.llm.calls,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "nodes": nodes,
+        "tools": tools,
+        "filesystem": {
+            "files_written": files_written,
+            "bytes_written": bytes_written,
+            "checkpoint_bytes": checkpoint_bytes,
+            "tool_seconds": round(sum(t["seconds"] for t in tools.values()), 6),
+        },
+    }
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _print_report(results: list) -> None:
+    print(f"{'files':>6} {'wall s':>9} {'files/s':>9} {'first s':>8} {'calls':>7} {'rss MB':>8} "
+          f"{'planner ms':>11} {'architect ms':>13} {'coder ms/step':>14} {'fs s':>8}")
+    for r in results:
+        nodes = r["nodes"]
+        print(
+            f"{r['files']:>6} {r['wall_time']:>9.3f} {r['files_per_second']:>9.1f} "
+            f"{r.get('time_to_first_file', 0):>8.3f} {r['model_calls']:>7} "
+            f"{r['peak_rss_mb']:>8.1f} "
+            f"{nodes.get('planner', {}).get('mean_wall_time', 0) * 1000:>11.2f} "
+            f"{nodes.get('architect', {}).get('mean_wall_time', 0) * 1000:>13.2f} "
+            f"{nodes.get('coder', {}).get('mean_wall_time', 0) * 1000:>14.2f} "
+            f"{r['filesystem']['tool_seconds']:>8.3f}"
+        )
+
+
+def _print_comparison(results: list, baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    by_size = {r["files"]: r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['commit']} ({baseline_path}):")
+    for r in results:
+        old = by_size.get(r["files"])
+        if old is None:
+            continue
+        for key in ("wall_time", "files_per_second", "peak_rss_mb"):
+            change = (r[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"  {r['files']:>5} files  {key:<17} {old[key]:>10} -> {r[key]:>10}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent graph offline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500],
+                        help="Number of files per synthetic plan (default: 5 50 500)")
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                        help="Files coded in parallel (default: 4)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Simulated seconds per model call (default: 0)")
+    parser.add_argument("--compare", type=Path, default=None,
+                        help="Earlier results file to compare against")
+    parser.add_argument("--single", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        result = run_single(args.single, args.max_concurrency, args.latency)
+        # The architect prints the task plan, so the result is the last line.
+        print("\n" + json.dumps(result))
+        return
+
+    results = []
+    for n_files in args.sizes:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--single", str(n_files),
+             "--max-concurrency", str(args.max_concurrency), "--latency", str(args.latency)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit(f"Benchmark for {n_files} files failed")
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    _print_report(results)
+
+    commit = _git_commit()
+    RESULTS_DIR.mkdir(exist_ok=True)
+    out = RESULTS_DIR / f"{commit}.json"
+    out.write_text(json.dumps({"commit": commit, "created_at": time.time(), "results": results}, indent=2),
+                   encoding="utf-8")
+    print(f"\nResults: {out}")
+
+    if args.compare:
+        _print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Runs the agent graph through the real ChatGroq client against a faulty fake API.
+
+Starts ``fake_groq_server`` in-process, points ChatGroq at it and generates
+a synthetic project while the server injects latency, 503s, 429s and hung
+requests. Reports whether the run succeeded, its wall time and the
+retries, timeouts and hedges of the call layer.
+
+    python benchmarks/bench_resilience.py --error-rate 0.2 --hang-rate 0.05 --timeout 2
+    python benchmarks/bench_resilience.py --jitter 2 --hedge-after 0.5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the resilient LLM call layer against injected faults")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=2.0, help="LLM_TIMEOUT per attempt")
+    parser.add_argument("--hedge-after", type=float, default=0.0, help="LLM_HEDGE_AFTER (0 = no hedging)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_resilience_"))
+    os.chdir(workdir)
+    sys.path.insert(0, str(BENCH_DIR))
+    sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+
+    from fake_groq_server import FaultConfig, start_fake_server
+    from fake_llm import ScriptedChatModel
+
+    faults = FaultConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.hang_rate,
+                         hang_seconds=args.timeout * 3, seed=args.seed)
+    model = ScriptedChatModel(n_files=args.files)
+    server = start_fake_server(model, faults)
+
+    os.environ.update({
+        "GROQ_API_BASE": f"http://127.0.0.1:{server.server_address[1]}",
+        "GROQ_API_KEY": "offline-benchmark",
+        "LLM_CACHE_MODE": "off",
+        "PLAN_STORE_MODE": "off",
+        "ROUTER_RULES": "off",
+        "LLM_TIMEOUT": str(args.timeout),
+        "LLM_RETRY_BASE_DELAY": "0.1",
+        "LLM_MAX_RETRIES": "5",
+        "LLM_HEDGE_AFTER": str(args.hedge_after),
+        "RUNS_DIR": str(workdir / "runs"),
+    })
+
+    from agent.metrics import render_prometheus
+    from agent.runner import run_generation
+
+    started = time.perf_counter()
+    result = run_generation("Synthetic resilience benchmark", "bench-resilience", workdir / "project",
+                            recursion_limit=2 * args.files + 20)
+    wall_time = time.perf_counter() - started
+
+    events = {}
+    for line in render_prometheus().splitlines():
+        if line.startswith("agent_llm_resilience_events_total"):
+            event = line.split('event="')[1].split('"')[0]
+            events[event] = events.get(event, 0) + int(float(line.rsplit(" ", 1)[1]))
+    print(json.dumps({
+        "status": result["status"],
+        "error": result["error"],
+        "files": f"{result['files']}/{args.files}",
+        "wall_time": round(wall_time, 3),
+        "requests": faults.requests,
+        "injected": faults.failures,
+        "call_layer": events,
+    }, indent=2))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
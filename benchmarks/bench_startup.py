@@ -0,0 +1,148 @@
+"""Import-time and cold-start benchmark of the CLI and the Streamlit app.
+
+Each measurement runs in a fresh interpreter, so nothing is cached in
+``sys.modules``:
+
+- ``import main`` / ``import app``: importing the entry point (the app is
+  run once through Streamlit's AppTest, which executes the whole script),
+- ``main --help``: the CLI from process start to exit,
+- ``app rerun``: a second run of the app script in the same process, which
+  is what every Streamlit interaction costs,
+- ``agent.get_agent()``: importing the agent graph and compiling it, paid
+  once per process on the first generation.
+
+Exits with status 1 if ``import main``, ``main --help`` or the first app
+run take longer than ``--budget`` seconds (median of ``--repeat`` runs).
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5 --budget 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+SRC_DIR = BENCH_DIR.parent / "src"
+
+# Modules whose presence after an import shows that startup loaded them.
+HEAVY_MODULES = ("langchain_core", "langgraph", "langchain_groq", "langchain")
+
+_IMPORT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+_AGENT = """
+import json, time
+started = time.perf_counter()
+from agent.graph import get_agent
+get_agent()
+print(json.dumps({"seconds": time.perf_counter() - started}))
+"""
+
+_APP = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+first = time.perf_counter() - started
+started = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - started
+print(json.dumps({{"seconds": first, "rerun": rerun, "exception": bool(at.exception),
+                  "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _env(workdir: Path) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": str(SRC_DIR),
+        "GROQ_API_KEY": env.get("GROQ_API_KEY", "offline-benchmark"),
+        "RUNS_DIR": str(workdir / "runs"),
+        "LLM_CACHE_PATH": str(workdir / "llm_cache.sqlite3"),
+        "PLAN_STORE_MODE": "off",
+    })
+    env.pop("CHECKPOINT_DB", None)
+    return env
+
+
+def _python(code: str, workdir: Path) -> dict:
+    proc = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=_env(workdir),
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        sys.exit("Startup benchmark failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _cli_help(workdir: Path) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, str(SRC_DIR / "main.py"), "--help"], cwd=workdir, env=_env(workdir),
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        sys.exit("main.py --help failed")
+    return {"seconds": time.perf_counter() - started}
+
+
+def _summary(runs: list, key: str = "seconds") -> dict:
+    values = [r[key] for r in runs]
+    return {"median": round(statistics.median(values), 3), "max": round(max(values), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time and cold start of main.py and app.py")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per measurement (default: 3)")
+    parser.add_argument("--budget", type=float, default=1.5,
+                        help="Seconds allowed for import main, main --help and the first app run (default: 1.5)")
+    parser.add_argument("--no-app", action="store_true", help="Skip the Streamlit measurements")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_startup_"))
+    measurements = {
+        "import main": [_python(_IMPORT.format(module="main", heavy=HEAVY_MODULES), workdir)
+                        for _ in range(args.repeat)],
+        "main --help": [_cli_help(workdir) for _ in range(args.repeat)],
+        "agent.get_agent()": [_python(_AGENT, workdir) for _ in range(args.repeat)],
+    }
+    if not args.no_app:
+        try:
+            import streamlit  # noqa: F401
+        except ImportError:
+            print("streamlit is not installed, skipping the app measurements")
+        else:
+            app = [_python(_APP.format(app=str(SRC_DIR / "app.py"), heavy=HEAVY_MODULES), workdir)
+                   for _ in range(args.repeat)]
+            if any(r["exception"] for r in app):
+                sys.exit("app.py raised an exception")
+            measurements["import app"] = app
+            measurements["app rerun"] = [{"seconds": r["rerun"]} for r in app]
+
+    results = {}
+    print(f"{'measurement':<20} {'median s':>9} {'max s':>8}  heavy modules loaded")
+    for name, runs in measurements.items():
+        results[name] = {**_summary(runs), "loaded": runs[0].get("loaded")}
+        loaded = runs[0].get("loaded")
+        print(f"{name:<20} {results[name]['median']:>9.3f} {results[name]['max']:>8.3f}  "
+              f"{', '.join(loaded) if loaded else ('-' if loaded is not None else '')}")
+
+    over = [name for name in ("import main", "main --help", "import app")
+            if name in results and results[name]["median"] > args.budget]
+    print(json.dumps({"budget": args.budget, "over_budget": over, "results": results}))
+    if over:
+        sys.exit(f"Over the {args.budget:g}s startup budget: {', '.join(over)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Local stand-in for the Groq chat completions API that injects faults.
+
+Answers ``POST /openai/v1/chat/completions`` (streamed or not) with the
+scripted responses of ``ScriptedChatModel``, after a random latency, and
+fails a share of the requests with server errors, rate limits or hangs.
+Point the agent at it to exercise the call layer of agent/resilience.py:
+
+    python benchmarks/fake_groq_server.py --port 8750 --error-rate 0.2 --hang-rate 0.05
+    GROQ_API_BASE=http://127.0.0.1:8750 GROQ_API_KEY=x LLM_TIMEOUT=5 python src/main.py
+
+``bench_resilience.py`` starts it in-process with ``start_fake_server``.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from langchain_core.messages import convert_to_messages
+
+from fake_llm import ScriptedChatModel
+
+
+class FaultConfig:
+    """Latency and failure rates of the fake server; change them while it runs."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, hang_rate: float = 0.0, hang_seconds: float = 30.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.failures = {"error": 0, "rate_limit": 0, "hang": 0}
+        self.lock = threading.Lock()
+
+    def draw(self) -> tuple:
+        """The fault of the next request (or None) and its latency."""
+        with self.lock:
+            self.requests += 1
+            r = self.random.random()
+            latency = self.latency + self.random.uniform(0, self.jitter)
+            for fault, rate in (("error", self.error_rate), ("rate_limit", self.rate_limit_rate),
+                                ("hang", self.hang_rate)):
+                if r < rate:
+                    self.failures[fault] += 1
+                    return fault, latency
+                r -= rate
+            return None, latency
+
+
+def _message_dict(message) -> dict:
+    tool_calls = [
+        {"id": call["id"], "type": "function",
+         "function": {"name": call["name"], "arguments": json.dumps(call["args"])}}
+        for call in message.tool_calls
+    ]
+    result = {"role": "assistant", "content": message.content or None}
+    if tool_calls:
+        result["tool_calls"] = tool_calls
+    return result
+
+
+def _handler(model: ScriptedChatModel, faults: FaultConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _json(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            try:
+                self._answer()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up on the request, e.g. after its timeout
+                pass
+
+        def _answer(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+            fault, latency = faults.draw()
+            if fault == "hang":
+                time.sleep(faults.hang_seconds)
+            time.sleep(latency)
+            if fault == "error":
+                self._json(503, {"error": {"message": "injected server error", "type": "internal_server_error"}})
+                return
+            if fault == "rate_limit":
+                self._json(429, {"error": {"message": "injected rate limit", "type": "rate_limit_exceeded"}},
+                           {"Retry-After": "0"})
+                return
+
+            messages = convert_to_messages([
+                {**m, "content": m.get("content") or ""} for m in body.get("messages", [])
+            ])
+            with faults.lock:
+                model.calls += 1
+            message = model._respond(messages, body.get("tools") or [])
+            usage = model._usage(messages, message)
+            usage = {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"],
+                     "total_tokens": usage["total_tokens"]}
+            finish = "tool_calls" if message.tool_calls else "stop"
+            base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model")}
+            if body.get("stream"):
+                self._stream(base, message, usage, finish)
+                return
+            self._json(200, {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "message": _message_dict(message), "finish_reason": finish}],
+                "usage": usage,
+            })
+
+        def _stream(self, base: dict, message, usage: dict, finish: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            deltas = [{"role": "assistant", "content": message.content or ""}]
+            for index, call in enumerate(message.tool_calls):
+                args = json.dumps(call["args"])
+                size = max(1, -(-len(args) // model.stream_chunks))
+                for n, start in enumerate(range(0, len(args), size)):
+                    tool_call = {"index": index, "function": {"arguments": args[start:start + size]}}
+                    if n == 0:
+                        tool_call.update(id=call["id"], type="function")
+                        tool_call["function"]["name"] = call["name"]
+                    deltas.append({"tool_calls": [tool_call]})
+            for delta in deltas:
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            last = {**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": finish}], "x_groq": {"usage": usage}}
+            self.wfile.write(f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_server(model: ScriptedChatModel, faults: FaultConfig, host: str = "127.0.0.1",
+                      port: int = 0) -> ThreadingHTTPServer:
+    """Serves ``model`` from a daemon thread; the bound port is ``server.server_address[1]``."""
+    server = ThreadingHTTPServer((host, port), _handler(model, faults))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions API with injected faults")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8750)
+    parser.add_argument("--files", type=int, default=5, help="Files in the scripted project")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Up to this many extra random seconds")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="Share of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.05, help="Share answered with 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of requests that hang")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    faults = FaultConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.hang_rate,
+                         args.hang_seconds, args.seed)
+    server = start_fake_server(ScriptedChatModel(n_files=args.files), faults, args.host, args.port)
+    print(f"Fake Groq API on http://{args.host}:{server.server_address[1]} (set GROQ_API_BASE to this URL)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"\n{faults.requests} requests, injected failures: {faults.failures}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Deterministic stand-in for ChatGroq used by the offline benchmarks.
+
+The model answers planner and architect calls with a synthetic project of
+``n_files`` files and answers every coder turn by writing the requested file,
+so the whole agent graph can run without network access. Streamed calls
+deliver tool call arguments in ``stream_chunks`` pieces spread over the
+call's latency, like a real model emitting tokens.
+"""
+import json
+import re
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that returns scripted structured output and tool calls."""
+
+    n_files: int = 5
+    latency: float = 0.0
+    file_size: int = 2048
+    stream_chunks: int = 20
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _plan(self) -> dict:
+        return {
+            "name": "Synthetic App",
+            "description": "A synthetic project used for benchmarking",
+            "framework": None,
+            "language": "JavaScript",
+            "techstack": "HTML, CSS, JavaScript",
+            "features": ["benchmarking"],
+            "files": [{"path": self._path(i), "purpose": "synthetic module"} for i in range(self.n_files)],
+        }
+
+    def _task_plan(self) -> dict:
+        steps = []
+        for i in range(self.n_files):
+            # Every other file depends on its predecessor, which gives the
+            # coder a realistic mix of parallel and sequential work.
+            depends_on = [self._path(i - 1)] if i % 2 else []
+            steps.append({
+                "filepath": self._path(i),
+                "task_description": f"Implement synthetic module number {i}",
+                "depends_on": depends_on,
+            })
+        return {"implementation_steps": steps}
+
+    @staticmethod
+    def _path(i: int) -> str:
+        return f"src/module_{i:04d}.js"
+
+    def _content(self, path: str) -> str:
+        line = f"export const value = {len(path)}; // {path}\n"
+        return line * max(1, self.file_size // len(line))
+
+    def _respond(self, messages: List[BaseMessage], tools: List[dict]) -> AIMessage:
+        names = {t["function"]["name"] for t in tools}
+        if "Plan" in names:
+            return AIMessage("", tool_calls=[{"name": "Plan", "args": self._plan(), "id": "call_plan"}])
+        if "TaskPlan" in names:
+            return AIMessage("", tool_calls=[{"name": "TaskPlan", "args": self._task_plan(), "id": "call_tasks"}])
+        if isinstance(messages[-1], ToolMessage):
+            return AIMessage("Done.")
+        paths = re.findall(r"^File: (\S+)$", str(messages[-1].content), flags=re.MULTILINE)
+        tool_calls = [
+            {"name": "write_file", "args": {"path": path, "content": self._content(path)}, "id": f"call_write_{n}"}
+            for n, path in enumerate(paths)
+        ]
+        return AIMessage("", tool_calls=tool_calls)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        message = self._respond(messages, kwargs.get("tools", []))
+        message.usage_metadata = self._usage(messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        message = self._respond(messages, kwargs.get("tools", []))
+        pieces = []
+        for index, call in enumerate(message.tool_calls):
+            args = json.dumps(call["args"])
+            size = max(1, -(-len(args) // self.stream_chunks))
+            for n, start in enumerate(range(0, len(args), size)):
+                pieces.append(AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": call["name"] if n == 0 else None,
+                    "args": args[start:start + size],
+                    "id": call["id"] if n == 0 else None,
+                    "index": index,
+                }]))
+        pieces = pieces or [AIMessageChunk(content=message.content)]
+        pieces[-1].usage_metadata = self._usage(messages, message)
+        for piece in pieces:
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            yield ChatGenerationChunk(message=piece)
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], message: AIMessage) -> dict:
+        # Rough 4-characters-per-token estimate so token metrics are populated.
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = (len(str(message.content)) + len(json.dumps(message.tool_calls))) // 4
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
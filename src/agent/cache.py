@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+CACHE_MODES = ("readwrite", "readonly", "bypass")
+
+warnings.filterwarnings("ignore", message="The function `loads` is in beta")
+
+# Per-message fields that change on every call without changing what the
+# model is asked, e.g. provider message ids and token accounting.
+_VOLATILE_KEYS = {"id", "response_metadata", "usage_metadata"}
+
+
+def _normalize_text(text: str) -> str:
+    lines = [line.rstrip() for line in text.strip().splitlines()]
+    return "\n".join(lines)
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        kwargs = value.get("kwargs")
+        if value.get("type") == "constructor" and isinstance(kwargs, dict):
+            kwargs = {k: v for k, v in kwargs.items() if k not in _VOLATILE_KEYS}
+            value = {**value, "kwargs": kwargs}
+        return {k: _strip_volatile(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    if isinstance(value, str):
+        return _normalize_text(value)
+    return value
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a serialized prompt, used for hashing."""
+    try:
+        data = json.loads(prompt)
+    except ValueError:
+        return _normalize_text(prompt)
+    return json.dumps(_strip_volatile(data), sort_keys=True)
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Content address of a model call.
+
+    ``llm_string`` identifies the model name and its parameters, including the
+    bound tools, so a structured-output schema is part of the key as well.
+    """
+    digest = hashlib.sha256()
+    digest.update(llm_string.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(normalize_prompt(prompt).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """Disk-backed LangChain cache for chat model responses.
+
+    Entries older than ``max_age`` seconds are treated as misses, and the least
+    recently used entries are evicted once the cache holds more than
+    ``max_entries`` rows or ``max_bytes`` of responses.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "readwrite",
+        max_entries: Optional[int] = 10_000,
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        max_age: Optional[float] = 30 * 24 * 3600,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.mode == "bypass":
+            return None
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            if self.mode == "readwrite":
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += 1
+        generations = loads(row[0])
+        for gen in generations:
+            # Lets metrics tell cached answers apart from billed ones.
+            message = getattr(gen, "message", None)
+            if message is not None:
+                message.response_metadata["cache_hit"] = True
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode != "readwrite":
+            return
+        key = cache_key(prompt, llm_string)
+        response = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response), now, now),
+            )
+            self.writes += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.max_age is not None:
+            cur = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age,))
+            self.evictions += cur.rowcount
+        if self.max_entries is not None:
+            cur = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.evictions += cur.rowcount
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+                self.evictions += len(stale)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process and the current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+def _optional_number(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return float(value) if float(value) > 0 else None
+
+
+def cache_from_env() -> Optional[SQLiteLLMCache]:
+    """Builds the LLM cache from ``LLM_CACHE_*`` environment variables.
+
+    Returns None when ``LLM_CACHE_MODE`` is ``off``.
+    """
+    mode = os.getenv("LLM_CACHE_MODE", "readwrite").lower()
+    if mode == "off":
+        return None
+    max_entries = _optional_number("LLM_CACHE_MAX_ENTRIES", 10_000)
+    max_bytes = _optional_number("LLM_CACHE_MAX_MB", 512)
+    max_age_days = _optional_number("LLM_CACHE_MAX_AGE_DAYS", 30)
+    return SQLiteLLMCache(
+        os.getenv("LLM_CACHE_PATH", str(pathlib.Path.cwd() / ".cache" / "llm_cache.sqlite3")),
+        mode=mode,
+        max_entries=int(max_entries) if max_entries is not None else None,
+        max_bytes=int(max_bytes * 1024 * 1024) if max_bytes is not None else None,
+        max_age=max_age_days * 24 * 3600 if max_age_days is not None else None,
+    )
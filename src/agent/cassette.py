@@ -0,0 +1,353 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from agent.cache import cache_key
+
+CASSETTE_MODES = ("record", "replay")
+CASSETTE_VERSION = 1
+
+# Stands in for the workspace root in a cassette, so a run recorded in one
+# directory replays in another.
+WORKSPACE_PLACEHOLDER = "<workspace>"
+
+# Call arguments that do not change what the model is asked.
+_UNKEYED_KWARGS = {"stream", "ls_structured_output_format"}
+
+# Tool call arguments are split into this many chunks when a streamed call is replayed.
+_REPLAY_CHUNKS = 20
+
+
+class CassetteMiss(LookupError):
+    """A replayed run made a model request the cassette has no response for."""
+
+
+class Cassette:
+    """Model responses and tool calls of one generation run.
+
+    In ``record`` mode every model call and tool call of the run is kept and
+    ``save()`` writes them to ``path`` as JSON lines (gzipped if the name
+    ends in ``.gz``). In ``replay`` mode model calls are answered from the
+    file without any network access; tools still run against the workspace
+    and their outputs are compared with the recorded ones.
+
+    Requests are matched on the same normalized content as the LLM cache.
+    Concurrent coder steps can see other files at other stages than during
+    the recording, so a request without an exact match falls back to a
+    recorded one with the same task and the same earlier model responses.
+    """
+
+    def __init__(self, path, mode: str = "replay", workspace_root=None):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {CASSETTE_MODES}")
+        self.path = Path(path)
+        self.mode = mode
+        self.workspace_root = str(Path(workspace_root).resolve()) if workspace_root else None
+        # User prompt of the recorded run, so a replay can ask it again.
+        self.prompt: Optional[str] = None
+        self.entries: List[dict] = []
+        self.exact = 0
+        self.approximate = 0
+        self.misses = 0
+        self.tool_calls = 0
+        self.tool_matches = 0
+        self.tool_mismatches = 0
+        self._exact: Dict[str, List[dict]] = {}
+        self._loose: Dict[str, List[dict]] = {}
+        self._tools: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+
+    def _open(self, path: Path, mode: str):
+        if self.path.suffix == ".gz":
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        return open(path, mode, encoding="utf-8")
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            raise FileNotFoundError(f"Cassette {self.path} does not exist")
+        with self._open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["type"] == "header":
+                    self.prompt = entry.get("prompt")
+                elif entry["type"] == "llm":
+                    self.entries.append(entry)
+                    self._exact.setdefault(entry["key"], []).append(entry)
+                    self._loose.setdefault(entry["loose"], []).append(entry)
+                elif entry["type"] == "tool":
+                    self.tool_calls += 1
+                    self._tools.setdefault(self._tool_key(entry["name"], entry["input"]), []).append(entry)
+
+    def save(self) -> Path:
+        """Writes a recorded cassette; the file is replaced atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with self._lock:
+            entries = list(self.entries)
+        header = {"type": "header", "version": CASSETTE_VERSION, "created": time.time(), "prompt": self.prompt}
+        with self._open(tmp, "w") as f:
+            for entry in [header] + entries:
+                f.write(json.dumps(entry, separators=(",", ":"), default=str) + "\n")
+        os.replace(tmp, self.path)
+        return self.path
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": str(self.path),
+                "llm_calls": sum(1 for e in self.entries if e["type"] == "llm"),
+                "tool_calls": self.tool_calls,
+                "exact": self.exact,
+                "approximate": self.approximate,
+                "misses": self.misses,
+                "tool_matches": self.tool_matches,
+                "tool_mismatches": self.tool_mismatches,
+            }
+
+    def _scrub(self, text: str) -> str:
+        if self.workspace_root:
+            return text.replace(self.workspace_root, WORKSPACE_PLACEHOLDER)
+        return text
+
+    def _unscrub(self, text: str) -> str:
+        if self.workspace_root:
+            return text.replace(WORKSPACE_PLACEHOLDER, self.workspace_root)
+        return text
+
+    def _keys(self, model: str, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> tuple:
+        params = json.dumps(
+            {"model": model, "stop": stop, **{k: v for k, v in kwargs.items() if k not in _UNKEYED_KWARGS}},
+            sort_keys=True, default=str,
+        )
+        key = cache_key(self._scrub(dumps(messages)), params)
+        # What stays the same whatever state the workspace was in: the task
+        # lines of each prompt, the tools called and the model's own answers.
+        loose = []
+        for m in messages:
+            if isinstance(m, (HumanMessage, SystemMessage)):
+                loose.append([m.type, "\n".join(str(m.content).splitlines()[:2])])
+            elif isinstance(m, ToolMessage):
+                loose.append([m.type, m.name])
+            else:
+                loose.append([m.type, self._scrub(str(m.content)), getattr(m, "tool_calls", None)])
+        loose_key = hashlib.sha256(
+            (params + self._scrub(json.dumps(loose, sort_keys=True, default=str))).encode("utf-8")
+        ).hexdigest()
+        return key, loose_key
+
+    def record(self, model: str, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict,
+               result: ChatResult) -> None:
+        key, loose = self._keys(model, messages, stop, kwargs)
+        entry = {
+            "type": "llm", "model": model, "key": key, "loose": loose,
+            "generations": json.loads(self._scrub(dumps(result.generations))),
+            "llm_output": result.llm_output,
+        }
+        with self._lock:
+            self.entries.append(entry)
+
+    def replay(self, model: str, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> ChatResult:
+        """The recorded response to this request; raises CassetteMiss if there is none."""
+        key, loose = self._keys(model, messages, stop, kwargs)
+        with self._lock:
+            entry = self._take(self._exact.get(key))
+            if entry is not None:
+                self.exact += 1
+            else:
+                entry = self._take(self._loose.get(loose))
+                if entry is None:
+                    self.misses += 1
+                    raise CassetteMiss(f"{self.path} has no recorded response to this {model} request")
+                self.approximate += 1
+        generations = loads(self._unscrub(json.dumps(entry["generations"])))
+        return ChatResult(generations=generations, llm_output=entry.get("llm_output"))
+
+    @staticmethod
+    def _take(candidates: Optional[List[dict]]) -> Optional[dict]:
+        """Next unused recording of a request; a request repeated more often reuses the last one."""
+        if not candidates:
+            return None
+        for entry in candidates:
+            if not entry.get("used"):
+                entry["used"] = True
+                return entry
+        return candidates[-1]
+
+    def _tool_key(self, name: str, tool_input: str) -> str:
+        return f"{name}\x00{tool_input}"
+
+    def tool_call(self, name: str, tool_input: str, output: str) -> None:
+        """Records a tool call, or checks it against the recording when replaying."""
+        tool_input, output = self._scrub(tool_input), self._scrub(output)
+        with self._lock:
+            if self.mode == "record":
+                self.tool_calls += 1
+                self.entries.append({"type": "tool", "name": name, "input": tool_input, "output": output})
+                return
+            recorded = self._take(self._tools.get(self._tool_key(name, tool_input)))
+            if recorded is not None and recorded["output"] == output:
+                self.tool_matches += 1
+            else:
+                self.tool_mismatches += 1
+                print(f"Cassette: {name} call differs from the recording: {tool_input[:200]}")
+
+    def callback_handler(self) -> "CassetteToolHandler":
+        return CassetteToolHandler(self)
+
+
+class CassetteToolHandler(BaseCallbackHandler):
+    """Passes the tool calls of a run to its cassette."""
+
+    run_inline = True
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._started: Dict[UUID, tuple] = {}
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      inputs: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        tool_input = json.dumps(inputs, sort_keys=True, default=str) if inputs is not None else input_str
+        self._started[run_id] = ((serialized or {}).get("name") or kwargs.get("name") or "tool", tool_input)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.cassette.tool_call(started[0], started[1], str(getattr(output, "content", output)))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.cassette.tool_call(started[0], started[1], f"ERROR: {type(error).__name__}: {error}")
+
+
+_active: ContextVar[Optional[Cassette]] = ContextVar("active_cassette", default=None)
+
+
+def active_cassette() -> Optional[Cassette]:
+    """Cassette selected with use_cassette in the current context, if any."""
+    return _active.get()
+
+
+@contextmanager
+def use_cassette(cassette: Optional[Cassette]) -> Iterator[Optional[Cassette]]:
+    """Records or replays the model calls made in this context with ``cassette``.
+
+    Threads started through ContextThreadPoolExecutor and asyncio tasks
+    inherit it, like use_workspace. A recorded cassette is saved on exit.
+    """
+    token = _active.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _active.reset(token)
+        if cassette is not None and cassette.mode == "record":
+            cassette.save()
+
+
+def _replay_chunks(result: ChatResult) -> List[ChatGenerationChunk]:
+    """The recorded message split into stream chunks, tool call arguments included."""
+    message = result.generations[0].message
+    pieces = []
+    for index, call in enumerate(getattr(message, "tool_calls", None) or []):
+        args = json.dumps(call["args"])
+        size = max(1, -(-len(args) // _REPLAY_CHUNKS))
+        for n, start in enumerate(range(0, len(args), size)):
+            pieces.append(AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"] if n == 0 else None,
+                "args": args[start:start + size],
+                "id": call["id"] if n == 0 else None,
+                "index": index,
+            }]))
+    return [ChatGenerationChunk(message=piece) for piece in pieces or [AIMessageChunk(content=message.content)]]
+
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model that records the calls of ``inner`` to, or replays them from, the active cassette.
+
+    Without a cassette it simply calls ``inner``. Replayed calls never reach
+    ``inner``, so neither the network, the LLM cache nor the rate limiter
+    are involved; streamed calls still report their tokens.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    model_name: str = ""
+    cache: Any = False
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cassette = active_cassette()
+        if cassette is not None and cassette.mode == "replay":
+            result = cassette.replay(self.model_name, messages, stop, kwargs)
+            if kwargs.get("stream") and run_manager is not None:
+                for chunk in _replay_chunks(result):
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            return result
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if cassette is not None:
+            cassette.record(self.model_name, messages, stop, kwargs, result)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cassette = active_cassette()
+        if cassette is not None and cassette.mode == "replay":
+            result = cassette.replay(self.model_name, messages, stop, kwargs)
+            if kwargs.get("stream") and run_manager is not None:
+                for chunk in _replay_chunks(result):
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            return result
+        result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if cassette is not None:
+            cassette.record(self.model_name, messages, stop, kwargs, result)
+        return result
+
+
+def recorded(model: BaseChatModel, name: str, callbacks: Optional[list] = None) -> CassetteChatModel:
+    """Wraps ``model`` so its calls can be recorded and replayed.
+
+    ``model`` is called without its own callbacks, so they belong here.
+    """
+    return CassetteChatModel(inner=model, model_name=name, callbacks=callbacks)
@@ -0,0 +1,107 @@
+import os
+import posixpath
+import re
+from typing import Dict, List, Set
+
+from tools.symbols import FileSymbols, summarize_symbols
+
+# Files up to this many characters are sent to the coder in full; larger
+# ones only as the regions relevant to the task.
+CODER_FULL_FILE_CHARS = int(os.getenv("CODER_FULL_FILE_CHARS", "6000"))
+
+# Size of the project symbol summary in every coder prompt (0 disables it).
+CODER_SYMBOLS_CHARS = int(os.getenv("CODER_SYMBOLS_CHARS", "3000"))
+
+# Lines of context kept around every relevant line of a large file.
+_CONTEXT_LINES = 3
+# Lines always kept from the top of a large file (imports, doctype, ...).
+_HEAD_LINES = 10
+
+_STOPWORDS = {
+    "that", "this", "with", "from", "into", "when", "then", "than", "them", "they",
+    "have", "will", "should", "must", "each", "file", "files", "make", "sure",
+    "using", "used", "uses", "also", "both", "only", "more", "such", "like",
+    "create", "implement", "update", "add", "code", "which", "where", "their",
+}
+
+
+def task_keywords(task_description: str) -> Set[str]:
+    """Identifiers and significant words mentioned in a task description."""
+    words = re.findall(r"[A-Za-z_$][\w$-]{3,}", task_description)
+    return {w.lower() for w in words if w.lower() not in _STOPWORDS}
+
+
+def relevant_regions(content: str, task_description: str, max_chars: int = CODER_FULL_FILE_CHARS) -> str:
+    """Returns the parts of ``content`` that relate to a task, with line numbers.
+
+    Keeps the head of the file and a window around every line that mentions
+    a keyword of the task, most relevant lines first, until ``max_chars`` is
+    used up. Skipped lines are marked with ``...``.
+    """
+    lines = content.splitlines()
+    keywords = task_keywords(task_description)
+
+    scored = []
+    for i, line in enumerate(lines):
+        tokens = {t.lower() for t in re.findall(r"[A-Za-z_$][\w$-]*", line)}
+        score = len(tokens & keywords)
+        if score:
+            scored.append((-score, i))
+    scored.sort()
+
+    keep: Set[int] = set(range(min(_HEAD_LINES, len(lines))))
+    used = sum(len(lines[i]) + 8 for i in keep)
+    for _, i in scored:
+        window = range(max(0, i - _CONTEXT_LINES), min(len(lines), i + _CONTEXT_LINES + 1))
+        cost = sum(len(lines[j]) + 8 for j in window if j not in keep)
+        if used + cost > max_chars:
+            continue
+        keep.update(window)
+        used += cost
+
+    out: List[str] = []
+    previous = -1
+    for i in sorted(keep):
+        if i != previous + 1:
+            out.append("...")
+        out.append(f"{i + 1:5d}| {lines[i]}")
+        previous = i
+    if previous != len(lines) - 1:
+        out.append("...")
+    return "\n".join(out)
+
+
+def existing_content_section(content: str, task_description: str) -> str:
+    """Existing-file section of a coder prompt, trimmed for large files."""
+    if len(content) <= CODER_FULL_FILE_CHARS:
+        return f"Existing content:\n{content}\n"
+    return (
+        f"Existing content ({len(content.splitlines())} lines, only the regions relevant "
+        "to this task are shown with line numbers; use read_file if you need more):\n"
+        f"{relevant_regions(content, task_description)}\n"
+        "Change this file with edit_file(path, edits) search/replace hunks instead of rewriting it. "
+        "Search text must match the file exactly, without the line-number prefixes.\n"
+    )
+
+
+def project_symbols_section(symbols: Dict[str, FileSymbols], filepath: str, task_description: str,
+                            depends_on: List[str]) -> str:
+    """Symbols of the other project files, so the coder can match names without reading them.
+
+    Dependencies of the task and files it mentions are listed first; the
+    summary is cut to CODER_SYMBOLS_CHARS.
+    """
+    filepath = posixpath.normpath(filepath)
+    others = {path: s for path, s in symbols.items() if path != filepath}
+    if not others or CODER_SYMBOLS_CHARS <= 0:
+        return ""
+    mentioned = [p for p in sorted(others) if posixpath.basename(p) in task_description]
+    priority = [posixpath.normpath(p) for p in depends_on] + mentioned
+    summary = summarize_symbols(others, priority, CODER_SYMBOLS_CHARS)
+    if not summary:
+        return ""
+    return (
+        "Symbols already defined in other project files (use these exact names; "
+        "read_file is only needed for details not listed here):\n"
+        f"{summary}\n"
+    )
@@ -1,101 +1,914 @@
-from dotenv import load_dotenv
-from langchain.globals import set_verbose, set_debug
-from langchain_groq.chat_models import ChatGroq
+import asyncio
+import os
+import pathlib
+import posixpath
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import wait
+from typing import List, Optional
+
+if __name__ == "__main__":
+    # Run as a script: .env must be loaded before the modules below read their settings
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import ContextThreadPoolExecutor, merge_configs
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.constants import END
+from langgraph.errors import GraphRecursionError
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import create_react_agent
 from prompts.prompt import planner_prompt, architect_prompt, coder_system_prompt
-from agent.states import Plan, TaskPlan, CoderState
-from tools.tools import write_file, read_file, get_current_directory, list_files
+from agent.cache import cache_from_env
+from agent.cassette import active_cassette, recorded
+from agent.context import existing_content_section, project_symbols_section
+from agent.incremental import Manifest, diff_plans, kept_steps, load_manifest, save_manifest
+from agent.metrics import metrics_for, pop_run_metrics
+from agent.plan_store import plan_store_from_env
+from agent.rate_limit import TokenUsageCallbackHandler, get_rate_limiter
+from agent.resilience import CallPolicy, resilient
+from agent.router import router_from_env, validate_output
+from agent.speculative import SpeculativeCoder, TaskStreamHandler
+from agent.states import AgentState, Plan, TaskPlan, CoderState, ImplementationTask
+from tools.tools import (
+    write_file, edit_file, read_file, get_current_directory, list_files, emit_event, current_workspace, PROJECT_ROOT,
+)
+from tools.workspace import Workspace, get_workspace, use_workspace
 
-_ = load_dotenv()
+# Every planner, architect and coder call goes through the LLM cache (see
+# agent/cache.py for the LLM_CACHE_* settings), and planned prompts are kept
+# in the plan store (agent/plan_store.py). Both open their databases on first
+# use, in get_llm_cache() and get_plan_store(); assigning one here replaces it.
+_NOT_BUILT = object()
+llm_cache = _NOT_BUILT
+plan_store = _NOT_BUILT
+_stores_lock = threading.Lock()
 
-set_debug(True)
-set_verbose(True)
 
-llm = ChatGroq(model="openai/gpt-oss-120b")
+def get_llm_cache():
+    """The LLM cache of the process, or None when LLM_CACHE_MODE is off."""
+    global llm_cache
+    with _stores_lock:
+        if llm_cache is _NOT_BUILT:
+            llm_cache = cache_from_env()
+        return llm_cache
 
 
-def planner_agent(state: dict) -> dict:
-    """Converts user prompt into a structured Plan."""
-    user_prompt = state["user_prompt"]
-    resp = llm.with_structured_output(Plan).invoke(
-        planner_prompt(user_prompt)
+def get_plan_store():
+    """The plan store of the process, or None when PLAN_STORE_MODE is off."""
+    global plan_store
+    with _stores_lock:
+        if plan_store is _NOT_BUILT:
+            plan_store = plan_store_from_env()
+        return plan_store
+
+# One limiter per provider is shared by every sync and async call of the
+# process, see agent/rate_limit.py for the GROQ_*_PER_MINUTE budgets.
+rate_limiter = get_rate_limiter("groq")
+
+# Picks the model of every planner, architect and coder step, see
+# agent/router.py for the rules and ROUTER_RULES to change them.
+router = router_from_env()
+
+
+# Deadlines, retries, hedging and circuit breaking of every model call, see
+# agent/resilience.py for the LLM_* settings.
+call_policy = CallPolicy.from_env()
+
+
+def make_llm(model: str):
+    """ChatGroq for ``model``, called through the resilient call layer.
+
+    A run with a cassette (see agent/cassette.py) records these calls or
+    answers them from the cassette instead.
+    """
+    # The Groq client is the slowest import of the process, so it waits for the first model
+    from langchain_groq.chat_models import ChatGroq
+
+    chat = ChatGroq(
+        model=model,
+        cache=get_llm_cache(),
+        rate_limiter=rate_limiter,
+        # Retries belong to the call layer; the client timeout ends attempts it gave up on
+        max_retries=0,
+        timeout=call_policy.timeout or None,
     )
+    return recorded(resilient(chat, model, policy=call_policy), model,
+                    callbacks=[TokenUsageCallbackHandler(rate_limiter)])
+
+
+# Model of the default route, built by default_llm() on first use like the
+# models of the other routes. Assigning a model here replaces it.
+llm = None
+_route_llms = {}
+_route_llms_lock = threading.Lock()
+
+# Upper bound on implementation steps coded at the same time; a run can
+# override it with the ``max_concurrency`` key of its RunnableConfig.
+CODER_MAX_CONCURRENCY = int(os.getenv("CODER_MAX_CONCURRENCY", "4"))
+
+# Start coding steps while the architect is still streaming the TaskPlan.
+SPECULATIVE_CODING = os.getenv("SPECULATIVE_CODING", "1").lower() not in ("0", "false", "no", "off")
+
+# Small ready steps are coded together, several files in one react
+# conversation, as long as their estimated output fits this many tokens
+# (0 codes every step on its own).
+CODER_BATCH_TOKENS = int(os.getenv("CODER_BATCH_TOKENS", "4000"))
+_MAX_FILES_PER_GROUP = 8
+
+# Typical completion tokens of a new file by extension (or name); others
+# count as _DEFAULT_FILE_TOKENS.
+_TYPICAL_FILE_TOKENS = {
+    ".json": 300, ".yml": 300, ".yaml": 300, ".toml": 300, ".ini": 150, ".cfg": 150, ".env": 100,
+    ".txt": 200, ".md": 600, ".gitignore": 100, ".svg": 500, ".css": 900, ".scss": 900,
+}
+_DEFAULT_FILE_TOKENS = 1500
+
+# Supersteps of the react conversation of one coder step (a model turn and
+# its tool calls take two); a step that loops on tool calls fails after that.
+CODER_REACT_RECURSION_LIMIT = int(os.getenv("CODER_REACT_RECURSION_LIMIT", "50"))
+
+# recursion_limit of runs that leave it to the plan: the coder stops itself
+# after the supersteps its plan needs (see coder_supersteps).
+RECURSION_LIMIT_CEILING = 10_000
+
+
+def with_callback(config: RunnableConfig, handler) -> RunnableConfig:
+    """Node config with an extra callback handler for nested calls."""
+    return merge_configs(config, {"callbacks": [handler]})
+
+
+def default_llm():
+    """Model of the default route, the module-level ``llm``."""
+    global llm
+    with _route_llms_lock:
+        if llm is None:
+            llm = make_llm(router.model(router.default))
+        return llm
+
+
+def route_llm(route: str):
+    """Chat model of ``route``; the default route's model is the module-level ``llm``."""
+    model = router.model(route)
+    if model == router.model(router.default):
+        return default_llm()
+    with _route_llms_lock:
+        if model not in _route_llms:
+            _route_llms[model] = make_llm(model)
+        return _route_llms[model]
+
+
+def set_route(handler, route: str) -> None:
+    """Labels a metrics span with its route, so latency and cost are reported per route."""
+    r = router.routes[route]
+    handler.span.route, handler.span.model, handler.span.prices = r.name, r.model, (r.input_cost, r.output_cost)
+
+
+def report_fallback(node: str, route: str, problem: str) -> None:
+    print(f"{node}: output of the {route} route rejected ({problem}), retrying on {router.fallback}")
+    emit_event({"event": "route_fallback", "node": node, "route": route, "fallback": router.fallback,
+                "reason": problem})
+
+
+def structured_call(node: str, schema, prompt: str, config: RunnableConfig, **kwargs):
+    """Asks the model routed to ``node`` for a ``schema`` response.
+
+    An error or empty response on any route but the fallback is retried on
+    the fallback route; each attempt is measured as its own span. Extra
+    keyword arguments are passed to the model call.
+    """
+    route = router.for_node(node)
+    while True:
+        with metrics_for(config).span(node) as handler:
+            set_route(handler, route)
+            try:
+                resp = route_llm(route).with_structured_output(schema).invoke(
+                    prompt, with_callback(config, handler), **kwargs
+                )
+            except Exception as e:
+                if route == router.fallback:
+                    raise
+                resp = None
+                handler.span.validation_error = f"{type(e).__name__}: {e}"
+            else:
+                if resp is None:
+                    handler.span.validation_error = "no valid response"
+        if resp is not None or route == router.fallback:
+            return resp
+        report_fallback(node, route, handler.span.validation_error)
+        route = router.fallback
+
+
+async def astructured_call(node: str, schema, prompt: str, config: RunnableConfig, **kwargs):
+    """Async variant of structured_call."""
+    route = router.for_node(node)
+    while True:
+        with metrics_for(config).span(node) as handler:
+            set_route(handler, route)
+            try:
+                resp = await route_llm(route).with_structured_output(schema).ainvoke(
+                    prompt, with_callback(config, handler), **kwargs
+                )
+            except Exception as e:
+                if route == router.fallback:
+                    raise
+                resp = None
+                handler.span.validation_error = f"{type(e).__name__}: {e}"
+            else:
+                if resp is None:
+                    handler.span.validation_error = "no valid response"
+        if resp is not None or route == router.fallback:
+            return resp
+        report_fallback(node, route, handler.span.validation_error)
+        route = router.fallback
+
+
+def model_name() -> str:
+    """Identifies the model, so stored plans are only reused for the model that made them."""
+    model = default_llm()
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+def reuse_plans(user_prompt: str) -> Optional[dict]:
+    """Plan and TaskPlan of a near-duplicate earlier prompt, if the plan store has one.
+
+    Runs with a cassette always plan, so a replay does not depend on the store.
+    """
+    store = get_plan_store()
+    if store is None or active_cassette() is not None:
+        return None
+    match = store.lookup(user_prompt, model_name())
+    if match is None:
+        return None
+    print(f"Reusing the plans of a similar prompt (similarity {match.similarity:.2f}): {match.prompt!r}")
+    emit_event({"event": "plan_reused", "prompt": match.prompt, "similarity": match.similarity,
+                "saved_seconds": match.seconds})
+    match.task_plan.plan = match.plan
+    return {"plan": match.plan, "task_plan": match.task_plan}
+
+
+def store_plans(state: dict, task_plan: TaskPlan, config: RunnableConfig) -> None:
+    """Keeps the plans of this prompt for near-duplicate prompts to come."""
+    store = get_plan_store()
+    if store is None:
+        return
+    summary = metrics_for(config).summary()
+    seconds = sum(summary.get(node, {}).get("wall_time", 0.0) for node in ("planner", "architect"))
+    store.add(state["user_prompt"], model_name(), state["plan"], task_plan, seconds)
+
+
+def previous_generation(state: dict) -> Optional[Manifest]:
+    """Manifest of the last generation in the run's workspace, for runs that update it.
+
+    Only runs with ``incremental`` set in the graph input update a workspace;
+    others plan from scratch even if the workspace holds an earlier project.
+    """
+    if not state.get("incremental"):
+        return None
+    return load_manifest(workspace_for(state).root)
+
+
+def _plans_before(state: dict) -> tuple:
+    """Plans of the previous generation when the prompt is the same, else its plan for the planner prompt.
+
+    With a previous generation the plan store is not asked: a similar prompt
+    would bring back the old plans and leave the change out.
+    """
+    user_prompt = state["user_prompt"]
+    previous = previous_generation(state)
+    if previous is None:
+        return reuse_plans(user_prompt), None
+    if previous.prompt == user_prompt:
+        print("Same prompt as the last generation in this workspace, reusing its plans")
+        previous.task_plan.plan = previous.plan
+        return {"plan": previous.plan, "task_plan": previous.task_plan}, None
+    return None, previous.plan.model_dump_json()
+
+
+def planner_agent(state: dict, config: RunnableConfig) -> dict:
+    """Converts user prompt into a structured Plan.
+
+    A near-duplicate of an earlier prompt reuses its Plan and TaskPlan, so
+    neither the planner nor the architect model is called. In a workspace
+    with an earlier generation the planner sees the old plan and is asked
+    to change only what the prompt needs.
+    """
+    reused, previous_plan = _plans_before(state)
+    if reused is not None:
+        return reused
+    resp = structured_call("planner", Plan, planner_prompt(state["user_prompt"], previous_plan), config)
+    if resp is None:
+        raise ValueError("Planner did not return a valid response.")
+    return {"plan": resp}
+
+
+async def aplanner_agent(state: dict, config: RunnableConfig) -> dict:
+    """Async variant of planner_agent."""
+    reused, previous_plan = _plans_before(state)
+    if reused is not None:
+        return reused
+    resp = await astructured_call("planner", Plan, planner_prompt(state["user_prompt"], previous_plan), config)
     if resp is None:
         raise ValueError("Planner did not return a valid response.")
     return {"plan": resp}
 
 
-def architect_agent(state: dict) -> dict:
-    """Creates TaskPlan from Plan."""
+def _architect_prompt(state: dict) -> tuple:
+    """Architect prompt of the run, and whether the workspace holds an earlier generation."""
+    previous = previous_generation(state)
+    previous_task_plan = previous.task_plan.model_dump_json() if previous is not None else None
+    return architect_prompt(state["plan"].model_dump_json(), previous_task_plan), previous is not None
+
+
+def architect_agent(state: dict, config: RunnableConfig) -> dict:
+    """Creates TaskPlan from Plan.
+
+    With SPECULATIVE_CODING the TaskPlan is streamed, and steps whose
+    dependencies are done are coded as soon as they have been streamed.
+    Regenerations are not streamed: which files change is only known once
+    the whole plan has been compared with the previous one.
+    """
+    if state.get("task_plan") is not None:
+        # Reused by the planner
+        return {}
     plan: Plan = state["plan"]
-    resp = llm.with_structured_output(TaskPlan).invoke(
-        architect_prompt(plan=plan.model_dump_json())
-    )
+    prompt, regenerating = _architect_prompt(state)
+    if not SPECULATIVE_CODING or regenerating:
+        resp = structured_call("architect", TaskPlan, prompt, config)
+        return _architect_result(state, plan, resp, config)
+
+    with use_workspace(workspace_for(state, config)), ContextThreadPoolExecutor(
+        max_workers=_max_concurrency(config)
+    ) as executor:
+        futures = []
+
+        def start(idx: int, task: ImplementationTask) -> None:
+            future = executor.submit(run_coder_step, task, idx, config)
+            futures.append(future)
+            future.add_done_callback(lambda f: speculative.done(idx, f.exception() is None))
+
+        speculative = SpeculativeCoder(start, _max_concurrency(config))
+        try:
+            resp = structured_call(
+                "architect", TaskPlan, prompt, with_callback(config, TaskStreamHandler(speculative.add)), stream=True
+            )
+        finally:
+            speculative.close()
+            # Steps already running finish before the node returns; failed
+            # ones are not completed, so the coder node tries them again
+            wait(futures)
+        return _architect_result(state, plan, resp, config, speculative)
+
+
+async def aarchitect_agent(state: dict, config: RunnableConfig) -> dict:
+    """Async variant of architect_agent, coding streamed steps on the event loop."""
+    if state.get("task_plan") is not None:
+        return {}
+    plan: Plan = state["plan"]
+    prompt, regenerating = _architect_prompt(state)
+    if not SPECULATIVE_CODING or regenerating:
+        resp = await astructured_call("architect", TaskPlan, prompt, config)
+        return _architect_result(state, plan, resp, config)
+
+    with use_workspace(workspace_for(state, config)):
+        loop = asyncio.get_running_loop()
+        tasks = []
+
+        def start(idx: int, task: ImplementationTask) -> None:
+            step = loop.create_task(arun_coder_step(task, idx, config))
+            tasks.append(step)
+            step.add_done_callback(lambda t: speculative.done(idx, not t.cancelled() and t.exception() is None))
+
+        speculative = SpeculativeCoder(start, _max_concurrency(config))
+        try:
+            resp = await astructured_call(
+                "architect", TaskPlan, prompt, with_callback(config, TaskStreamHandler(speculative.add)), stream=True
+            )
+        finally:
+            speculative.close()
+            # Steps started by a done callback may be added while waiting
+            while not all(step.done() for step in tasks):
+                await asyncio.gather(*tasks, return_exceptions=True)
+        return _architect_result(state, plan, resp, config, speculative)
+
+
+def _architect_result(state: dict, plan: Plan, resp: Optional[TaskPlan], config: RunnableConfig,
+                      speculative: Optional[SpeculativeCoder] = None) -> dict:
     if resp is None:
         raise ValueError("Architect did not return a valid response.")
 
     resp.plan = plan
     print(resp.model_dump_json())
-    return {"task_plan": resp}
+    store_plans(state, resp, config)
+    done = speculative.completed_steps(resp) if speculative is not None else []
+    if not done:
+        return {"task_plan": resp}
+    print(f"Coded {len(done)} of {len(resp.implementation_steps)} steps while the architect was streaming")
+    return {"task_plan": resp, **_complete_batch(state, new_coder_state(resp, config), done)}
 
 
-def coder_agent(state: dict) -> dict:
-    """LangGraph tool-using coder agent."""
-    coder_state: CoderState = state.get("coder_state")
-    if coder_state is None:
-        coder_state = CoderState(task_plan=state["task_plan"], current_step_idx=0)
+# Only provide the exact tools we have
+CODER_TOOLS = [write_file, edit_file, read_file, list_files, get_current_directory]
 
-    steps = coder_state.task_plan.implementation_steps
-    if coder_state.current_step_idx >= len(steps):
-        return {"coder_state": coder_state, "status": "DONE"}
+_coder_agent_lock = threading.Lock()
+_coder_agents = {}
+
+
+def get_coder_agent(model=None):
+    """Returns the react coder agent of ``model`` (default ``llm``), compiling it on first use.
+
+    The compiled subgraph holds no per-run state, so a single instance per
+    model is shared by every step, thread and session of the process. It
+    is rebuilt only when the model object has been replaced.
+    """
+    model = model or default_llm()
+    with _coder_agent_lock:
+        cached = _coder_agents.get(id(model))
+        if cached is None or cached[0] is not model:
+            # checkpointer=False: steps run in parallel inside one coder node,
+            # and only the outer graph's supersteps need to be resumable.
+            react_agent = create_react_agent(
+                model, CODER_TOOLS, prompt=coder_system_prompt(), checkpointer=False
+            )
+            cached = _coder_agents[id(model)] = (model, react_agent)
+        return cached[1]
+
+
+def step_graph(task_plan: TaskPlan) -> List[List[int]]:
+    """Steps each step waits for, built once per plan in O(steps + dependencies).
+
+    A step waits for the previous step of its own file and for the last step
+    of every file it depends on. Steps of a file run in plan order, so the
+    last one completing means the file is done.
+    """
+    steps = task_plan.implementation_steps
+    if task_plan._step_graph is not None and len(task_plan._step_graph) == len(steps):
+        return task_plan._step_graph
+    last = {}
+    for i, task in enumerate(steps):
+        last[task.filepath] = i
+    previous = {}
+    predecessors = []
+    for i, task in enumerate(steps):
+        waits = {last[path] for path in task.depends_on if path != task.filepath and path in last}
+        if task.filepath in previous:
+            waits.add(previous[task.filepath])
+        previous[task.filepath] = i
+        predecessors.append(sorted(waits))
+    task_plan._step_graph = predecessors
+    return predecessors
+
+
+def ready_steps(coder_state: CoderState) -> List[int]:
+    """Returns the indices of pending steps whose dependencies are all completed."""
+    predecessors = step_graph(coder_state.task_plan)
+    completed = set(coder_state.completed_steps)
+    pending = [i for i in range(len(predecessors)) if i not in completed]
+    ready = [i for i in pending if all(j in completed for j in predecessors[i])]
+
+    # A dependency cycle (or a step depending on a later one) would stall
+    # the plan forever, so fall back to plan order.
+    if not ready and pending:
+        ready = [pending[0]]
+    return ready
+
+
+def estimate_task_tokens(task: ImplementationTask) -> int:
+    """Rough completion tokens of a step: a typical file of its type, plus the file it rewrites."""
+    name = posixpath.basename(task.filepath)
+    tokens = _TYPICAL_FILE_TOKENS.get(posixpath.splitext(name)[1]) or _TYPICAL_FILE_TOKENS.get(name)
+    try:
+        entry = current_workspace().stat(task.filepath)
+    except ValueError:
+        entry = None
+    return (tokens or _DEFAULT_FILE_TOKENS) + (entry.size // 4 if entry else 0)
+
+
+def group_steps(steps: List[ImplementationTask], ready: List[int]) -> List[List[int]]:
+    """Packs ready steps into the units the coder runs, in plan order.
+
+    Steps estimated at up to half of CODER_BATCH_TOKENS are grouped with
+    other small steps of the same directory and route until the group's
+    estimate reaches the budget; larger steps are a unit of their own.
+    """
+    if CODER_BATCH_TOKENS <= 0:
+        return [[i] for i in ready]
+    units = []
+    open_groups = {}
+    for i in ready:
+        tokens = estimate_task_tokens(steps[i])
+        if tokens > CODER_BATCH_TOKENS // 2:
+            units.append([i])
+            continue
+        key = (route_for_task(steps[i]), posixpath.dirname(steps[i].filepath))
+        group = open_groups.get(key)
+        if (group is None or group["tokens"] + tokens > CODER_BATCH_TOKENS
+                or len(group["steps"]) >= _MAX_FILES_PER_GROUP):
+            group = open_groups[key] = {"steps": [], "tokens": 0}
+            units.append(group["steps"])
+        group["steps"].append(i)
+        group["tokens"] += tokens
+    return units
+
+
+def coder_supersteps(task_plan: TaskPlan, max_concurrency: int) -> int:
+    """Coder supersteps the plan takes if every step succeeds on its first run.
 
-    current_task = steps[coder_state.current_step_idx]
-    
+    Steps are split into dependency levels in one topological pass; each
+    level is packed with group_steps and takes one superstep per
+    ``max_concurrency`` units.
+    """
+    steps = task_plan.implementation_steps
+    predecessors = step_graph(task_plan)
+    successors = [[] for _ in steps]
+    waiting = [len(p) for p in predecessors]
+    for i, preds in enumerate(predecessors):
+        for j in preds:
+            successors[j].append(i)
+    level = [i for i in range(len(steps)) if not waiting[i]]
+    done = [False] * len(steps)
+    remaining = len(steps)
+    supersteps = 0
+    while remaining:
+        if not level:
+            # A dependency cycle: like ready_steps, continue in plan order
+            level = [next(i for i in range(len(steps)) if not done[i])]
+        units = len(group_steps(steps, level))
+        supersteps += -(-units // max(1, max_concurrency))
+        next_level = []
+        for i in level:
+            done[i] = True
+            remaining -= 1
+            for k in successors[i]:
+                waiting[k] -= 1
+                if waiting[k] == 0 and not done[k]:
+                    next_level.append(k)
+        level = sorted(next_level)
+    return supersteps
+
+
+def new_coder_state(task_plan: TaskPlan, config: RunnableConfig) -> CoderState:
+    """Coder state of a fresh plan, with the supersteps the plan may take.
+
+    Twice the supersteps of a run without failures, plus two, leaves room
+    for steps that fail validation and for files that grow during the run.
+    """
+    expected = coder_supersteps(task_plan, _max_concurrency(config))
+    return CoderState(task_plan=task_plan, current_step_idx=0, max_supersteps=2 * expected + 2)
+
+
+def coder_user_prompt(current_task: ImplementationTask) -> str:
+    """Builds the user message of the react coder for a single task."""
     # Read existing content if file exists
     try:
         existing_content = read_file.run(current_task.filepath)
     except:
         existing_content = ""
 
-    system_prompt = coder_system_prompt()
-    user_prompt = (
+    symbols = project_symbols_section(
+        current_workspace().symbols(), current_task.filepath, current_task.task_description, current_task.depends_on
+    )
+
+    return (
         f"Task: {current_task.task_description}\n"
         f"File: {current_task.filepath}\n"
-        f"Existing content:\n{existing_content}\n\n"
-        "Use write_file(path, content) to save your changes.\n"
+        f"{existing_content_section(existing_content, current_task.task_description)}\n"
+        f"{symbols}"
+        "Use write_file(path, content) for new files and edit_file(path, edits) to change existing ones.\n"
+        "Make sure to write complete, working code."
+    )
+
+
+def coder_group_prompt(tasks: List[ImplementationTask]) -> str:
+    """Builds the user message of the react coder for several small tasks."""
+    sections = []
+    for n, task in enumerate(tasks, start=1):
+        existing_content = current_workspace().read(task.filepath) or ""
+        sections.append(
+            f"{n}. Task: {task.task_description}\n"
+            f"File: {task.filepath}\n"
+            f"{existing_content_section(existing_content, task.task_description)}"
+        )
+    symbols = project_symbols_section(
+        current_workspace().symbols(), tasks[0].filepath, "\n".join(t.task_description for t in tasks),
+        [path for t in tasks for path in t.depends_on],
+    )
+    return (
+        f"Implement these {len(tasks)} files. Each file needs its own write_file or edit_file call; "
+        "do all of them before you stop.\n\n"
+        + "\n".join(sections) + "\n"
+        f"{symbols}"
+        "Use write_file(path, content) for new files and edit_file(path, edits) to change existing ones.\n"
         "Make sure to write complete, working code."
     )
 
-    # Only provide the exact tools we have
-    coder_tools = [write_file, read_file, list_files, get_current_directory]
-    
-    # Create react agent - the system prompt will be in the messages
-    react_agent = create_react_agent(llm, coder_tools)
 
+def _coder_messages(tasks: List[ImplementationTask]) -> dict:
+    prompt = coder_user_prompt(tasks[0]) if len(tasks) == 1 else coder_group_prompt(tasks)
+    return {"messages": [{"role": "user", "content": prompt}]}
+
+
+def _react_config(config: Optional[RunnableConfig]) -> RunnableConfig:
+    """Config of a react conversation: the outer graph's limit is for supersteps of the plan, not tool calls."""
+    return {**(config or {}), "recursion_limit": CODER_REACT_RECURSION_LIMIT}
+
+
+def run_coder_task(current_task, config: Optional[RunnableConfig] = None, model=None) -> Optional[str]:
+    """Runs the react coder agent for an implementation task, or a list of them; returns its error, if any."""
+    tasks = current_task if isinstance(current_task, list) else [current_task]
+    try:
+        get_coder_agent(model).invoke(_coder_messages(tasks), _react_config(config))
+    except Exception as e:
+        print(f"Error in coder agent ({', '.join(t.filepath for t in tasks)}): {e}")
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+async def arun_coder_task(current_task, config: Optional[RunnableConfig] = None, model=None) -> Optional[str]:
+    """Async variant of run_coder_task."""
+    tasks = current_task if isinstance(current_task, list) else [current_task]
     try:
-        # Invoke the agent with system and user messages
-        react_agent.invoke({
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        })
+        await get_coder_agent(model).ainvoke(_coder_messages(tasks), _react_config(config))
     except Exception as e:
-        print(f"Error in coder agent: {e}")
-        # Still increment to avoid infinite loop
-        pass
+        print(f"Error in coder agent ({', '.join(t.filepath for t in tasks)}): {e}")
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def route_for_task(task: ImplementationTask) -> str:
+    """Route of a coder step, given its task and the size of the file it changes."""
+    try:
+        entry = current_workspace().stat(task.filepath)
+    except ValueError:
+        entry = None
+    return router.for_task(task, entry.size if entry else 0)
+
+
+class CoderStepError(RuntimeError):
+    """A coder step failed on every route it was tried on."""
+
+
+def check_step(handler, task: ImplementationTask, error: Optional[str]) -> Optional[str]:
+    """Validates the file a coder step wrote and records the problem on its span."""
+    try:
+        problem = error or validate_output(task.filepath, current_workspace().read(task.filepath))
+    except ValueError as e:
+        problem = str(e)
+    handler.span.validation_error = problem
+    return problem
+
+
+def run_coder_step(task: ImplementationTask, idx: int, config: RunnableConfig) -> None:
+    """Runs one implementation step and reports it on the custom stream.
+
+    Output of a route other than the fallback that fails validation is
+    redone on the fallback route; if that fails too, CoderStepError is raised.
+    """
+    emit_event({"event": "step_started", "step": idx, "filepath": task.filepath})
+    route = route_for_task(task)
+    while True:
+        with metrics_for(config).span("coder", step=idx, filepath=task.filepath) as handler:
+            set_route(handler, route)
+            error = run_coder_task(task, with_callback(config, handler), route_llm(route))
+            problem = check_step(handler, task, error)
+        if problem is None or route == router.fallback:
+            break
+        report_fallback("coder", route, problem)
+        route = router.fallback
+    if problem is not None:
+        emit_event({"event": "step_failed", "step": idx, "filepath": task.filepath, "error": problem})
+        raise CoderStepError(f"step {idx} ({task.filepath}) failed: {problem}")
+    emit_event({"event": "step_completed", "step": idx, "filepath": task.filepath})
+
+
+async def arun_coder_step(task: ImplementationTask, idx: int, config: RunnableConfig) -> None:
+    """Async variant of run_coder_step."""
+    emit_event({"event": "step_started", "step": idx, "filepath": task.filepath})
+    route = route_for_task(task)
+    while True:
+        with metrics_for(config).span("coder", step=idx, filepath=task.filepath) as handler:
+            set_route(handler, route)
+            error = await arun_coder_task(task, with_callback(config, handler), route_llm(route))
+            problem = check_step(handler, task, error)
+        if problem is None or route == router.fallback:
+            break
+        report_fallback("coder", route, problem)
+        route = router.fallback
+    if problem is not None:
+        emit_event({"event": "step_failed", "step": idx, "filepath": task.filepath, "error": problem})
+        raise CoderStepError(f"step {idx} ({task.filepath}) failed: {problem}")
+    emit_event({"event": "step_completed", "step": idx, "filepath": task.filepath})
+
+
+def _group_problems(handler, tasks: List[ImplementationTask], error: Optional[str]) -> List[Optional[str]]:
+    """Validates every file of a group step; the span records the problems found."""
+    problems = []
+    for task in tasks:
+        try:
+            problems.append(validate_output(task.filepath, current_workspace().read(task.filepath)))
+        except ValueError as e:
+            problems.append(str(e))
+    found = [p for p in problems if p]
+    handler.span.validation_error = error or ("; ".join(found) if found else None)
+    return problems
+
+
+def run_coder_group(tasks: List[ImplementationTask], idxs: List[int], config: RunnableConfig) -> None:
+    """Implements several small steps in one react conversation.
+
+    The steps of a group share a route. Steps whose file is missing or
+    invalid afterwards are redone one at a time with run_coder_step.
+    """
+    for idx, task in zip(idxs, tasks):
+        emit_event({"event": "step_started", "step": idx, "filepath": task.filepath})
+    route = route_for_task(tasks[0])
+    with metrics_for(config).span("coder", step=idxs[0], filepath=", ".join(t.filepath for t in tasks)) as handler:
+        set_route(handler, route)
+        error = run_coder_task(tasks, with_callback(config, handler), route_llm(route))
+        problems = _group_problems(handler, tasks, error)
+    retry = [(idx, task) for idx, task, problem in zip(idxs, tasks, problems) if problem]
+    for idx, task, problem in zip(idxs, tasks, problems):
+        if not problem:
+            emit_event({"event": "step_completed", "step": idx, "filepath": task.filepath})
+    if retry:
+        print(f"coder: {len(retry)} of {len(tasks)} files of a group step need their own step")
+    errors = []
+    for idx, task in retry:
+        try:
+            run_coder_step(task, idx, config)
+        except CoderStepError as e:
+            errors.append(e)
+    _raise_failures(errors)
+
+
+async def arun_coder_group(tasks: List[ImplementationTask], idxs: List[int], config: RunnableConfig) -> None:
+    """Async variant of run_coder_group."""
+    for idx, task in zip(idxs, tasks):
+        emit_event({"event": "step_started", "step": idx, "filepath": task.filepath})
+    route = route_for_task(tasks[0])
+    with metrics_for(config).span("coder", step=idxs[0], filepath=", ".join(t.filepath for t in tasks)) as handler:
+        set_route(handler, route)
+        error = await arun_coder_task(tasks, with_callback(config, handler), route_llm(route))
+        problems = _group_problems(handler, tasks, error)
+    retry = [(idx, task) for idx, task, problem in zip(idxs, tasks, problems) if problem]
+    for idx, task, problem in zip(idxs, tasks, problems):
+        if not problem:
+            emit_event({"event": "step_completed", "step": idx, "filepath": task.filepath})
+    if retry:
+        print(f"coder: {len(retry)} of {len(tasks)} files of a group step need their own step")
+    _raise_failures(await asyncio.gather(*(arun_coder_step(task, idx, config) for idx, task in retry),
+                                         return_exceptions=True))
+
+
+def run_coder_unit(steps: List[ImplementationTask], unit: List[int], config: RunnableConfig) -> None:
+    """Runs a unit of group_steps: a single step or a group step."""
+    if len(unit) == 1:
+        run_coder_step(steps[unit[0]], unit[0], config)
+    else:
+        run_coder_group([steps[i] for i in unit], unit, config)
+
+
+async def arun_coder_unit(steps: List[ImplementationTask], unit: List[int], config: RunnableConfig) -> None:
+    """Async variant of run_coder_unit."""
+    if len(unit) == 1:
+        await arun_coder_step(steps[unit[0]], unit[0], config)
+    else:
+        await arun_coder_group([steps[i] for i in unit], unit, config)
+
+
+def _max_concurrency(config: RunnableConfig) -> int:
+    return config.get("max_concurrency") or CODER_MAX_CONCURRENCY
+
 
-    coder_state.current_step_idx += 1
+def _next_batch(state: dict, config: RunnableConfig):
+    """Returns the coder state and the units of step indices to implement next.
+
+    Raises GraphRecursionError once the coder has taken all the supersteps
+    its plan allows without finishing.
+    """
+    coder_state: CoderState = state.get("coder_state")
+    if coder_state is None:
+        coder_state = new_coder_state(state["task_plan"], config)
+        kept = keep_unchanged_files(state, coder_state.task_plan)
+        if kept:
+            _complete_batch(state, coder_state, kept)
+
+    steps = coder_state.task_plan.implementation_steps
+    units = group_steps(steps, ready_steps(coder_state))[:_max_concurrency(config)]
+    if units:
+        limit = coder_state.max_supersteps
+        if limit is not None and coder_state.supersteps >= limit:
+            raise GraphRecursionError(
+                f"The coder did not finish the {len(steps)} steps of its plan in {limit} supersteps"
+            )
+        coder_state.supersteps += 1
+    return coder_state, units
+
+
+def _raise_failures(results: list) -> None:
+    """Raises the errors of a batch once all of its steps have ended."""
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if len(errors) == 1:
+        raise errors[0]
+    if errors:
+        raise CoderStepError(f"{len(errors)} steps failed: " + "; ".join(str(e) for e in errors))
+
+
+def keep_unchanged_files(state: dict, task_plan: TaskPlan) -> List[int]:
+    """Steps of files the previous generation in the workspace already implemented as planned.
+
+    Reports the comparison with a ``plan_diff`` event; see agent/incremental.py.
+    """
+    previous = previous_generation(state)
+    if previous is None:
+        return []
+    diff = diff_plans(previous, state["plan"], task_plan, current_workspace())
+    print(f"Regenerating {len(diff.rerun)} of {len(diff.rerun) + len(diff.kept)} files "
+          f"({len(diff.added)} added, {len(diff.changed)} changed, {len(diff.dependent)} dependent), "
+          f"keeping {len(diff.kept)}")
+    if diff.edited:
+        print(f"Keeping files edited since the last generation: {', '.join(diff.edited)}")
+    emit_event(diff.to_event())
+    return kept_steps(task_plan, diff)
+
+
+def _complete_batch(state: dict, coder_state: CoderState, batch: List[int]) -> dict:
+    # Files reach the disk before the step is checkpointed as completed.
+    workspace = current_workspace()
+    workspace.flush()
+    workspace.record({"steps": sorted(batch)})
+    # Merge in plan order so the resulting state does not depend on which
+    # worker finished first.
+    steps = coder_state.task_plan.implementation_steps
+    coder_state.completed_steps = sorted(set(coder_state.completed_steps) | set(batch))
+    completed = set(coder_state.completed_steps)
+    coder_state.current_step_idx = next(
+        (i for i in range(len(steps)) if i not in completed), len(steps)
+    )
+    # The next generation in this workspace only redoes what changed
+    save_manifest(workspace, state["user_prompt"], state["plan"], coder_state.task_plan, coder_state.completed_steps)
     return {"coder_state": coder_state}
 
 
-graph = StateGraph(dict)
+def workspace_for(state: dict, config: Optional[RunnableConfig] = None) -> Workspace:
+    """Workspace the run writes to, taken from its state.
+
+    With the run's ``config`` the workspace journals the writes of the run,
+    see WriteJournal in tools/workspace.py.
+    """
+    workspace = get_workspace(pathlib.Path(state.get("workspace_root") or PROJECT_ROOT))
+    run_id = (config or {}).get("configurable", {}).get("thread_id")
+    if run_id:
+        workspace.use_journal(run_id)
+    return workspace
+
+
+def coder_agent(state: dict, config: RunnableConfig) -> dict:
+    """LangGraph tool-using coder agent.
+
+    Every call implements all steps whose dependencies are satisfied, running
+    up to ``max_concurrency`` units of group_steps at the same time.
+    """
+    with use_workspace(workspace_for(state, config)):
+        coder_state, units = _next_batch(state, config)
+        if not units:
+            return {"coder_state": coder_state, "status": "DONE"}
+        steps = coder_state.task_plan.implementation_steps
+
+        if len(units) == 1:
+            run_coder_unit(steps, units[0], config)
+        else:
+            with ContextThreadPoolExecutor(max_workers=len(units)) as executor:
+                futures = [executor.submit(run_coder_unit, steps, unit, config) for unit in units]
+            _raise_failures([f.exception() for f in futures])
+        return _complete_batch(state, coder_state, [i for unit in units for i in unit])
+
+
+async def acoder_agent(state: dict, config: RunnableConfig) -> dict:
+    """Async variant of coder_agent, running the batch on the event loop."""
+    with use_workspace(workspace_for(state, config)):
+        coder_state, units = _next_batch(state, config)
+        if not units:
+            return {"coder_state": coder_state, "status": "DONE"}
+        steps = coder_state.task_plan.implementation_steps
+
+        _raise_failures(await asyncio.gather(*(arun_coder_unit(steps, unit, config) for unit in units),
+                                             return_exceptions=True))
+        return _complete_batch(state, coder_state, [i for unit in units for i in unit])
+
 
-graph.add_node("planner", planner_agent)
-graph.add_node("architect", architect_agent)
-graph.add_node("coder", coder_agent)
+graph = StateGraph(AgentState)
+
+# Each node has a sync and an async implementation; agent.invoke/stream use
+# the former and agent.ainvoke/astream the latter.
+graph.add_node("planner", RunnableLambda(planner_agent, afunc=aplanner_agent))
+graph.add_node("architect", RunnableLambda(architect_agent, afunc=aarchitect_agent))
+graph.add_node("coder", RunnableLambda(coder_agent, afunc=acoder_agent))
 
 graph.add_edge("planner", "architect")
 graph.add_edge("architect", "coder")
@@ -106,11 +919,85 @@ graph.add_conditional_edges(
 )
 
 graph.set_entry_point("planner")
-agent = graph.compile()
+
+# Per-run artifacts such as metrics.json live in RUNS_DIR/<run id>/.
+RUNS_DIR = pathlib.Path(os.getenv("RUNS_DIR", str(pathlib.Path.cwd() / "runs")))
+
+# Checkpoints of every run, keyed by the run id passed as ``thread_id``.
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", str(RUNS_DIR / "checkpoints.sqlite3"))
+
+
+def build_agent(checkpointer: BaseCheckpointSaver):
+    """Compiles the generation graph with the given checkpointer."""
+    # Full LangChain debug logs are very large; per-node latency, token and
+    # tool metrics are collected by agent/metrics.py instead.
+    if os.getenv("AGENT_DEBUG", "").lower() in ("1", "true", "yes"):
+        from langchain.globals import set_debug, set_verbose
+
+        set_debug(True)
+        set_verbose(True)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def async_checkpointer() -> AsyncSqliteSaver:
+    """Async context manager yielding a checkpointer for agent.ainvoke/astream.
+
+    The sync SqliteSaver cannot be awaited, so async runs compile their own
+    agent: ``async with async_checkpointer() as saver: build_agent(saver)``.
+    """
+    pathlib.Path(CHECKPOINT_DB).parent.mkdir(parents=True, exist_ok=True)
+    return AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB)
+
+
+def run_config(run_id: str, **config) -> dict:
+    """RunnableConfig addressing the checkpoints of ``run_id``.
+
+    Without a ``recursion_limit`` (or with None) the limit follows from the
+    task plan, see new_coder_state.
+    """
+    if config.get("recursion_limit") is None:
+        config["recursion_limit"] = RECURSION_LIMIT_CEILING
+    return {**config, "configurable": {"thread_id": run_id}}
+
+
+def save_run_metrics(run_id: str) -> pathlib.Path:
+    """Writes the metrics collected for ``run_id`` to RUNS_DIR/<run id>/metrics.json."""
+    return pop_run_metrics(run_id).write_json(RUNS_DIR / run_id / "metrics.json")
+
+
+def get_run_state(run_id: str):
+    """Returns the latest checkpoint of ``run_id``.
+
+    ``snapshot.next`` is empty once the run has finished. Raises ValueError
+    if nothing was checkpointed for the run.
+    """
+    snapshot = get_agent().get_state(run_config(run_id))
+    if not snapshot.values:
+        raise ValueError(f"No checkpoints found for run {run_id!r}")
+    return snapshot
+
+
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def get_agent():
+    """The generation graph with the sync checkpointer, compiled once per process.
+
+    Importing this module builds nothing; the checkpoint database, the
+    compiled graph and (on their first call) the models are created here.
+    """
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            pathlib.Path(CHECKPOINT_DB).parent.mkdir(parents=True, exist_ok=True)
+            _agent = build_agent(SqliteSaver(sqlite3.connect(CHECKPOINT_DB, check_same_thread=False)))
+        return _agent
+
 
 if __name__ == "__main__":
-    result = agent.invoke(
+    result = get_agent().invoke(
         {"user_prompt": "Build a colourful modern todo app in html css and js"},
-        {"recursion_limit": 100}
+        run_config(uuid.uuid4().hex[:12], recursion_limit=100)
     )
     print("Final State:", result)
\ No newline at end of file
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import pathlib
+from typing import Dict, List, NamedTuple, Optional
+
+from pydantic import BaseModel, Field
+
+from agent.states import Plan, TaskPlan
+from tools.workspace import METADATA_DIR, Workspace, atomic_write
+
+MANIFEST_NAME = "manifest.json"
+
+
+class FileRecord(BaseModel):
+    """How a generated file came about"""
+    signature: str = Field(description="Hash of the tasks of the file in the task plan")
+    sha256: str = Field(description="Hash of the file content written by the coder")
+
+
+class Manifest(BaseModel):
+    """Plans and file hashes of the last generation in a workspace"""
+    prompt: str
+    plan: Plan
+    task_plan: TaskPlan
+    plan_signature: str = Field(description="Hash of the framework, language and tech stack of the plan")
+    files: Dict[str, FileRecord] = Field(default_factory=dict)
+
+
+class PlanDiff(NamedTuple):
+    """Files of a new task plan compared with the manifest of the workspace."""
+    added: List[str]
+    changed: List[str]
+    # Unchanged files that depend on an added or changed one
+    dependent: List[str]
+    # Files of the old plan that the new one does not have; they are left on disk
+    removed: List[str]
+    kept: List[str]
+    # Kept files whose content was changed since they were generated
+    edited: List[str]
+
+    @property
+    def rerun(self) -> set:
+        return set(self.added) | set(self.changed) | set(self.dependent)
+
+    def to_event(self) -> dict:
+        return {"event": "plan_diff", **self._asdict()}
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def plan_signature(plan: Plan) -> str:
+    """Changes with the choices every file depends on: framework, language and tech stack."""
+    return _hash([plan.framework, plan.language, plan.techstack])
+
+
+def file_signatures(task_plan: TaskPlan) -> Dict[str, str]:
+    """Hash of the tasks of every file, in plan order."""
+    tasks = {}
+    for task in task_plan.implementation_steps:
+        tasks.setdefault(task.filepath, []).append([task.task_description, sorted(task.depends_on)])
+    return {path: _hash(steps) for path, steps in tasks.items()}
+
+
+def manifest_path(root: pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(root) / METADATA_DIR / MANIFEST_NAME
+
+
+def load_manifest(root: pathlib.Path) -> Optional[Manifest]:
+    """Manifest of the workspace at ``root``, or None if it has none (or an unreadable one)."""
+    path = manifest_path(root)
+    try:
+        return Manifest.model_validate_json(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print(f"Ignoring the manifest {path}: {e}")
+        return None
+
+
+def save_manifest(workspace: Workspace, prompt: str, plan: Plan, task_plan: TaskPlan,
+                  completed_steps: List[int]) -> Manifest:
+    """Records the plans and the files whose steps have all completed.
+
+    Files of the plan that are not finished yet are left out, so a later run
+    treats them as added and codes them.
+    """
+    steps = task_plan.implementation_steps
+    completed = set(completed_steps)
+    pending = {task.filepath for i, task in enumerate(steps) if i not in completed}
+    files = {}
+    for path, signature in file_signatures(task_plan).items():
+        entry = workspace.stat(path)
+        if path not in pending and entry is not None:
+            files[path] = FileRecord(signature=signature, sha256=entry.sha256)
+    manifest = Manifest(
+        prompt=prompt, plan=plan, task_plan=TaskPlan(implementation_steps=steps),
+        plan_signature=plan_signature(plan), files=files,
+    )
+    path = manifest_path(workspace.root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, manifest.model_dump_json(indent=2))
+    return manifest
+
+
+def diff_plans(manifest: Manifest, plan: Plan, task_plan: TaskPlan, workspace: Workspace) -> PlanDiff:
+    """Compares a new plan with the manifest of the last generation.
+
+    A file is changed when its tasks differ or it is missing on disk; a
+    different framework, language or tech stack changes every file. Files
+    that depend, directly or through other files, on an added or changed
+    file are rerun too.
+    """
+    signatures = file_signatures(task_plan)
+    same_stack = manifest.plan_signature == plan_signature(plan)
+    added, changed = [], []
+    for path, signature in signatures.items():
+        record = manifest.files.get(path)
+        if record is None:
+            added.append(path)
+        elif not same_stack or record.signature != signature or not workspace.exists(path):
+            changed.append(path)
+
+    rerun = set(added) | set(changed)
+    dependent = []
+    while True:
+        found = [task.filepath for task in task_plan.implementation_steps
+                 if task.filepath not in rerun and rerun.intersection(task.depends_on)]
+        if not found:
+            break
+        for path in found:
+            if path not in rerun:
+                rerun.add(path)
+                dependent.append(path)
+
+    kept = [path for path in signatures if path not in rerun]
+    edited = [path for path in kept if workspace.stat(path).sha256 != manifest.files[path].sha256]
+    removed = [path for path in manifest.files if path not in signatures]
+    return PlanDiff(added, changed, dependent, removed, kept, edited)
+
+
+def kept_steps(task_plan: TaskPlan, diff: PlanDiff) -> List[int]:
+    """Indices of the steps whose files are kept as they are."""
+    rerun = diff.rerun
+    return [i for i, task in enumerate(task_plan.implementation_steps) if task.filepath not in rerun]
@@ -0,0 +1,354 @@
+import json
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
+
+
+class NodeSpan:
+    """Measurements of one planner, architect or coder step."""
+
+    def __init__(self, node: str, step: Optional[int] = None, filepath: Optional[str] = None):
+        self.node = node
+        self.step = step
+        self.filepath = filepath
+        self.started_at = time.time()
+        self.wall_time = 0.0
+        self.llm_calls = 0
+        self.cached_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tool_calls: Dict[str, Dict[str, float]] = {}
+        self.error: Optional[str] = None
+        # Set by the model router: route name, model, USD per million
+        # input/output tokens and why the output was rejected, if it was.
+        self.route: Optional[str] = None
+        self.model: Optional[str] = None
+        self.prices = (0.0, 0.0)
+        self.validation_error: Optional[str] = None
+
+    @property
+    def cost(self) -> float:
+        return (self.prompt_tokens * self.prices[0] + self.completion_tokens * self.prices[1]) / 1_000_000
+
+    def to_dict(self) -> dict:
+        return {
+            "node": self.node,
+            "step": self.step,
+            "filepath": self.filepath,
+            "started_at": self.started_at,
+            "wall_time": round(self.wall_time, 6),
+            # Every model call of the react coder is one iteration of its loop.
+            "react_iterations": self.llm_calls if self.node == "coder" else None,
+            "llm_calls": self.llm_calls,
+            "cached_calls": self.cached_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tool_calls": self.tool_calls,
+            "route": self.route,
+            "model": self.model,
+            "cost": round(self.cost, 6),
+            "validation_error": self.validation_error,
+            "error": self.error,
+        }
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Counts model calls, token usage and tool calls into a NodeSpan."""
+
+    run_inline = True
+
+    def __init__(self, span: NodeSpan):
+        self.span = span
+        self._tools: Dict[UUID, tuple] = {}
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        prompt_tokens = completion_tokens = 0
+        cached = False
+        for generations in response.generations:
+            for gen in generations:
+                message = getattr(gen, "message", None)
+                if message is None:
+                    continue
+                cached = cached or bool(message.response_metadata.get("cache_hit"))
+                usage = getattr(message, "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+        with self._lock:
+            self.span.llm_calls += 1
+            if cached:
+                # Served from the LLM cache, so no tokens were spent.
+                self.span.cached_calls += 1
+            else:
+                self.span.prompt_tokens += prompt_tokens
+                self.span.completion_tokens += completion_tokens
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        with self._lock:
+            self._tools[run_id] = (name, time.perf_counter())
+
+    def _tool_done(self, run_id: UUID, failed: bool) -> None:
+        with self._lock:
+            name, started = self._tools.pop(run_id, ("unknown", time.perf_counter()))
+            stats = self.span.tool_calls.setdefault(name, {"count": 0, "seconds": 0.0, "errors": 0})
+            stats["count"] += 1
+            stats["seconds"] = round(stats["seconds"] + time.perf_counter() - started, 6)
+            stats["errors"] += int(failed)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._tool_done(run_id, failed=False)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._tool_done(run_id, failed=True)
+
+
+class _Totals:
+    """Process-wide counters across all runs, exported in Prometheus format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.node_seconds: Dict[str, float] = {}
+        self.node_count: Dict[str, int] = {}
+        self.tokens: Dict[tuple, int] = {}
+        self.llm_calls: Dict[str, int] = {}
+        self.cached_calls: Dict[str, int] = {}
+        self.tool_count: Dict[str, int] = {}
+        self.tool_seconds: Dict[str, float] = {}
+        self.tool_errors: Dict[str, int] = {}
+        self.route_seconds: Dict[str, float] = {}
+        self.route_count: Dict[str, int] = {}
+        self.route_cost: Dict[str, float] = {}
+        self.route_rejected: Dict[str, int] = {}
+        # Retries, timeouts, hedges and circuit openings per model, and the
+        # state of each model's circuit breaker
+        self.llm_events: Dict[tuple, int] = {}
+        self.circuit_state: Dict[str, str] = {}
+
+    def add(self, span: NodeSpan) -> None:
+        with self.lock:
+            n = span.node
+            self.node_seconds[n] = self.node_seconds.get(n, 0.0) + span.wall_time
+            self.node_count[n] = self.node_count.get(n, 0) + 1
+            for kind, value in (("prompt", span.prompt_tokens), ("completion", span.completion_tokens)):
+                self.tokens[(n, kind)] = self.tokens.get((n, kind), 0) + value
+            self.llm_calls[n] = self.llm_calls.get(n, 0) + span.llm_calls
+            self.cached_calls[n] = self.cached_calls.get(n, 0) + span.cached_calls
+            for tool, stats in span.tool_calls.items():
+                self.tool_count[tool] = self.tool_count.get(tool, 0) + stats["count"]
+                self.tool_seconds[tool] = self.tool_seconds.get(tool, 0.0) + stats["seconds"]
+                self.tool_errors[tool] = self.tool_errors.get(tool, 0) + stats["errors"]
+            if span.route:
+                r = span.route
+                self.route_seconds[r] = self.route_seconds.get(r, 0.0) + span.wall_time
+                self.route_count[r] = self.route_count.get(r, 0) + 1
+                self.route_cost[r] = self.route_cost.get(r, 0.0) + span.cost
+                self.route_rejected[r] = self.route_rejected.get(r, 0) + int(span.validation_error is not None)
+
+
+_totals = _Totals()
+
+CIRCUIT_STATES = ("closed", "half_open", "open")
+
+
+def record_llm_event(model: str, event: str) -> None:
+    """Counts a resilience event (``retries``, ``timeouts``, ``hedges``, ...) of ``model``."""
+    with _totals.lock:
+        _totals.llm_events[(model, event)] = _totals.llm_events.get((model, event), 0) + 1
+
+
+def set_circuit_state(model: str, state: str) -> None:
+    with _totals.lock:
+        _totals.circuit_state[model] = state
+
+
+def circuit_states() -> Dict[str, str]:
+    with _totals.lock:
+        return dict(_totals.circuit_state)
+
+
+class RunMetrics:
+    """Collects the node spans of one run."""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.started_at = time.time()
+        self.spans: List[NodeSpan] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, node: str, step: Optional[int] = None, filepath: Optional[str] = None) -> Iterator[MetricsCallbackHandler]:
+        """Times a node step; pass the yielded handler as a callback to its LLM calls."""
+        span = NodeSpan(node, step, filepath)
+        started = time.perf_counter()
+        try:
+            yield MetricsCallbackHandler(span)
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.wall_time = time.perf_counter() - started
+            with self._lock:
+                self.spans.append(span)
+            _totals.add(span)
+
+    def summary(self) -> Dict[str, dict]:
+        """Per-node totals, e.g. to see which phase dominates latency and cost."""
+        nodes: Dict[str, dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            total = nodes.setdefault(span.node, {
+                "spans": 0, "wall_time": 0.0, "llm_calls": 0, "cached_calls": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "tool_calls": 0, "cost": 0.0,
+            })
+            total["spans"] += 1
+            total["wall_time"] = round(total["wall_time"] + span.wall_time, 6)
+            total["llm_calls"] += span.llm_calls
+            total["cached_calls"] += span.cached_calls
+            total["prompt_tokens"] += span.prompt_tokens
+            total["completion_tokens"] += span.completion_tokens
+            total["tool_calls"] += sum(int(t["count"]) for t in span.tool_calls.values())
+            total["cost"] = round(total["cost"] + span.cost, 6)
+        return nodes
+
+    def route_summary(self) -> Dict[str, dict]:
+        """Per-route latency, tokens and cost, to compare the routed models."""
+        routes: Dict[str, dict] = {}
+        with self._lock:
+            spans = [span for span in self.spans if span.route]
+        for span in spans:
+            total = routes.setdefault(span.route, {
+                "model": span.model, "spans": 0, "wall_time": 0.0, "prompt_tokens": 0,
+                "completion_tokens": 0, "cost": 0.0, "rejected": 0,
+            })
+            total["spans"] += 1
+            total["wall_time"] = round(total["wall_time"] + span.wall_time, 6)
+            total["prompt_tokens"] += span.prompt_tokens
+            total["completion_tokens"] += span.completion_tokens
+            total["cost"] = round(total["cost"] + span.cost, 6)
+            total["rejected"] += int(span.validation_error is not None)
+        for total in routes.values():
+            total["mean_latency"] = round(total["wall_time"] / total["spans"], 6)
+        return routes
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [span.to_dict() for span in sorted(self.spans, key=lambda s: s.started_at)]
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "wall_time": round(time.time() - self.started_at, 6),
+            "summary": self.summary(),
+            "routes": self.route_summary(),
+            "spans": spans,
+        }
+
+    def write_json(self, path: pathlib.Path) -> pathlib.Path:
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
+        return path
+
+
+_runs: Dict[str, RunMetrics] = {}
+_runs_lock = threading.Lock()
+
+
+def get_run_metrics(run_id: str) -> RunMetrics:
+    """Returns the collector of ``run_id``, creating it on first use."""
+    with _runs_lock:
+        if run_id not in _runs:
+            _runs[run_id] = RunMetrics(run_id)
+        return _runs[run_id]
+
+
+def pop_run_metrics(run_id: str) -> RunMetrics:
+    """Removes and returns the collector of a finished run."""
+    with _runs_lock:
+        return _runs.pop(run_id, None) or RunMetrics(run_id)
+
+
+def metrics_for(config: RunnableConfig) -> RunMetrics:
+    """Collector of the run a node is executing in."""
+    run_id = (config or {}).get("configurable", {}).get("thread_id", "default")
+    return get_run_metrics(str(run_id))
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus() -> str:
+    """Process-wide totals in the Prometheus text exposition format."""
+    t = _totals
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples: Dict[str, float]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples.items():
+            lines.append(f"{name}{labels} {value}")
+
+    with t.lock:
+        metric("agent_node_duration_seconds_sum", "counter", "Total wall time spent in each node.",
+               {_labels(node=n): round(v, 6) for n, v in t.node_seconds.items()})
+        metric("agent_node_duration_seconds_count", "counter", "Number of node steps.",
+               {_labels(node=n): v for n, v in t.node_count.items()})
+        metric("agent_llm_tokens_total", "counter", "Tokens sent to and received from the model.",
+               {_labels(node=n, kind=k): v for (n, k), v in t.tokens.items()})
+        metric("agent_llm_calls_total", "counter", "Model calls, including react iterations.",
+               {_labels(node=n): v for n, v in t.llm_calls.items()})
+        metric("agent_llm_cached_calls_total", "counter", "Model calls answered by the LLM cache.",
+               {_labels(node=n): v for n, v in t.cached_calls.items()})
+        metric("agent_tool_calls_total", "counter", "Tool calls made by the coder.",
+               {_labels(tool=n): v for n, v in t.tool_count.items()})
+        metric("agent_tool_duration_seconds_sum", "counter", "Total time spent in each tool.",
+               {_labels(tool=n): round(v, 6) for n, v in t.tool_seconds.items()})
+        metric("agent_tool_errors_total", "counter", "Tool calls that raised.",
+               {_labels(tool=n): v for n, v in t.tool_errors.items()})
+        metric("agent_route_duration_seconds_sum", "counter", "Total wall time of the steps on each model route.",
+               {_labels(route=r): round(v, 6) for r, v in t.route_seconds.items()})
+        metric("agent_route_duration_seconds_count", "counter", "Number of steps on each model route.",
+               {_labels(route=r): v for r, v in t.route_count.items()})
+        metric("agent_route_cost_usd_total", "counter", "Estimated model cost of each route.",
+               {_labels(route=r): round(v, 6) for r, v in t.route_cost.items()})
+        metric("agent_route_rejected_total", "counter", "Steps whose output failed validation, by route.",
+               {_labels(route=r): v for r, v in t.route_rejected.items()})
+        metric("agent_llm_resilience_events_total", "counter",
+               "Retries, timeouts, hedged requests, hedge wins and circuit openings per model.",
+               {_labels(model=m, event=e): v for (m, e), v in t.llm_events.items()})
+        metric("agent_llm_circuit_state", "gauge", "Circuit breaker state per model (0 closed, 1 half open, 2 open).",
+               {_labels(model=m): CIRCUIT_STATES.index(state) for m, state in t.circuit_state.items()})
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves ``/metrics`` in Prometheus format from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
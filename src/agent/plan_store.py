@@ -0,0 +1,154 @@
+import math
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+from agent.states import Plan, TaskPlan
+
+PLAN_STORE_MODES = ("readwrite", "readonly")
+
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "in", "on", "of", "for", "to", "with", "using", "use", "me", "my",
+    "please", "create", "build", "make", "write", "generate", "simple", "basic", "app", "application",
+}
+
+
+def _tokens(prompt: str) -> List[str]:
+    words = [w for w in re.findall(r"[a-z0-9+#.]+", prompt.lower()) if w not in _STOPWORDS]
+    # Adjacent word pairs keep phrases like "dark mode" together; they are
+    # unordered, so "todo app in React" matches "React todo app"
+    return words + [" ".join(sorted(pair)) for pair in zip(words, words[1:])]
+
+
+class PlanMatch(NamedTuple):
+    prompt: str
+    similarity: float
+    plan: Plan
+    task_plan: TaskPlan
+    # Planner and architect time of the stored run, saved by reusing it
+    seconds: float
+
+
+class PlanStore:
+    """Past prompts with their Plan and TaskPlan, retrieved by TF-IDF similarity.
+
+    A new prompt whose cosine similarity to a stored one reaches
+    ``threshold`` reuses that run's plans instead of calling the planner and
+    architect. Plans are only matched for the model that produced them.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.85, mode: str = "readwrite"):
+        if mode not in PLAN_STORE_MODES:
+            raise ValueError(f"mode must be one of {PLAN_STORE_MODES}, got {mode!r}")
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            " id INTEGER PRIMARY KEY, model TEXT NOT NULL, prompt TEXT NOT NULL,"
+            " plan TEXT NOT NULL, task_plan TEXT NOT NULL, seconds REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        # (row id, model, prompt, token counts), loaded once and appended by add()
+        self._rows: Optional[List[tuple]] = None
+        self._df: Counter = Counter()
+        self.lookups = 0
+        self.hits = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+
+    def _load(self) -> List[tuple]:
+        if self._rows is None:
+            self._rows = []
+            for row_id, model, prompt in self._conn.execute("SELECT id, model, prompt FROM plans ORDER BY id"):
+                self._append(row_id, model, prompt)
+        return self._rows
+
+    def _append(self, row_id: int, model: str, prompt: str) -> None:
+        counts = Counter(_tokens(prompt))
+        self._rows.append((row_id, model, prompt, counts))
+        self._df.update(counts.keys())
+
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        n = len(self._rows)
+        vector = {t: c * (math.log((1 + n) / (1 + self._df[t])) + 1) for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norm for t, v in vector.items()}
+
+    def lookup(self, prompt: str, model: str) -> Optional[PlanMatch]:
+        """The stored run most similar to ``prompt``, if it reaches the threshold."""
+        started = time.perf_counter()
+        with self._lock:
+            self.lookups += 1
+            rows = self._load()
+            query = self._vector(Counter(_tokens(prompt)))
+            best_id, best_prompt, best = None, None, 0.0
+            for row_id, row_model, row_prompt, counts in rows:
+                if row_model != model:
+                    continue
+                vector = self._vector(counts)
+                similarity = sum(w * vector.get(t, 0.0) for t, w in query.items())
+                if similarity > best:
+                    best_id, best_prompt, best = row_id, row_prompt, similarity
+            match = None
+            if best_id is not None and best >= self.threshold:
+                plan, task_plan, seconds = self._conn.execute(
+                    "SELECT plan, task_plan, seconds FROM plans WHERE id = ?", (best_id,)
+                ).fetchone()
+                match = PlanMatch(
+                    best_prompt, round(best, 4), Plan.model_validate_json(plan),
+                    TaskPlan.model_validate_json(task_plan), seconds,
+                )
+                self.hits += 1
+                self.saved_seconds += seconds
+            self.lookup_seconds += time.perf_counter() - started
+            return match
+
+    def add(self, prompt: str, model: str, plan: Plan, task_plan: TaskPlan, seconds: float) -> None:
+        """Stores the plans generated for ``prompt``."""
+        if self.mode == "readonly":
+            return
+        with self._lock:
+            self._load()
+            cur = self._conn.execute(
+                "INSERT INTO plans (model, prompt, plan, task_plan, seconds, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (model, prompt, plan.model_dump_json(), task_plan.model_dump_json(), seconds, time.time()),
+            )
+            self._conn.commit()
+            self._append(cur.lastrowid, model, prompt)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "threshold": self.threshold,
+                "entries": len(self._load()),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "lookup_seconds": round(self.lookup_seconds, 6),
+            }
+
+
+def plan_store_from_env() -> Optional[PlanStore]:
+    """Builds the plan store from ``PLAN_STORE_*`` environment variables.
+
+    Returns None when ``PLAN_STORE_MODE`` is ``off``.
+    """
+    mode = os.getenv("PLAN_STORE_MODE", "readwrite").lower()
+    if mode == "off":
+        return None
+    return PlanStore(
+        os.getenv("PLAN_STORE_PATH", str(pathlib.Path.cwd() / ".cache" / "plan_store.sqlite3")),
+        threshold=float(os.getenv("PLAN_REUSE_THRESHOLD", "0.85")),
+        mode=mode,
+    )
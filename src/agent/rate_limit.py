@@ -0,0 +1,145 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+
+class _Bucket:
+    """Token bucket refilled continuously at ``per_minute / 60`` per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class TokenBucketRateLimiter(BaseRateLimiter):
+    """Shared requests-per-minute and tokens-per-minute budget for one provider.
+
+    Every request takes one request slot and reserves ``tokens_per_request``
+    tokens up front. Once the provider reports the real usage,
+    ``record_usage`` settles the difference, so long prompts slow down the
+    calls that follow them. The limiter is thread-safe and can be shared by
+    synchronous and asynchronous callers of the same process.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        tokens_per_request: int = 1000,
+    ):
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self.tokens_per_request = tokens_per_request
+        self._lock = threading.Lock()
+
+    def _reservation(self) -> float:
+        return min(self.tokens_per_request, self._tokens.capacity)
+
+    def _try_acquire(self) -> float:
+        """Takes a request slot if possible, otherwise returns the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests:
+                self._requests.refill(now)
+                wait = max(wait, self._requests.wait_for(1))
+            if self._tokens:
+                self._tokens.refill(now)
+                wait = max(wait, self._tokens.wait_for(self._reservation()))
+            if wait > 0:
+                return wait
+            if self._requests:
+                self._requests.level -= 1
+            if self._tokens:
+                self._tokens.level -= self._reservation()
+            return 0.0
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._try_acquire()
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._try_acquire()
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(wait)
+
+    def record_usage(self, total_tokens: int) -> None:
+        """Settles a request's token reservation against its real usage."""
+        if not self._tokens:
+            return
+        with self._lock:
+            self._tokens.refill(time.monotonic())
+            self._tokens.level -= total_tokens - self._reservation()
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """Feeds the token usage reported by the provider back into a limiter."""
+
+    run_inline = True
+
+    def __init__(self, limiter: TokenBucketRateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        total = usage.get("total_tokens")
+        if not total:
+            # Streamed calls report their usage on the message only; cache
+            # hits are marked (see agent/cache.py) and cost nothing.
+            total = 0
+            for generations in response.generations:
+                for gen in generations:
+                    message = getattr(gen, "message", None)
+                    if message is None or message.response_metadata.get("cache_hit"):
+                        continue
+                    total += (getattr(message, "usage_metadata", None) or {}).get("total_tokens", 0)
+        if total:
+            self.limiter.record_usage(total)
+
+
+_limiters: Dict[str, TokenBucketRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> TokenBucketRateLimiter:
+    """Returns the process-wide limiter of ``provider``.
+
+    Budgets come from ``<PROVIDER>_REQUESTS_PER_MINUTE``,
+    ``<PROVIDER>_TOKENS_PER_MINUTE`` and ``<PROVIDER>_TOKENS_PER_REQUEST``;
+    an unset budget is not limited.
+    """
+    prefix = provider.upper()
+    with _limiters_lock:
+        if provider not in _limiters:
+            rpm = os.getenv(f"{prefix}_REQUESTS_PER_MINUTE")
+            tpm = os.getenv(f"{prefix}_TOKENS_PER_MINUTE")
+            _limiters[provider] = TokenBucketRateLimiter(
+                requests_per_minute=float(rpm) if rpm else None,
+                tokens_per_minute=float(tpm) if tpm else None,
+                tokens_per_request=int(os.getenv(f"{prefix}_TOKENS_PER_REQUEST", "1000")),
+            )
+        return _limiters[provider]
@@ -0,0 +1,498 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.rate_limiters import BaseRateLimiter
+from pydantic import ConfigDict
+
+from agent.metrics import record_llm_event, set_circuit_state
+
+
+class LLMTimeoutError(TimeoutError):
+    """An attempt got no response within LLM_TIMEOUT."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Calls to a model are refused after too many consecutive failures."""
+
+
+@dataclass
+class CallPolicy:
+    """Deadlines, retries and hedging of every model call; 0 disables a limit."""
+    # Seconds one attempt may take, and all attempts and backoffs together
+    timeout: float = 120.0
+    deadline: float = 600.0
+    max_retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    # Start a duplicate request when the first has not answered (or, for a
+    # streamed call, not sent a token) after this many seconds
+    hedge_after: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "CallPolicy":
+        return cls(
+            timeout=float(os.getenv("LLM_TIMEOUT", "120")),
+            deadline=float(os.getenv("LLM_DEADLINE", "600")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1")),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "30")),
+            hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "0")),
+        )
+
+    def backoff(self, retry: int, error: BaseException) -> float:
+        """Full-jitter exponential delay before ``retry``, at least the server's Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            delay = max(delay, float(headers.get("retry-after", 0)))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+
+_TRANSIENT_NAMES = {
+    "APITimeoutError", "APIConnectionError", "ReadTimeout", "ConnectTimeout", "ConnectError",
+    "RemoteProtocolError", "ReadError",
+}
+
+
+def is_transient(error: BaseException) -> bool:
+    """Timeouts, connection failures, rate limits and server errors are worth retrying."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 425, 429) or status >= 500
+    return type(error).__name__ in _TRANSIENT_NAMES
+
+
+class CircuitBreaker:
+    """Fails calls fast after ``failure_threshold`` consecutive transient failures.
+
+    After ``reset_timeout`` seconds one trial call is let through; its
+    success closes the circuit again, its failure keeps it open.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        set_circuit_state(name, self.state)
+
+    def _set_state(self, state: str) -> None:
+        if state == "open" and self.state != "open":
+            record_llm_event(self.name, "circuit_opened")
+        self.state = state
+        set_circuit_state(self.name, state)
+
+    def before_call(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == "open":
+                wait_for = self.opened_at + self.reset_timeout - time.monotonic()
+                if wait_for > 0:
+                    raise CircuitOpenError(f"circuit of {self.name} is open, retry in {wait_for:.0f}s")
+                self._set_state("half_open")
+            if self.state == "half_open":
+                if self._trial_running:
+                    raise CircuitOpenError(f"circuit of {self.name} is half open, a trial call is running")
+                self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.state != "closed":
+                self._set_state("closed")
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failure_threshold > 0 and (self.state == "half_open" or self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker of model ``name``, configured by ``LLM_CIRCUIT_*``."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+                reset_timeout=float(os.getenv("LLM_CIRCUIT_RESET", "60")),
+            )
+        return _breakers[name]
+
+
+class _StreamGuard:
+    """Lets the streamed tokens of only one attempt through to the callbacks.
+
+    The first attempt that sends a token owns the stream; tokens of every
+    other attempt, and of attempts given up on, are dropped. Once tokens
+    have been passed on, the call can no longer be retried or hedged.
+    """
+
+    def __init__(self, run_manager: Any):
+        self.run_manager = run_manager
+        self.owner: Optional[int] = None
+        self.abandoned = set()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self.owner is not None
+
+    def new_attempt(self) -> int:
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def abandon(self, attempt: int) -> None:
+        with self._lock:
+            self.abandoned.add(attempt)
+
+    def claim(self, attempt: int) -> bool:
+        with self._lock:
+            if attempt in self.abandoned:
+                return False
+            if self.owner is None:
+                self.owner = attempt
+            return self.owner == attempt
+
+    def accepts(self, attempt: int) -> bool:
+        return self.owner is None or self.owner == attempt
+
+    def manager(self, attempt: int) -> Any:
+        if self.run_manager is None:
+            return None
+        return _AttemptRunManager(self, attempt)
+
+
+class _AttemptRunManager:
+    """Run manager of one attempt; forwards everything but foreign tokens."""
+
+    def __init__(self, guard: _StreamGuard, attempt: int):
+        self._guard = guard
+        self._attempt = attempt
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._guard.run_manager, name)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        if self._guard.claim(self._attempt):
+            return self._guard.run_manager.on_llm_new_token(token, **kwargs)
+        if asyncio.iscoroutinefunction(self._guard.run_manager.on_llm_new_token):
+            return asyncio.sleep(0)
+        return None
+
+
+# Runs attempts that have a timeout or may be hedged. Attempts given up on
+# keep a thread until the HTTP client's own timeout ends them.
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_CALL_THREADS", "32")), thread_name_prefix="llm-call")
+
+
+class ResilientChatModel(BaseChatModel):
+    """Chat model that calls ``inner`` with deadlines, retries, hedging and a circuit breaker.
+
+    Transient errors (see ``is_transient``) are retried with jittered
+    exponential backoff until ``max_retries`` or the deadline. ``llm_cache``
+    (set like ``BaseChatModel.cache``) is looked up once per call, before any
+    attempt, and updated with its answer. ``limiter`` is acquired before an
+    attempt's timeout starts, so waiting for the budget never times out a
+    request that was not sent yet. Callbacks belong on this model, so each
+    call is reported once.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    policy: CallPolicy
+    breaker: CircuitBreaker
+    limiter: Optional[BaseRateLimiter] = None
+    llm_cache: Any = False
+    model_name: str = ""
+    cache: Any = False
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # The inner model formats the tools for its provider
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _record(self, event: str) -> None:
+        record_llm_event(self.model_name, event)
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _cache(self) -> Optional[BaseCache]:
+        """The cache of the calls; None means the global cache, False none."""
+        if isinstance(self.llm_cache, BaseCache):
+            return self.llm_cache
+        return get_llm_cache() if self.llm_cache is None else None
+
+    def _attempt_timeout(self, deadline: Optional[float]) -> Optional[float]:
+        limits = [t for t in (self.policy.timeout or None, self._remaining(deadline)) if t is not None]
+        return min(limits) if limits else None
+
+    def _should_retry(self, error: BaseException, retry: int, guard: _StreamGuard, deadline: Optional[float]):
+        """Delay before the next attempt, or None if ``error`` should be raised."""
+        if isinstance(error, LLMTimeoutError):
+            self._record("timeouts")
+        if not is_transient(error) or retry >= self.policy.max_retries or guard.started:
+            return None
+        delay = self.policy.backoff(retry, error)
+        remaining = self._remaining(deadline)
+        if remaining is not None and delay >= remaining:
+            return None
+        print(f"Retrying {self.model_name} in {delay:.1f}s after {type(error).__name__}: {error}")
+        self._record("retries")
+        return delay
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cache = self._cache()
+        if cache is not None:
+            # Hits are answered before the breaker, the limiter and any attempt
+            key = dumps(messages), self.inner._get_llm_string(stop=stop, **kwargs)
+            hit = cache.lookup(*key)
+            if isinstance(hit, list):
+                return ChatResult(generations=hit)
+        deadline = time.monotonic() + self.policy.deadline if self.policy.deadline else None
+        guard = _StreamGuard(run_manager)
+
+        def call(attempt: int) -> ChatResult:
+            if attempt in guard.abandoned:
+                # Given up on while it waited for a thread; its request is not sent
+                raise LLMTimeoutError(f"{self.model_name} attempt {attempt} was abandoned")
+            return self.inner._generate_with_cache(messages, stop=stop, run_manager=guard.manager(attempt), **kwargs)
+
+        retry = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                if self.limiter is not None:
+                    self.limiter.acquire(blocking=True)
+                result = self._attempt(call, guard, self._attempt_timeout(deadline))
+            except Exception as e:
+                # Any answer from the provider, even a rejected request, shows it is up
+                if is_transient(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                delay = self._should_retry(e, retry, guard, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                retry += 1
+                continue
+            self.breaker.record_success()
+            if cache is not None:
+                cache.update(*key, result.generations)
+            return result
+
+    def _attempt(self, call, guard: _StreamGuard, timeout: Optional[float]) -> ChatResult:
+        """Runs one attempt, plus its hedge, and returns the first accepted result."""
+        hedge_after = self.policy.hedge_after
+        if timeout is None and not hedge_after:
+            return call(guard.new_attempt())
+        end = None if timeout is None else time.monotonic() + timeout
+        futures = {}
+
+        def start() -> int:
+            attempt = guard.new_attempt()
+            futures[_pool.submit(contextvars.copy_context().run, call, attempt)] = attempt
+            return attempt
+
+        start()
+        hedge = None
+        error = None
+        try:
+            while futures:
+                wait_for = self._remaining(end)
+                if hedge_after and hedge is None:
+                    wait_for = hedge_after if wait_for is None else min(hedge_after, wait_for)
+                done, _ = wait(futures, timeout=None if wait_for is None else max(0.0, wait_for),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    attempt = futures.pop(future)
+                    if future.exception() is not None:
+                        if guard.owner == attempt:
+                            raise future.exception()
+                        error = error or future.exception()
+                    elif guard.accepts(attempt):
+                        if attempt == hedge:
+                            self._record("hedge_wins")
+                        return future.result()
+                if done:
+                    continue
+                if hedge_after and hedge is None and not guard.started and (end is None or time.monotonic() < end):
+                    if self.limiter is not None and not self.limiter.acquire(blocking=False):
+                        # No budget for a duplicate request; keep waiting for the first
+                        hedge = 0
+                        continue
+                    self._record("hedges")
+                    hedge = start()
+                    continue
+                if end is not None and time.monotonic() >= end:
+                    raise LLMTimeoutError(f"{self.model_name} did not answer within {timeout:.0f}s")
+            raise error
+        finally:
+            for attempt in futures.values():
+                guard.abandon(attempt)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cache = self._cache()
+        if cache is not None:
+            key = dumps(messages), self.inner._get_llm_string(stop=stop, **kwargs)
+            hit = await cache.alookup(*key)
+            if isinstance(hit, list):
+                return ChatResult(generations=hit)
+        deadline = time.monotonic() + self.policy.deadline if self.policy.deadline else None
+        guard = _StreamGuard(run_manager)
+
+        async def call(attempt: int) -> ChatResult:
+            return await self.inner._agenerate_with_cache(
+                messages, stop=stop, run_manager=guard.manager(attempt), **kwargs
+            )
+
+        retry = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                if self.limiter is not None:
+                    await self.limiter.aacquire(blocking=True)
+                result = await self._aattempt(call, guard, self._attempt_timeout(deadline))
+            except Exception as e:
+                # Any answer from the provider, even a rejected request, shows it is up
+                if is_transient(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                delay = self._should_retry(e, retry, guard, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                retry += 1
+                continue
+            self.breaker.record_success()
+            if cache is not None:
+                await cache.aupdate(*key, result.generations)
+            return result
+
+    async def _aattempt(self, call, guard: _StreamGuard, timeout: Optional[float]) -> ChatResult:
+        """Async variant of _attempt; attempts given up on are cancelled."""
+        hedge_after = self.policy.hedge_after
+        end = None if timeout is None else time.monotonic() + timeout
+        tasks = {}
+
+        def start() -> int:
+            attempt = guard.new_attempt()
+            tasks[asyncio.ensure_future(call(attempt))] = attempt
+            return attempt
+
+        start()
+        hedge = None
+        error = None
+        try:
+            while tasks:
+                wait_for = self._remaining(end)
+                if hedge_after and hedge is None:
+                    wait_for = hedge_after if wait_for is None else min(hedge_after, wait_for)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=None if wait_for is None else max(0.0, wait_for),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    attempt = tasks.pop(task)
+                    if task.exception() is not None:
+                        if guard.owner == attempt:
+                            raise task.exception()
+                        error = error or task.exception()
+                    elif guard.accepts(attempt):
+                        if attempt == hedge:
+                            self._record("hedge_wins")
+                        return task.result()
+                if done:
+                    continue
+                if hedge_after and hedge is None and not guard.started and (end is None or time.monotonic() < end):
+                    if self.limiter is not None and not self.limiter.acquire(blocking=False):
+                        # No budget for a duplicate request; keep waiting for the first
+                        hedge = 0
+                        continue
+                    self._record("hedges")
+                    hedge = start()
+                    continue
+                if end is not None and time.monotonic() >= end:
+                    raise LLMTimeoutError(f"{self.model_name} did not answer within {timeout:.0f}s")
+            raise error
+        finally:
+            for task, attempt in tasks.items():
+                guard.abandon(attempt)
+                task.cancel()
+
+
+def resilient(model: BaseChatModel, name: str, callbacks: Optional[list] = None,
+              policy: Optional[CallPolicy] = None) -> ResilientChatModel:
+    """Wraps ``model`` with the CallPolicy from the environment and the breaker of ``name``.
+
+    The cache and the rate limiter of ``model`` move to the wrapper, which
+    looks the cache up once per call and acquires the limiter once per
+    attempt, outside the attempt's timeout.
+    """
+    cache, limiter = model.cache, model.rate_limiter
+    model = model.model_copy(update={"cache": False, "rate_limiter": None})
+    return ResilientChatModel(
+        inner=model,
+        llm_cache=cache,
+        limiter=limiter,
+        policy=policy or CallPolicy.from_env(),
+        breaker=get_circuit_breaker(name),
+        model_name=name,
+        callbacks=callbacks,
+    )
@@ -0,0 +1,118 @@
+import json
+import os
+import posixpath
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from agent.states import ImplementationTask
+
+# Costs are USD per million tokens, taken from Groq's price list at the time
+# of writing; override them in the rules file if they change.
+DEFAULT_RULES = {
+    "routes": {
+        "large": {"model": "openai/gpt-oss-120b", "input_cost": 0.15, "output_cost": 0.75},
+        "small": {"model": "openai/gpt-oss-20b", "input_cost": 0.10, "output_cost": 0.50},
+    },
+    # Route used when no rule matches, and to retry work that failed validation
+    "default": "large",
+    "fallback": "large",
+    "nodes": {"planner": "large", "architect": "large"},
+    # Coder tasks; the first matching rule wins. All conditions of a rule must hold.
+    "tasks": [
+        {
+            "route": "small",
+            "filenames": [".gitignore", ".env.example", ".prettierrc", ".eslintrc", "LICENSE", "requirements.txt"],
+        },
+        {
+            "route": "small",
+            "extensions": [".json", ".md", ".txt", ".yml", ".yaml", ".toml", ".ini", ".cfg", ".svg"],
+            "max_description_chars": 800,
+            "max_existing_chars": 4000,
+        },
+    ],
+}
+
+
+@dataclass
+class Route:
+    name: str
+    model: str
+    input_cost: float = 0.0
+    output_cost: float = 0.0
+
+
+class ModelRouter:
+    """Picks a model per node and per implementation task from a set of rules.
+
+    Task rules match on the file name or extension, the size of the file
+    already on disk and the length of the task description, a rough
+    measure of how much work the task is.
+    """
+
+    def __init__(self, rules: dict):
+        self.routes: Dict[str, Route] = {
+            name: Route(name, **spec) for name, spec in rules.get("routes", {}).items()
+        }
+        self.default = rules.get("default", "large")
+        self.fallback = rules.get("fallback", self.default)
+        self.nodes: Dict[str, str] = dict(rules.get("nodes", {}))
+        self.task_rules: List[dict] = list(rules.get("tasks", []))
+        for name in [self.default, self.fallback, *self.nodes.values(), *(r["route"] for r in self.task_rules)]:
+            if name not in self.routes:
+                raise ValueError(f"Unknown route {name!r} in router rules")
+
+    def for_node(self, node: str) -> str:
+        return self.nodes.get(node, self.default)
+
+    def for_task(self, task: ImplementationTask, existing_chars: int = 0) -> str:
+        name = posixpath.basename(task.filepath)
+        ext = posixpath.splitext(name)[1].lower()
+        for rule in self.task_rules:
+            if "filenames" in rule and name not in rule["filenames"]:
+                continue
+            if "extensions" in rule and ext not in rule["extensions"]:
+                continue
+            if len(task.task_description) > rule.get("max_description_chars", float("inf")):
+                continue
+            if existing_chars > rule.get("max_existing_chars", float("inf")):
+                continue
+            if len(task.depends_on) > rule.get("max_dependencies", float("inf")):
+                continue
+            return rule["route"]
+        return self.default
+
+    def model(self, route: str) -> str:
+        return self.routes[route].model
+
+
+def validate_output(filepath: str, content: Optional[str]) -> Optional[str]:
+    """Returns why a coder result is unusable, or None if it looks fine.
+
+    ``content`` is None when the file does not exist. Empty files are fine,
+    e.g. ``__init__.py`` or ``.gitkeep``, except for JSON.
+    """
+    if content is None:
+        return f"{filepath} was not written"
+    if filepath.endswith(".json"):
+        try:
+            json.loads(content)
+        except ValueError as e:
+            return f"{filepath} is not valid JSON: {e}"
+    return None
+
+
+def router_from_env() -> ModelRouter:
+    """Builds the router from the JSON file in ``ROUTER_RULES``.
+
+    The file's top-level keys replace the defaults. ``ROUTER_RULES=off``
+    sends everything to the default route.
+    """
+    rules = dict(DEFAULT_RULES)
+    path = os.getenv("ROUTER_RULES", "")
+    if path.lower() == "off":
+        rules["tasks"] = []
+        rules["nodes"] = {}
+    elif path:
+        with open(path, "r", encoding="utf-8") as f:
+            rules.update(json.load(f))
+    return ModelRouter(rules)
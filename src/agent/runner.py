@@ -0,0 +1,202 @@
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from agent.cassette import Cassette, use_cassette
+from agent.graph import get_agent, run_config, save_run_metrics
+from agent.metrics import get_run_metrics
+from tools.workspace import get_workspace, init_project_root, read_journal
+
+
+class GenerationCancelled(Exception):
+    """Raised inside run_generation when its cancel event is set."""
+
+
+class GenerationTimedOut(GenerationCancelled):
+    """Raised inside run_generation when the run exceeds its timeout."""
+
+
+def run_generation(
+    user_prompt: str,
+    run_id: str,
+    workspace_root: Path,
+    recursion_limit: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    on_event: Optional[Callable[[dict], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    timeout: Optional[float] = None,
+    cassette: Optional[Cassette] = None,
+    incremental: bool = False,
+) -> dict:
+    """Generates one project into ``workspace_root`` and returns a summary of the run.
+
+    Progress events from the custom stream, plus a ``node_completed`` event
+    per planner/architect/coder step, are passed to ``on_event``. Setting
+    ``cancel`` or exceeding ``timeout`` seconds stops the run at the next
+    event; the step in progress is not interrupted. Errors do not raise but
+    end up in the summary's ``status`` and ``error``. With a ``cassette`` the
+    run's model and tool calls are recorded to it or replayed from it.
+
+    With ``incremental`` a ``workspace_root`` that holds an earlier
+    generation is updated in place: only files whose tasks changed are
+    coded again.
+    """
+    started = time.perf_counter()
+    deadline = started + timeout if timeout else None
+    workspace_root = Path(workspace_root)
+    init_project_root(workspace_root)
+
+    config = {"recursion_limit": recursion_limit}
+    if max_concurrency:
+        config["max_concurrency"] = max_concurrency
+    if cassette is not None:
+        cassette.workspace_root = str(workspace_root.resolve())
+        cassette.prompt = cassette.prompt or user_prompt
+        config["callbacks"] = [cassette.callback_handler()]
+
+    status, error = "succeeded", None
+    reused = {}
+    diff = None
+    try:
+        with use_cassette(cassette):
+            for namespace, mode, chunk in get_agent().stream(
+                {"user_prompt": user_prompt, "workspace_root": str(workspace_root), "incremental": incremental},
+                run_config(run_id, **config),
+                stream_mode=["updates", "custom"],
+                subgraphs=True,
+            ):
+                if cancel is not None and cancel.is_set():
+                    raise GenerationCancelled("cancelled")
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise GenerationTimedOut(f"timed out after {timeout:g}s")
+                if mode == "custom" and chunk.get("event") == "plan_reused":
+                    reused = chunk
+                if mode == "custom" and chunk.get("event") == "plan_diff":
+                    diff = chunk
+                if on_event is None:
+                    continue
+                if mode == "custom":
+                    on_event(chunk)
+                elif not namespace:
+                    for node, update in chunk.items():
+                        if update:
+                            on_event({"event": "node_completed", "node": node})
+    except GenerationTimedOut as e:
+        status, error = "timed_out", str(e)
+    except GenerationCancelled as e:
+        status, error = "cancelled", str(e)
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+
+    workspace = get_workspace(workspace_root)
+    # A stopped run leaves the writes of its last step buffered.
+    workspace.flush()
+    files = workspace.list()
+    written = [r for r in read_journal(workspace_root, run_id) if "path" in r]
+    metrics = get_run_metrics(run_id)
+    summary = metrics.summary()
+    return {
+        "run_id": run_id,
+        "status": status,
+        "error": error,
+        "duration": round(time.perf_counter() - started, 3),
+        "workspace_root": str(workspace_root),
+        "plan_reused_from": reused.get("prompt"),
+        "files_kept": len(diff["kept"]) if diff else 0,
+        "files": len(files),
+        "bytes": sum(workspace.stat(f).size for f in files),
+        # From the write journal: files this run wrote, and buffered writes that never hit the disk
+        "files_written": len({r["path"] for r in written}),
+        "writes_coalesced": sum(r["writes"] - 1 for r in written),
+        "llm_calls": sum(node["llm_calls"] for node in summary.values()),
+        "prompt_tokens": sum(node["prompt_tokens"] for node in summary.values()),
+        "completion_tokens": sum(node["completion_tokens"] for node in summary.values()),
+        "cost": round(sum(node["cost"] for node in summary.values()), 6),
+        "routes": metrics.route_summary(),
+        "cassette": cassette.stats() if cassette is not None else None,
+        "metrics_path": str(save_run_metrics(run_id)),
+    }
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:40] or "project"
+
+
+def load_prompts(path: Path) -> List[dict]:
+    """Reads batch prompts from a file.
+
+    ``.jsonl`` files hold one JSON object per line with a ``prompt`` and an
+    optional ``id`` (a bare JSON string is accepted too); any other file
+    holds one prompt per non-empty line, ``#`` starting a comment line.
+    Prompts without an id are numbered; ids name the output directories
+    (lowercased, with other characters than letters and digits replaced by
+    ``-``), so those names must be unique.
+    """
+    path = Path(path)
+    prompts = []
+    directories = {}
+    for n, line in enumerate(path.read_text(encoding="utf-8").splitlines(), start=1):
+        line = line.strip()
+        if not line or (path.suffix != ".jsonl" and line.startswith("#")):
+            continue
+        if path.suffix == ".jsonl":
+            item = json.loads(line)
+            item = {"prompt": item} if isinstance(item, str) else item
+            if not item.get("prompt"):
+                raise ValueError(f"{path}:{n}: missing prompt")
+        else:
+            item = {"prompt": line}
+        prompt_id = str(item.get("id") or f"{len(prompts) + 1:03d}-{_slug(item['prompt'])}")
+        directory = _slug(prompt_id)
+        if directory in directories:
+            raise ValueError(f"{path}:{n}: id {prompt_id!r} uses the output directory {directory!r} "
+                             f"of id {directories[directory]!r}")
+        directories[directory] = prompt_id
+        prompts.append({"id": prompt_id, "prompt": item["prompt"]})
+    return prompts
+
+
+def run_batch(prompts: List[dict], output_dir: Path, concurrency: int = 2, **kwargs) -> dict:
+    """Generates every prompt into its own directory below ``output_dir``.
+
+    A failing prompt does not stop the others. The summary, with status,
+    duration, token use and file count per prompt, is returned and written
+    to ``output_dir/summary.json``. Extra keyword arguments are passed to
+    run_generation.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    def run_one(item: dict) -> dict:
+        run_id = f"batch-{uuid.uuid4().hex[:12]}"
+        try:
+            result = run_generation(item["prompt"], run_id, output_dir / _slug(item["id"]), **kwargs)
+        except Exception as e:
+            result = {"run_id": run_id, "status": "failed", "error": f"{type(e).__name__}: {e}", "duration": 0.0,
+                      "files": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+        print(f"[{result['status']}] {item['id']}: {result['files']} files in {result['duration']:.1f}s"
+              + (f" ({result['error']})" if result["error"] else ""))
+        return {"id": item["id"], "prompt": item["prompt"], **result}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = list(executor.map(run_one, prompts))
+
+    summary = {
+        "prompts": len(results),
+        "succeeded": sum(r["status"] == "succeeded" for r in results),
+        "failed": sum(r["status"] != "succeeded" for r in results),
+        "duration": round(time.perf_counter() - started, 3),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in results),
+        "completion_tokens": sum(r["completion_tokens"] for r in results),
+        "cost": round(sum(r["cost"] for r in results), 6),
+        "plans_reused": sum(bool(r.get("plan_reused_from")) for r in results),
+        "results": results,
+    }
+    (output_dir / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return summary
@@ -0,0 +1,165 @@
+import json
+import re
+import threading
+from typing import Any, Callable, List, Optional, Set
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agent.states import ImplementationTask, TaskPlan
+
+_STEPS_KEY = re.compile(r'"implementation_steps"\s*:\s*\[')
+
+
+class TaskStreamParser:
+    """Finds the complete implementation steps in a TaskPlan tool call as its JSON streams in.
+
+    Scans every character once, tracking strings and nesting, so a long plan
+    costs no more than parsing it once.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._start = 0
+
+    def feed(self, fragment: str) -> List[dict]:
+        """Adds the next piece of the arguments; returns the steps completed by it."""
+        self.text += fragment
+        steps = []
+        if not self._in_array and not self._done:
+            match = _STEPS_KEY.search(self.text, max(0, self._pos - 40))
+            if match is None:
+                self._pos = len(self.text)
+                return steps
+            self._in_array = True
+            self._pos = match.end()
+        if not self._in_array:
+            return steps
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 0:
+                    # End of the implementation_steps array
+                    self._in_array, self._done = False, True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        steps.append(json.loads(text[self._start:i + 1]))
+                    except ValueError:
+                        pass
+        self._pos = len(text)
+        return steps
+
+
+class TaskStreamHandler(BaseCallbackHandler):
+    """Reports each ImplementationTask of a streamed TaskPlan as soon as it is complete."""
+
+    run_inline = True
+
+    def __init__(self, on_task: Callable[[int, ImplementationTask], None]):
+        self.on_task = on_task
+        self._parser = TaskStreamParser()
+        self.count = 0
+
+    def on_llm_new_token(self, token: str, *, chunk: Any = None, **kwargs: Any) -> None:
+        message = getattr(chunk, "message", None)
+        for tool_chunk in getattr(message, "tool_call_chunks", None) or []:
+            # Only the first tool call is the TaskPlan
+            if tool_chunk.get("index") not in (None, 0) or not tool_chunk.get("args"):
+                continue
+            for step in self._parser.feed(tool_chunk["args"]):
+                try:
+                    task = ImplementationTask.model_validate(step)
+                except ValueError:
+                    continue
+                self.on_task(self.count, task)
+                self.count += 1
+
+
+class SpeculativeCoder:
+    """Starts implementation steps while the architect is still writing the plan.
+
+    ``start(idx, task)`` must begin a step without waiting for it and call
+    ``done(idx, succeeded)`` when it ends; failed steps are left to the
+    coder node. A streamed step starts once every step of the files it
+    depends on, and every earlier step of its own file, has completed.
+    Dependencies on files not streamed yet hold it back, so steps are never
+    started ahead of work they rely on.
+    """
+
+    def __init__(self, start: Callable[[int, ImplementationTask], None], max_concurrency: int):
+        self.start = start
+        self.max_concurrency = max(1, max_concurrency)
+        self.tasks: List[ImplementationTask] = []
+        self.completed: Set[int] = set()
+        self.running: Set[int] = set()
+        self.started: Set[int] = set()
+        self.closed = False
+        # Reentrant, as a step may finish and call done() from start()
+        self._lock = threading.RLock()
+
+    def add(self, idx: int, task: ImplementationTask) -> None:
+        with self._lock:
+            self.tasks.append(task)
+            self._dispatch()
+
+    def done(self, idx: int, succeeded: bool = True) -> None:
+        with self._lock:
+            self.running.discard(idx)
+            if succeeded:
+                self.completed.add(idx)
+            self._dispatch()
+
+    def close(self) -> None:
+        """Stops starting steps; the coder node takes over the rest."""
+        with self._lock:
+            self.closed = True
+
+    def _ready(self, i: int) -> bool:
+        task = self.tasks[i]
+        deps = set(task.depends_on) - {task.filepath}
+        if not deps <= {t.filepath for t in self.tasks}:
+            return False
+        return not any(
+            j not in self.completed and (other.filepath in deps or (j < i and other.filepath == task.filepath))
+            for j, other in enumerate(self.tasks) if j != i
+        )
+
+    def _dispatch(self) -> None:
+        if self.closed:
+            return
+        for i, task in enumerate(self.tasks):
+            if len(self.running) >= self.max_concurrency:
+                return
+            if i not in self.started and self._ready(i):
+                self.started.add(i)
+                self.running.add(i)
+                self.start(i, task)
+
+    def completed_steps(self, task_plan: Optional[TaskPlan]) -> List[int]:
+        """Steps of the final plan that were implemented exactly as streamed."""
+        if task_plan is None:
+            return []
+        steps = task_plan.implementation_steps
+        with self._lock:
+            return sorted(i for i in self.completed if i < len(steps) and steps[i] == self.tasks[i])
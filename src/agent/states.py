@@ -1,5 +1,5 @@
-from typing import Optional, List
-from pydantic import BaseModel, Field, ConfigDict
+from typing import Optional, List, TypedDict
+from pydantic import BaseModel, Field, ConfigDict, PrivateAttr
 
 
 class File(BaseModel):
@@ -23,16 +23,35 @@ class ImplementationTask(BaseModel):
     """A single implementation task for a file"""
     filepath: str = Field(description="The path to the file to be modified or created")
     task_description: str = Field(description="A detailed description of the task to be performed on the file, e.g. 'Create the main HTML structure with header, main content area, and footer', 'Implement user authentication logic with login and signup functions', etc.")
+    depends_on: List[str] = Field(default_factory=list, description="Paths of other files in the plan that must be implemented before this one, e.g. ['index.html'] for a script that queries its element IDs. Leave empty if the file does not use any other project file.")
 
 
 class TaskPlan(BaseModel):
     """Complete task plan with all implementation steps"""
     implementation_steps: List[ImplementationTask] = Field(description="A list of steps to be taken to implement the project, ordered by dependency")
     model_config = ConfigDict(extra="allow")
+    # Step dependency graph, built on first use by agent.graph.step_graph; never serialized
+    _step_graph: Optional[list] = PrivateAttr(default=None)
     
 
 class CoderState(BaseModel):
     """State management for the coder agent"""
     task_plan: TaskPlan = Field(description="The plan for the task to be implemented")
-    current_step_idx: int = Field(0, description="The index of the current step in the implementation steps")
-    current_file_content: Optional[str] = Field(None, description="The content of the file currently being edited or created")
\ No newline at end of file
+    current_step_idx: int = Field(0, description="The index of the first implementation step that has not been completed yet")
+    completed_steps: List[int] = Field(default_factory=list, description="Sorted indices of the implementation steps that have been completed")
+    current_file_content: Optional[str] = Field(None, description="The content of the file currently being edited or created")
+    supersteps: int = Field(0, description="Coder supersteps that have implemented steps so far")
+    max_supersteps: Optional[int] = Field(None, description="Coder supersteps the plan may take, derived from its steps; None for no limit")
+
+
+class AgentState(TypedDict, total=False):
+    """Graph state shared by the planner, architect and coder nodes"""
+    user_prompt: str
+    # Directory the coder writes to; PROJECT_ROOT when not given
+    workspace_root: str
+    # True updates the earlier generation in the workspace, regenerating only changed files
+    incremental: bool
+    plan: Plan
+    task_plan: TaskPlan
+    coder_state: CoderState
+    status: str
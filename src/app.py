@@ -2,17 +2,33 @@ import streamlit as st
 import sys
 import os
 import zipfile
-import io
+import hashlib
 import json
+import tempfile
 from pathlib import Path
 import traceback
-import shutil
+import uuid
+from urllib.parse import quote
+
+from dotenv import load_dotenv
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
-from agent.graph import agent
-from tools.tools import PROJECT_ROOT, init_project_root
+# Before any agent module, as they read their settings on import
+load_dotenv()
+
+# Only the workspace helpers are imported here: LangChain, LangGraph and the
+# Groq client load in load_agent(), once per server process.
+from tools.workspace import (
+    PROJECT_ROOT, WORKSPACES_DIR, WORKSPACE_MAX_AGE_HOURS, cleanup_workspaces, get_workspace, init_project_root,
+)
+from tools.preview import preview_url, stop_preview
+
+# Downloadable archives, one per distinct project content
+ZIP_CACHE_DIR = Path.cwd() / ".cache" / "zips"
+ZIP_CACHE_KEEP = 20
+FILES_PER_PAGE = 25
 
 # Page configuration
 st.set_page_config(
@@ -96,33 +112,70 @@ if 'generation_status' not in st.session_state:
     st.session_state.generation_status = None
 if 'plan_info' not in st.session_state:
     st.session_state.plan_info = None
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = None
+if 'workspace_root' not in st.session_state:
+    st.session_state.workspace_root = None
 
-def get_all_files(directory):
-    """Recursively get all files in a directory"""
-    files = {}
-    dir_path = Path(directory)
-    if not dir_path.exists():
-        return files
-    
-    for file_path in dir_path.rglob('*'):
-        if file_path.is_file():
-            relative_path = file_path.relative_to(dir_path)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                files[str(relative_path)] = content
-            except Exception as e:
-                files[str(relative_path)] = f"Error reading file: {str(e)}"
-    return files
-
-def create_zip_download(files_dict):
-    """Create a ZIP file from the generated files"""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for file_path, content in files_dict.items():
-            zip_file.writestr(file_path, content)
-    zip_buffer.seek(0)
-    return zip_buffer
+def get_all_files(workspace_root):
+    """Get the content hash of every generated file from the workspace index"""
+    workspace = get_workspace(Path(workspace_root))
+    return {relative_path: workspace.stat(relative_path).sha256 for relative_path in workspace.list()}
+
+def project_hash(files_dict):
+    """Hash identifying the content of the whole project"""
+    digest = hashlib.sha256()
+    for file_path in sorted(files_dict):
+        digest.update(f"{file_path}\0{files_dict[file_path]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def create_zip_download(workspace_root, files_dict):
+    """Return a ZIP of the generated files, built once per project content"""
+    ZIP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    zip_path = ZIP_CACHE_DIR / f"{project_hash(files_dict)}.zip"
+    # Another session may evict the archive between building and reading it
+    while True:
+        try:
+            return zip_path.read_bytes()
+        except FileNotFoundError:
+            build_zip(workspace_root, files_dict, zip_path)
+
+def build_zip(workspace_root, files_dict, zip_path):
+    """Write the ZIP of the generated files to zip_path and evict old archives"""
+    workspace = get_workspace(Path(workspace_root))
+    # Sessions building the same project each write their own temporary file
+    fd, tmp_path = tempfile.mkstemp(dir=ZIP_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for file_path in sorted(files_dict):
+                zip_file.write(workspace.path(file_path), file_path)
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    # Keep only the most recently built archives
+    archives = []
+    for archive in ZIP_CACHE_DIR.glob('*.zip'):
+        try:
+            archives.append((archive.stat().st_mtime, archive))
+        except FileNotFoundError:
+            pass
+    for _, old in sorted(archives, reverse=True)[ZIP_CACHE_KEEP:]:
+        if old != zip_path:
+            old.unlink(missing_ok=True)
+
+@st.cache_resource(show_spinner="Loading the agent...")
+def load_agent():
+    """Import agent.graph and compile the graph once; every rerun and session reuses it"""
+    from agent import graph
+    graph.get_agent()
+    return graph
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_file(workspace_root, relative_path, content_hash):
+    """Read a generated file once per content hash"""
+    return read_project_file(workspace_root, relative_path)
 
 def get_language_from_extension(filename):
     """Get syntax highlighting language from file extension"""
@@ -145,55 +198,155 @@ def get_language_from_extension(filename):
     ext = Path(filename).suffix
     return ext_map.get(ext, 'text')
 
-def generate_project(user_prompt, recursion_limit=100):
-    """Generate project using the agent"""
+def plan_to_info(plan):
+    """Extract the fields of a Plan shown in the UI"""
+    return {
+        'name': getattr(plan, 'name', 'Unknown'),
+        'description': getattr(plan, 'description', 'No description'),
+        'framework': getattr(plan, 'framework', 'Not specified'),
+        'language': getattr(plan, 'language', 'Not specified'),
+        'techstack': getattr(plan, 'techstack', 'Not specified'),
+        'features': getattr(plan, 'features', [])
+    }
+
+def read_project_file(workspace_root, relative_path):
+    """Read a single generated file"""
     try:
-        # Initialize project root
-        init_project_root()
-        
-        # Clear previous project
-        if PROJECT_ROOT.exists():
-            for item in PROJECT_ROOT.iterdir():
-                if item.is_file():
-                    item.unlink()
-                elif item.is_dir():
-                    shutil.rmtree(item)
-        
-        # Run the agent
-        with st.spinner('🤖 AI is analyzing your request...'):
-            result = agent.invoke(
-                {"user_prompt": user_prompt},
-                {"recursion_limit": recursion_limit}
-            )
+        content = get_workspace(Path(workspace_root)).read(relative_path)
+        return content if content is not None else "Error reading file: not found"
+    except Exception as e:
+        return f"Error reading file: {str(e)}"
+
+def load_run_metrics(run_id):
+    """Save the metrics of a run and return their per-node summary"""
+    try:
+        return json.loads(load_agent().save_run_metrics(run_id).read_text(encoding='utf-8'))['summary']
+    except Exception:
+        return None
+
+def generate_project(user_prompt, recursion_limit=None, max_concurrency=4, on_event=None, resume_run_id=None,
+                     update_workspace=None):
+    """Generate project using the agent, reporting progress as it happens.
+
+    ``on_event(kind, data)`` is called with ``"plan"``, ``"plan_reused"``,
+    ``"tasks"``, ``"plan_diff"``, ``"step_started"``, ``"step_completed"`` and ``"file"``
+    events while the graph runs. Files are collected from write events, so the project
+    directory is never rescanned. ``files`` maps each path to its content
+    hash; contents are loaded on demand with ``load_file``.
+
+    Every new run writes to its own directory below WORKSPACES_DIR, so
+    several sessions can generate at the same time. With ``resume_run_id``
+    the checkpointed run continues at its first incomplete step, in the
+    workspace it started in. With ``update_workspace`` a new run changes the
+    project of an earlier run in place, regenerating only the files whose
+    tasks changed.
+    """
+    files = {}
+    plan_info = None
+    result = {}
+    run_id = resume_run_id or uuid.uuid4().hex[:12]
+    workspace_root = WORKSPACES_DIR / run_id
+
+    def notify(kind, data):
+        if on_event:
+            on_event(kind, data)
+
+    try:
+        graph = load_agent()
+        # Remove the workspaces of runs nobody touched for a while
+        for removed in cleanup_workspaces(WORKSPACES_DIR, WORKSPACE_MAX_AGE_HOURS * 3600):
+            stop_preview(removed)
         
-        # Extract plan information
-        plan_info = None
-        if 'plan' in result:
-            plan = result['plan']
-            plan_info = {
-                'name': getattr(plan, 'name', 'Unknown'),
-                'description': getattr(plan, 'description', 'No description'),
-                'framework': getattr(plan, 'framework', 'Not specified'),
-                'language': getattr(plan, 'language', 'Not specified'),
-                'techstack': getattr(plan, 'techstack', 'Not specified'),
-                'features': getattr(plan, 'features', [])
+        if resume_run_id:
+            snapshot = graph.get_run_state(resume_run_id)
+            graph_input = None
+            result.update(snapshot.values)
+            # Runs started before per-run workspaces wrote to PROJECT_ROOT
+            workspace_root = Path(result.get('workspace_root') or PROJECT_ROOT)
+            if 'plan' in result:
+                plan_info = plan_to_info(result['plan'])
+                notify("plan", plan_info)
+            if 'task_plan' in result:
+                notify("tasks", result['task_plan'].implementation_steps)
+            if 'coder_state' in result:
+                for idx in result['coder_state'].completed_steps:
+                    notify("step_completed", {"step": idx})
+            # Files written before the run was interrupted
+            init_project_root(workspace_root)
+            get_workspace(workspace_root).refresh()
+            files.update(get_all_files(workspace_root))
+            for path, content_hash in files.items():
+                notify("file", {"path": path, "hash": content_hash})
+        else:
+            if update_workspace:
+                workspace_root = Path(update_workspace)
+            init_project_root(workspace_root)
+            if update_workspace:
+                # Files that are kept are not written again
+                get_workspace(workspace_root).refresh()
+                files.update(get_all_files(workspace_root))
+                for path, content_hash in files.items():
+                    notify("file", {"path": path, "hash": content_hash})
+            graph_input = {
+                "user_prompt": user_prompt, "workspace_root": str(workspace_root), "incremental": bool(update_workspace),
             }
+        workspace = get_workspace(workspace_root)
         
-        # Get all generated files
-        files = get_all_files(PROJECT_ROOT)
+        # Run the agent. subgraphs=True is needed for the write events
+        # emitted from inside the react coder.
+        for namespace, mode, chunk in graph.get_agent().stream(
+            graph_input,
+            graph.run_config(run_id, recursion_limit=recursion_limit, max_concurrency=max_concurrency),
+            stream_mode=["updates", "custom"],
+            subgraphs=True,
+        ):
+            if mode == "custom":
+                event = chunk.get("event")
+                if event == "file_written":
+                    files[chunk["path"]] = workspace.stat(chunk["path"]).sha256
+                    notify("file", {"path": chunk["path"], "hash": files[chunk["path"]]})
+                elif event in ("step_started", "step_completed", "plan_reused", "plan_diff"):
+                    notify(event, chunk)
+                continue
+            if namespace:
+                continue
+            for node_update in chunk.values():
+                if not node_update:
+                    continue
+                result.update(node_update)
+                if 'plan' in node_update:
+                    plan_info = plan_to_info(node_update['plan'])
+                    notify("plan", plan_info)
+                if 'task_plan' in node_update:
+                    notify("tasks", node_update['task_plan'].implementation_steps)
         
         return {
             'success': True,
+            'run_id': run_id,
+            'workspace_root': str(workspace_root),
             'files': files,
             'plan_info': plan_info,
-            'result': result
+            'result': result,
+            'metrics': load_run_metrics(run_id)
         }
     except Exception as e:
         return {
             'success': False,
+            'run_id': run_id,
+            'workspace_root': str(workspace_root),
             'error': str(e),
-            'traceback': traceback.format_exc()
+            'traceback': traceback.format_exc(),
+            'files': files,
+            'plan_info': plan_info,
+            'metrics': load_run_metrics(run_id)
         }
+    finally:
+        # A failed or stopped run leaves the writes of its last step buffered;
+        # the file list, preview and ZIP read them from disk.
+        try:
+            get_workspace(workspace_root).flush()
+        except OSError as e:
+            print(f"Could not write the buffered files of run {run_id}: {e}")
 
 # Header
 st.markdown("<h1>🚀 AI Project Generator</h1>", unsafe_allow_html=True)
@@ -202,14 +355,44 @@ st.markdown("<p class='subtitle'>Transform your ideas into complete projects wit
 # Sidebar
 with st.sidebar:
     st.header("⚙️ Settings")
+    auto_recursion_limit = st.checkbox(
+        "Derive recursion limit from the plan",
+        value=True,
+        help="Allow as many coder iterations as the task plan needs"
+    )
     recursion_limit = st.slider(
         "Recursion Limit",
         min_value=50,
         max_value=200,
         value=100,
         step=10,
+        disabled=auto_recursion_limit,
         help="Maximum number of agent iterations"
     )
+    if auto_recursion_limit:
+        recursion_limit = None
+    max_concurrency = st.slider(
+        "Parallel Files",
+        min_value=1,
+        max_value=8,
+        value=4,
+        help="Maximum number of independent files generated at the same time"
+    )
+    
+    st.markdown("---")
+    st.header("⏯️ Resume")
+    resume_run_id = st.text_input(
+        "Run ID",
+        value=st.session_state.run_id or "",
+        help="Continue an interrupted generation at its first incomplete step"
+    )
+    resume_btn = st.button("⏯️ Resume Run")
+    update_project = st.checkbox(
+        "Update the current project",
+        value=False,
+        disabled=not st.session_state.workspace_root,
+        help="Generate into the last project's workspace and regenerate only the files the new prompt changes"
+    )
     
     st.markdown("---")
     st.header("📖 Examples")
@@ -239,6 +422,19 @@ with st.sidebar:
 # Main content
 tab1, tab2, tab3 = st.tabs(["📝 Generate", "📁 Generated Files", "👁️ Preview"])
 
+# Filled with the files written so far while a generation is running
+with tab2:
+    live_files_area = st.empty()
+
+def render_task_list(area, tasks, task_status):
+    """Render the implementation steps with their live status"""
+    icons = {'pending': '⬜', 'running': '⏳', 'done': '✅'}
+    lines = [
+        f"{icons[task_status.get(i, 'pending')]} `{task.filepath}`"
+        for i, task in enumerate(tasks)
+    ]
+    area.markdown("**Implementation steps:**\n\n" + "\n".join(f"- {line}" for line in lines))
+
 with tab1:
     st.header("Describe Your Project")
     
@@ -254,15 +450,65 @@ with tab1:
     with col1:
         generate_btn = st.button("🎨 Generate Project", type="primary")
     
-    if generate_btn:
-        if not user_prompt.strip():
+    if generate_btn or resume_btn:
+        if generate_btn and not user_prompt.strip():
             st.error("⚠️ Please enter a project description!")
+        elif resume_btn and not resume_run_id.strip():
+            st.error("⚠️ Please enter the ID of the run to resume!")
         else:
-            # Generate project
-            with st.spinner('🔮 Generating your project... This may take a minute...'):
-                result = generate_project(user_prompt, recursion_limit)
+            # Generate project, showing progress as the graph streams it
+            status = st.status('🔮 Generating your project... This may take a minute...', expanded=True)
+            with status:
+                plan_area = st.empty()
+                tasks_area = st.empty()
+                files_area = st.empty()
+            st.session_state.project_files = {}
+            progress = {'tasks': [], 'status': {}}
+
+            def on_event(kind, data):
+                if kind == 'plan':
+                    status.update(label='🏗️ Plan ready, breaking it into tasks...')
+                    plan_area.markdown(f"**{data['name']}** — {data['description']}  \n"
+                                       f"Tech stack: {data['techstack']}")
+                elif kind == 'plan_reused':
+                    with status:
+                        st.caption(f"♻️ Reusing the plan of a similar earlier prompt "
+                                   f"({data['similarity']:.0%} similar): {data['prompt']}")
+                elif kind == 'plan_diff':
+                    kept = set(data['kept'])
+                    for i, task in enumerate(progress['tasks']):
+                        if task.filepath in kept:
+                            progress['status'][i] = 'done'
+                    render_task_list(tasks_area, progress['tasks'], progress['status'])
+                    with status:
+                        st.caption(f"♻️ Keeping {len(kept)} unchanged files, regenerating "
+                                   f"{len(data['added']) + len(data['changed']) + len(data['dependent'])}")
+                elif kind == 'tasks':
+                    status.update(label='💻 Writing files...')
+                    progress['tasks'] = data
+                    render_task_list(tasks_area, progress['tasks'], progress['status'])
+                elif kind in ('step_started', 'step_completed'):
+                    progress['status'][data['step']] = 'running' if kind == 'step_started' else 'done'
+                    render_task_list(tasks_area, progress['tasks'], progress['status'])
+                elif kind == 'file':
+                    st.session_state.project_files[data['path']] = data['hash']
+                    written = sorted(st.session_state.project_files)
+                    files_area.caption(f"📄 {len(written)} files written, latest: {data['path']}")
+                    live_files_area.markdown(
+                        f"**{len(written)} files written so far:**\n\n" + "\n".join(f"- `{f}`" for f in written)
+                    )
+
+            result = generate_project(
+                user_prompt, recursion_limit, max_concurrency, on_event=on_event,
+                resume_run_id=resume_run_id.strip() if resume_btn else None,
+                update_workspace=st.session_state.workspace_root if update_project and not resume_btn else None
+            )
+            live_files_area.empty()
+            st.session_state.run_id = result['run_id']
+            st.session_state.workspace_root = result['workspace_root']
             
             if result['success']:
+                status.update(label='✅ Generation complete', state='complete', expanded=False)
                 st.session_state.generated_project = result
                 st.session_state.project_files = result['files']
                 st.session_state.plan_info = result.get('plan_info')
@@ -271,6 +517,10 @@ with tab1:
                 st.success("✅ Project generated successfully!")
                 st.balloons()
                 
+                if result.get('metrics'):
+                    with st.expander("📊 Run Metrics"):
+                        st.json(result['metrics'])
+                
                 # Display plan information
                 if st.session_state.plan_info:
                     st.markdown("<div class='success-box'>", unsafe_allow_html=True)
@@ -295,8 +545,13 @@ with tab1:
                     st.markdown("</div>", unsafe_allow_html=True)
                 
             else:
+                status.update(label='❌ Generation failed', state='error')
+                # Keep whatever was written before the failure
+                st.session_state.project_files = result['files']
+                st.session_state.plan_info = result.get('plan_info')
                 st.session_state.generation_status = 'error'
                 st.error(f"❌ Error generating project: {result['error']}")
+                st.info(f"⏯️ Run ID `{result['run_id']}` — resume it from the sidebar to continue where it stopped.")
                 with st.expander("View Error Details"):
                     st.code(result['traceback'])
 
@@ -305,10 +560,10 @@ with tab2:
     
     if st.session_state.project_files:
         # Download button
-        zip_buffer = create_zip_download(st.session_state.project_files)
+        zip_data = create_zip_download(st.session_state.workspace_root, st.session_state.project_files)
         st.download_button(
             label="📦 Download Project as ZIP",
-            data=zip_buffer,
+            data=zip_data,
             file_name=f"{st.session_state.plan_info.get('name', 'project').replace(' ', '_')}.zip" if st.session_state.plan_info else "project.zip",
             mime="application/zip",
             type="primary"
@@ -319,12 +574,23 @@ with tab2:
         # Display files
         st.subheader(f"📂 Files ({len(st.session_state.project_files)})")
         
-        # File tree view
-        for file_path in sorted(st.session_state.project_files.keys()):
-            with st.expander(f"📄 {file_path}"):
-                content = st.session_state.project_files[file_path]
-                language = get_language_from_extension(file_path)
-                st.code(content, language=language, line_numbers=True)
+        # File tree view, one page at a time; only the opened file is read
+        file_filter = st.text_input("Filter files", placeholder="e.g. src/ or .css")
+        file_paths = [f for f in sorted(st.session_state.project_files) if file_filter.lower() in f.lower()]
+        page_count = max(1, -(-len(file_paths) // FILES_PER_PAGE))
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key=f"files_page:{file_filter}") if page_count > 1 else 1
+        page_paths = file_paths[(page - 1) * FILES_PER_PAGE:page * FILES_PER_PAGE]
+        
+        if page_paths:
+            file_path = st.radio(
+                "Files",
+                page_paths,
+                label_visibility="collapsed"
+            )
+            content = load_file(st.session_state.workspace_root, file_path, st.session_state.project_files[file_path])
+            st.code(content, language=get_language_from_extension(file_path), line_numbers=True)
+        else:
+            st.caption("No files match the filter.")
     else:
         st.info("👈 Generate a project first to see the files here!")
 
@@ -339,40 +605,33 @@ with tab3:
         if has_html:
             st.info("🌐 Web project detected!")
             
-            if has_index:
-                st.markdown("### Preview of index.html")
-                
-                # Create a simple preview using iframe
-                html_content = st.session_state.project_files['index.html']
-                
-                # Inject CSS if exists
-                if 'style.css' in st.session_state.project_files or 'styles.css' in st.session_state.project_files:
-                    css_file = 'style.css' if 'style.css' in st.session_state.project_files else 'styles.css'
-                    css_content = st.session_state.project_files[css_file]
-                    html_content = html_content.replace('</head>', f'<style>{css_content}</style></head>')
-                
-                # Inject JS if exists
-                if 'script.js' in st.session_state.project_files or 'app.js' in st.session_state.project_files:
-                    js_file = 'script.js' if 'script.js' in st.session_state.project_files else 'app.js'
-                    js_content = st.session_state.project_files[js_file]
-                    html_content = html_content.replace('</body>', f'<script>{js_content}</script></body>')
-                
-                # Display preview
-                st.components.v1.html(html_content, height=600, scrolling=True)
-                
-                st.markdown("---")
-                st.caption("💡 Tip: Download the project and open it in your browser for full functionality")
-            else:
-                st.warning("⚠️ No index.html found. Preview is only available for projects with an index.html file.")
-                st.write("**Available HTML files:**")
-                for f in st.session_state.project_files.keys():
-                    if f.endswith('.html'):
-                        st.write(f"  • {f}")
+            html_files = sorted(f for f in st.session_state.project_files if f.endswith('.html'))
+            if not has_index:
+                st.warning("⚠️ No index.html found, choose the page to preview.")
+            page = st.selectbox(
+                "Page",
+                html_files,
+                index=html_files.index('index.html') if has_index else 0,
+                key='preview_page'
+            )
+            st.markdown(f"### Preview of {page}")
+            
+            # The workspace is served over HTTP, so every stylesheet, script,
+            # image and page the project links to loads as in a browser. The
+            # version changes with the content and reloads the frame; unchanged
+            # files are revalidated by their ETag rather than downloaded again.
+            url = preview_url(Path(st.session_state.workspace_root))
+            version = project_hash(st.session_state.project_files)[:12]
+            st.components.v1.iframe(f"{url}{quote(page)}?v={version}", height=600, scrolling=True)
+            st.caption(f"🔗 Served from {url}")
+            
+            st.markdown("---")
+            st.caption("💡 Tip: Download the project and open it in your browser for full functionality")
         else:
             st.info("ℹ️ Preview is only available for web projects (HTML/CSS/JS)")
             
             if st.session_state.plan_info:
-                framework = st.session_state.plan_info.get('framework', '').lower()
+                framework = (st.session_state.plan_info.get('framework') or '').lower()
                 if any(fw in framework for fw in ['react', 'next', 'vue', 'angular', 'svelte']):
                     st.markdown("""
                     **To run this project:**
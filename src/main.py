@@ -1,24 +1,150 @@
 import argparse
+import asyncio
 import sys
 import traceback
+import uuid
+from pathlib import Path
 
-from agent.graph import agent
+from dotenv import load_dotenv
+
+# Before any agent module, as they read their settings on import
+load_dotenv()
+
+from tools.workspace import PROJECT_ROOT  # noqa: E402
+
+
+async def ainvoke(graph_input, config):
+    from agent.graph import async_checkpointer, build_agent
+
+    async with async_checkpointer() as saver:
+        return await build_agent(saver).ainvoke(graph_input, config)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Run engineering project planner")
-    parser.add_argument("--recursion-limit", "-r", type=int, default=100,
-                        help="Recursion limit for processing (default: 100)")
+    parser.add_argument("--recursion-limit", "-r", type=int, default=None,
+                        help="Recursion limit for processing (default: derived from the task plan)")
+    parser.add_argument("--max-concurrency", "-c", type=int, default=None,
+                        help="Maximum number of files coded in parallel (default: $CODER_MAX_CONCURRENCY or 4)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Drive the graph with agent.ainvoke on an asyncio event loop")
+    parser.add_argument("--run-id", default=None,
+                        help="Id under which a new run is checkpointed (default: random)")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None,
+                        help="Resume an interrupted run at its first incomplete step")
+    parser.add_argument("--workspace", "-w", default=str(PROJECT_ROOT),
+                        help="Directory the project is generated in (default: ./generated_project)")
+    parser.add_argument("--update", action="store_true",
+                        help="Change the project already generated in the workspace, regenerating only affected files")
+    parser.add_argument("--batch", metavar="FILE", default=None,
+                        help="Generate every prompt of a .jsonl or text file instead of asking for one")
+    parser.add_argument("--batch-concurrency", type=int, default=2,
+                        help="Prompts generated at the same time in batch mode (default: 2)")
+    parser.add_argument("--output-dir", "-o", default="batch_output",
+                        help="Batch mode: directory for the projects and summary.json (default: ./batch_output)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Batch mode: stop a prompt after this many seconds")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port while the run is in progress")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="CASSETTE", default=None,
+                                help="Record every model and tool call of the run to this file")
+    cassette_group.add_argument("--replay", metavar="CASSETTE", default=None,
+                                help="Answer every model call from a recorded cassette, without network access")
 
     args = parser.parse_args()
+    if args.batch and (args.record or args.replay):
+        parser.error("--record and --replay apply to a single run, not to --batch")
+
+    # LangChain, LangGraph and the Groq client are loaded only once the
+    # arguments are known to be valid, so --help and usage errors are instant.
+    from agent.cassette import Cassette, use_cassette
+    from agent.graph import (
+        get_agent, get_llm_cache, get_plan_store, get_run_state, run_config, save_run_metrics,
+    )
+    from agent.metrics import start_metrics_server
+    from agent.runner import load_prompts, run_batch
 
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    run_id = None
     try:
-        user_prompt = input("Enter your project prompt: ")
-        result = agent.invoke(
-            {"user_prompt": user_prompt},
-            {"recursion_limit": args.recursion_limit}
-        )
+        config = {"recursion_limit": args.recursion_limit}
+        if args.max_concurrency:
+            config["max_concurrency"] = args.max_concurrency
+
+        if args.batch:
+            prompts = load_prompts(Path(args.batch))
+            print(f"Generating {len(prompts)} projects into {args.output_dir}")
+            summary = run_batch(
+                prompts, Path(args.output_dir), concurrency=args.batch_concurrency,
+                recursion_limit=args.recursion_limit, max_concurrency=args.max_concurrency, timeout=args.timeout,
+                incremental=args.update,
+            )
+            print(f"{summary['succeeded']}/{summary['prompts']} succeeded in {summary['duration']:.1f}s, "
+                  f"{summary['prompt_tokens'] + summary['completion_tokens']} tokens. "
+                  f"Summary: {Path(args.output_dir) / 'summary.json'}")
+            plan_store = get_plan_store()
+            if plan_store is not None:
+                print("Plan store:", plan_store.stats())
+            if summary["failed"]:
+                sys.exit(1)
+            return
+
+        cassette = None
+        if args.record or args.replay:
+            cassette = Cassette(args.record or args.replay, "record" if args.record else "replay", args.workspace)
+            config["callbacks"] = [cassette.callback_handler()]
+
+        if args.resume:
+            snapshot = get_run_state(args.resume)
+            if not snapshot.next:
+                print(f"Run {args.resume} has already finished.")
+                print("Final State:", snapshot.values)
+                return
+            run_id = args.resume
+            # A None input continues from the last checkpoint, so the
+            # planner and architect are not run again.
+            graph_input = None
+            print(f"Resuming run {run_id} at: {', '.join(snapshot.next)}")
+        else:
+            if args.run_id:
+                try:
+                    get_run_state(args.run_id)
+                except ValueError:
+                    pass
+                else:
+                    # New input would be merged into the old run's state, which already has its plans
+                    parser.error(f"run {args.run_id} already has checkpoints; continue it with "
+                                 f"--resume {args.run_id} or choose another --run-id")
+            run_id = args.run_id or uuid.uuid4().hex[:12]
+            # A replay asks the recorded prompt again
+            prompt = cassette.prompt if cassette is not None else None
+            prompt = prompt or input("Enter your project prompt: ")
+            if cassette is not None:
+                cassette.prompt = prompt
+            graph_input = {
+                "user_prompt": prompt,
+                "workspace_root": str(Path(args.workspace).resolve()),
+                "incremental": args.update,
+            }
+            print(f"Run id: {run_id} (resume with --resume {run_id})")
+
+        config = run_config(run_id, **config)
+        with use_cassette(cassette):
+            if args.use_async:
+                result = asyncio.run(ainvoke(graph_input, config))
+            else:
+                result = get_agent().invoke(graph_input, config)
         print("Final State:", result)
+        if cassette is not None:
+            print("Cassette:", cassette.stats())
+        llm_cache, plan_store = get_llm_cache(), get_plan_store()
+        if llm_cache is not None:
+            print("LLM cache:", llm_cache.stats())
+        if plan_store is not None:
+            print("Plan store:", plan_store.stats())
     except KeyboardInterrupt:
         print("\nOperation cancelled by user.")
         sys.exit(0)
@@ -26,7 +152,10 @@ def main():
         traceback.print_exc()
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if run_id:
+            print(f"Metrics: {save_run_metrics(run_id)}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
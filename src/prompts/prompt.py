@@ -1,4 +1,16 @@
-def planner_prompt(user_prompt: str) -> str:
+def previous_plan_section(previous: str, kind: str) -> str:
+    """Asks for a plan that changes only what the new request needs, so unchanged files are not regenerated."""
+    return f"""
+The project already exists and was generated from this {kind}:
+{previous}
+
+Change only what the request needs. Keep every file path, and the wording of
+everything the request does not affect, EXACTLY as it is above: files whose
+{kind} entries are unchanged are kept as they are instead of being written again.
+"""
+
+
+def planner_prompt(user_prompt: str, previous_plan: str = None) -> str:
     PLANNER_PROMPT = f"""
 You are the PLANNER agent. Convert the user prompt into a COMPLETE engineering project plan.
 
@@ -52,10 +64,12 @@ Analyze the above request carefully and create a plan that:
 - Has clear, specific features
 - Uses the appropriate tech stack
     """
+    if previous_plan:
+        PLANNER_PROMPT += previous_plan_section(previous_plan, "plan")
     return PLANNER_PROMPT
 
 
-def architect_prompt(plan: str) -> str:
+def architect_prompt(plan: str, previous_task_plan: str = None) -> str:
     ARCHITECT_PROMPT = f"""
 You are the ARCHITECT agent. Given this project plan, break it down into explicit engineering tasks.
 
@@ -68,6 +82,9 @@ RULES:
     * Mention how this task depends on or will be used by previous tasks
     * Include integration details: imports, expected function signatures, data flow
 - Each step must be SELF-CONTAINED but also carry FORWARD the relevant context from earlier tasks.
+- Fill in depends_on for every task with the paths of the files it imports, links or references.
+    * Use exact file paths from the plan; leave it empty for files that stand on their own
+    * Tasks without dependencies between them are implemented IN PARALLEL, so never leave out a real dependency
 - Be SPECIFIC about implementation details:
     * For HTML: specify structure, IDs, classes
     * For CSS: specify color schemes, layouts, responsive design
@@ -86,6 +103,8 @@ Project Plan:
 
 Create a detailed implementation plan with clear, actionable tasks.
     """
+    if previous_task_plan:
+        ARCHITECT_PROMPT += previous_plan_section(previous_task_plan, "task plan")
     return ARCHITECT_PROMPT
 
 
@@ -95,9 +114,10 @@ You are the CODER agent. You implement specific engineering tasks with precision
 
 AVAILABLE TOOLS (use EXACT names):
 1. write_file(path, content) - Writes content to a file at the specified path
-2. read_file(path) - Reads content from a file at the specified path
-3. list_files(directory) - Lists all files in the specified directory
-4. get_current_directory() - Returns the current working directory
+2. edit_file(path, edits) - Changes an existing file with a list of {search, replace} hunks
+3. read_file(path) - Reads content from a file at the specified path
+4. list_files(directory) - Lists all files in the specified directory
+5. get_current_directory() - Returns the current working directory
 
 CRITICAL RULES:
 - ONLY use the tools listed above - NO OTHER TOOLS EXIST
@@ -120,10 +140,13 @@ CODING GUIDELINES:
 7. Test integration points carefully
 
 WORKFLOW:
-1. Read existing files if updating (use read_file)
+1. Use the symbol list in the task for names defined in other files (exports, classes,
+   element ids, CSS classes); only call read_file/list_files when you need more than it shows
 2. Implement the complete solution
-3. Write the file with full content (use write_file)
-4. Ensure the code works with other files in the project
+3. Write new files with full content (use write_file)
+4. Change existing files with edit_file: each search text must match the file exactly once,
+   so include a few unchanged lines around the change. Only send the parts that change.
+5. Ensure the code works with other files in the project
 
 Remember: Quality over speed. Write code you'd be proud to ship to production.
     """
@@ -0,0 +1,361 @@
+"""HTTP job server for project generation.
+
+    POST   /jobs                     {"prompt": ..., "recursion_limit"?, "max_concurrency"?, "timeout"?}
+    GET    /jobs                     all known jobs
+    GET    /jobs/<id>                status and summary of a job
+    GET    /jobs/<id>/events         progress as server-sent events, until the job ends
+    DELETE /jobs/<id>                cancel a queued or running job
+    GET    /jobs/<id>/files          generated files with size and hash
+    GET    /jobs/<id>/files/<path>   content of one file
+    GET    /jobs/<id>/journal        files the job wrote and steps it completed, in order
+    GET    /jobs/<id>/archive        ZIP of the generated project
+    GET    /healthz, /metrics
+
+Jobs run on a bounded thread pool. Submissions beyond the pool size plus
+SERVER_QUEUE_DEPTH are rejected with 429, so callers back off instead of
+piling up work the server cannot finish.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+from dotenv import load_dotenv
+
+# Before any agent module, as they read their settings on import
+load_dotenv()
+
+from agent.graph import get_agent  # noqa: E402
+from agent.metrics import render_prometheus  # noqa: E402
+from agent.runner import run_generation  # noqa: E402
+from tools.workspace import (  # noqa: E402
+    WORKSPACES_DIR, WORKSPACE_MAX_AGE_HOURS, cleanup_workspaces, get_workspace, read_journal,
+)
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "2"))
+SERVER_QUEUE_DEPTH = int(os.getenv("SERVER_QUEUE_DEPTH", "16"))
+SERVER_JOB_TIMEOUT = float(os.getenv("SERVER_JOB_TIMEOUT", "1800"))
+# Finished jobs kept in memory; older ones are forgotten (their files stay
+# until the workspace cleanup removes them).
+SERVER_MAX_FINISHED_JOBS = 1000
+
+FINISHED = ("succeeded", "failed", "cancelled", "timed_out")
+
+
+class Job:
+    """One generation request and everything reported about it."""
+
+    def __init__(self, prompt: str, recursion_limit: Optional[int], max_concurrency: Optional[int], timeout: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.prompt = prompt
+        self.recursion_limit = recursion_limit
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.workspace_root = WORKSPACES_DIR / self.id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.summary: Optional[dict] = None
+        self.events: List[dict] = []
+        self.cancel = threading.Event()
+        self.changed = threading.Condition()
+
+    def add_event(self, event: dict) -> None:
+        with self.changed:
+            self.events.append({**event, "time": time.time()})
+            self.changed.notify_all()
+
+    def set_status(self, status: str) -> None:
+        with self.changed:
+            self.status = status
+            if status == "running":
+                self.started_at = time.time()
+            elif status in FINISHED:
+                self.finished_at = time.time()
+        self.add_event({"event": "status", "status": status})
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "prompt": self.prompt,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timeout": self.timeout,
+            "events": len(self.events),
+            "summary": self.summary,
+        }
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobManager:
+    """Runs jobs on a bounded pool and rejects work beyond the queue depth."""
+
+    def __init__(self, workers: int = SERVER_WORKERS, queue_depth: int = SERVER_QUEUE_DEPTH):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def active(self) -> int:
+        return sum(1 for job in list(self.jobs.values()) if job.status not in FINISHED)
+
+    def submit(self, prompt: str, recursion_limit: Optional[int] = None, max_concurrency: Optional[int] = None,
+               timeout: float = SERVER_JOB_TIMEOUT) -> Job:
+        job = Job(prompt, recursion_limit, max_concurrency, timeout)
+        with self._lock:
+            if self.active() >= self.workers + self.queue_depth:
+                raise QueueFull(f"{self.active()} jobs queued or running")
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        job.add_event({"event": "status", "status": "queued"})
+        self._pool.submit(self._run, job)
+        return job
+
+    def cancel(self, job: Job) -> None:
+        job.cancel.set()
+        with job.changed:
+            queued = job.status == "queued"
+        if queued:
+            job.set_status("cancelled")
+
+    def _run(self, job: Job) -> None:
+        if job.cancel.is_set():
+            return
+        job.set_status("running")
+        status = "failed"
+        try:
+            cleanup_workspaces(WORKSPACES_DIR, WORKSPACE_MAX_AGE_HOURS * 3600)
+            job.summary = run_generation(
+                job.prompt, job.id, job.workspace_root,
+                recursion_limit=job.recursion_limit,
+                max_concurrency=job.max_concurrency,
+                on_event=job.add_event,
+                cancel=job.cancel,
+                timeout=job.timeout,
+            )
+            status = job.summary["status"]
+        except Exception as e:
+            print(f"Job {job.id} failed: {type(e).__name__}: {e}")
+            job.summary = {"run_id": job.id, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+        finally:
+            # A job must never stay "running", or it holds a queue slot forever
+            job.set_status(status)
+
+    def _forget_old_jobs(self) -> None:
+        finished = [job for job in list(self.jobs.values()) if job.status in FINISHED]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:-SERVER_MAX_FINISHED_JOBS]:
+            del self.jobs[job.id]
+
+
+manager = JobManager()
+
+
+def _positive_int(value, name: str) -> int:
+    """``value`` as an int of at least 1; raises ValueError for anything else (bools, 2.5, "3")."""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, data, headers: Optional[dict] = None) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"), "application/json", headers)
+
+    def _error(self, status: int, message: str, headers: Optional[dict] = None) -> None:
+        self._json(status, {"error": message}, headers)
+
+    def _job(self):
+        """Returns the job addressed by /jobs/<id>/... and the rest of the path, or sends 404."""
+        parts = [unquote(p) for p in urlparse(self.path).path.strip("/").split("/")]
+        job = manager.jobs.get(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            self._error(404, "not found")
+        return job, parts[2:]
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            self._error(404, "not found")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            prompt = body["prompt"]
+            if not isinstance(prompt, str) or not prompt.strip():
+                raise ValueError("prompt must be a non-empty string")
+            recursion_limit = body.get("recursion_limit")
+            if recursion_limit is not None:
+                recursion_limit = _positive_int(recursion_limit, "recursion_limit")
+            max_concurrency = body.get("max_concurrency")
+            if max_concurrency is not None:
+                max_concurrency = _positive_int(max_concurrency, "max_concurrency")
+            timeout = float(body.get("timeout", SERVER_JOB_TIMEOUT))
+            if not timeout > 0:
+                raise ValueError("timeout must be a positive number of seconds")
+            job = manager.submit(
+                prompt,
+                recursion_limit=recursion_limit,
+                max_concurrency=max_concurrency,
+                timeout=timeout,
+            )
+        except QueueFull as e:
+            self._error(429, str(e), {"Retry-After": "30"})
+            return
+        except (KeyError, ValueError, TypeError) as e:
+            self._error(400, f"invalid request: {e}")
+            return
+        self._json(202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+
+    def do_DELETE(self):
+        job, rest = self._job()
+        if job is None:
+            return
+        if rest:
+            self._error(404, "not found")
+            return
+        manager.cancel(job)
+        self._json(202, job.to_dict())
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/healthz":
+            self._json(200, {"status": "ok", "active_jobs": manager.active(), "workers": manager.workers,
+                             "queue_depth": manager.queue_depth})
+            return
+        if path == "/metrics":
+            self._send(200, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            return
+        if path == "/jobs":
+            self._json(200, [job.to_dict() for job in list(manager.jobs.values())])
+            return
+
+        job, rest = self._job()
+        if job is None:
+            return
+        if not rest:
+            self._json(200, job.to_dict())
+        elif rest == ["events"]:
+            self._stream_events(job)
+        elif rest == ["files"]:
+            workspace = get_workspace(job.workspace_root)
+            self._json(200, [
+                {"path": path, "size": workspace.stat(path).size, "sha256": workspace.stat(path).sha256}
+                for path in workspace.list()
+            ])
+        elif rest[0] == "files":
+            self._send_file(job, "/".join(rest[1:]))
+        elif rest == ["journal"]:
+            self._json(200, read_journal(job.workspace_root, job.id))
+        elif rest == ["archive"]:
+            self._send_archive(job)
+        else:
+            self._error(404, "not found")
+
+    def _send_file(self, job: Job, relative_path: str) -> None:
+        try:
+            content = get_workspace(job.workspace_root).read(relative_path)
+        except ValueError as e:
+            self._error(400, str(e))
+            return
+        if content is None:
+            self._error(404, f"no file {relative_path!r}")
+            return
+        self._send(200, content.encode("utf-8"), "text/plain; charset=utf-8")
+
+    def _send_archive(self, job: Job) -> None:
+        if job.status not in FINISHED:
+            self._error(409, f"job is {job.status}")
+            return
+        workspace = get_workspace(job.workspace_root)
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as buffer:
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for path in workspace.list():
+                    archive.write(workspace.path(path), path)
+            buffer.seek(0)
+            body = buffer.read()
+        self._send(200, body, "application/zip",
+                   {"Content-Disposition": f'attachment; filename="{job.id}.zip"'})
+
+    def _stream_events(self, job: Job) -> None:
+        """Sends the job's events as server-sent events until it has finished."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        while True:
+            with job.changed:
+                while sent == len(job.events) and job.status not in FINISHED:
+                    job.changed.wait(timeout=15)
+                    if sent == len(job.events):
+                        break
+                events = job.events[sent:]
+                done = job.status in FINISHED
+            try:
+                if not events:
+                    # Keeps proxies from closing an idle stream
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            sent += len(events)
+            if done and sent == len(job.events):
+                return
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve project generation jobs over HTTP")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    args = parser.parse_args()
+
+    # Compile the graph up front rather than in the first job
+    get_agent()
+    server = ThreadingHTTPServer((args.host, args.port), _JobHandler)
+    server.daemon_threads = True
+    print(f"Serving jobs on http://{args.host}:{args.port} "
+          f"({manager.workers} workers, queue depth {manager.queue_depth})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+        for job in list(manager.jobs.values()):
+            manager.cancel(job)
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import mimetypes
+import os
+import pathlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import unquote, urlparse
+
+from tools.workspace import Workspace, get_workspace
+
+# Interface the preview servers listen on; it must be reachable from the
+# browser that shows the app.
+PREVIEW_HOST = os.getenv("PREVIEW_HOST", "127.0.0.1")
+
+# Types the mimetypes module gets wrong or does not know on some systems
+_MIME_TYPES = {
+    ".js": "text/javascript", ".mjs": "text/javascript", ".jsx": "text/javascript", ".css": "text/css",
+    ".html": "text/html", ".htm": "text/html", ".json": "application/json", ".map": "application/json",
+    ".svg": "image/svg+xml", ".wasm": "application/wasm", ".webmanifest": "application/manifest+json",
+    ".md": "text/markdown", ".txt": "text/plain", ".ico": "image/x-icon", ".webp": "image/webp",
+    ".woff": "font/woff", ".woff2": "font/woff2",
+}
+
+
+def content_type(path: str) -> str:
+    """MIME type of a project file; text types are served as UTF-8."""
+    mime = _MIME_TYPES.get(os.path.splitext(path)[1].lower()) or mimetypes.guess_type(path)[0]
+    mime = mime or "application/octet-stream"
+    if mime.startswith("text/") or mime in ("application/json", "image/svg+xml", "application/manifest+json"):
+        mime += "; charset=utf-8"
+    return mime
+
+
+def _handler(workspace: Workspace):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._serve(send_body=True)
+
+        def do_HEAD(self):
+            self._serve(send_body=False)
+
+        def _error(self, status: int, message: str) -> None:
+            body = message.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _serve(self, send_body: bool) -> None:
+            path = unquote(urlparse(self.path).path).lstrip("/")
+            try:
+                rel = workspace.relative(path)
+                if rel != "." and workspace.is_dir(rel) and not path.endswith("/"):
+                    # Relative links of the directory's index.html resolve below it
+                    self.send_response(301)
+                    self.send_header("Location", f"/{rel}/")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if rel == "." or workspace.is_dir(rel):
+                    rel = "index.html" if rel == "." else f"{rel}/index.html"
+                entry = workspace.stat(rel)
+            except ValueError:
+                self._error(404, "not found")
+                return
+            if entry is None:
+                self._error(404, f"no file {path!r}")
+                return
+
+            # The index hash is the ETag, so only changed files are downloaded again
+            etag = f'"{entry.sha256}"'
+            try:
+                mtime = os.stat(workspace.path(rel)).st_mtime
+            except OSError:
+                # Written but not flushed yet
+                mtime = None
+            if self._not_modified(etag, mtime):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            try:
+                content = workspace.read(rel)
+                body = content.encode("utf-8")
+            except UnicodeDecodeError:
+                body = workspace.path(rel).read_bytes()
+            except OSError:
+                self._error(404, f"no file {path!r}")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type(rel))
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            if mtime is not None:
+                self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+            # Cached, but checked on every load, so edits show up at once
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+
+        def _not_modified(self, etag: str, mtime: Optional[float]) -> bool:
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match is not None:
+                return etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+            since = self.headers.get("If-Modified-Since")
+            if since is None or mtime is None:
+                return False
+            try:
+                return int(mtime) <= parsedate_to_datetime(since).timestamp()
+            except (TypeError, ValueError):
+                return False
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+_servers: Dict[pathlib.Path, ThreadingHTTPServer] = {}
+_servers_lock = threading.Lock()
+
+
+def preview_url(root: pathlib.Path) -> str:
+    """URL of the static file server of the workspace at ``root``, started on first use.
+
+    Each workspace gets its own server on a free port, so pages can use
+    root-relative paths like ``/css/main.css``.
+    """
+    key = pathlib.Path(root).resolve()
+    workspace = get_workspace(key)
+    with _servers_lock:
+        server = _servers.get(key)
+        if server is None:
+            server = ThreadingHTTPServer((PREVIEW_HOST, 0), _handler(workspace))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _servers[key] = server
+    host = "localhost" if PREVIEW_HOST in ("0.0.0.0", "") else PREVIEW_HOST
+    return f"http://{host}:{server.server_address[1]}/"
+
+
+def stop_preview(root: pathlib.Path) -> None:
+    """Stops the preview server of ``root``, e.g. once its workspace was deleted."""
+    with _servers_lock:
+        server = _servers.pop(pathlib.Path(root).resolve(), None)
+    if server is not None:
+        server.shutdown()
+        server.server_close()
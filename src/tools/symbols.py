@@ -0,0 +1,138 @@
+import posixpath
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+_JS_EXTENSIONS = {".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".vue", ".svelte"}
+_CSS_EXTENSIONS = {".css", ".scss", ".sass", ".less"}
+_HTML_EXTENSIONS = {".html", ".htm"}
+
+_JS_EXPORT = re.compile(
+    r"^\s*export\s+(?:default\s+)?(?:async\s+)?(?:function\*?|class|const|let|var|interface|type|enum)\s+([A-Za-z_$][\w$]*)",
+    re.M,
+)
+_JS_EXPORT_LIST = re.compile(r"^\s*export\s*\{([^}]*)\}", re.M)
+_JS_MODULE_EXPORTS = re.compile(r"module\.exports(?:\.([A-Za-z_$][\w$]*))?\s*=\s*(?:\{([^}]*)\})?")
+_JS_CLASS = re.compile(r"^\s*(?:export\s+(?:default\s+)?)?class\s+([A-Za-z_$][\w$]*)", re.M)
+_JS_IMPORT = re.compile(r"""(?:import\s+(?:[^'"]*?\s+from\s+)?|require\(\s*|import\(\s*)['"]([^'"]+)['"]""")
+_JS_DOM_ID = re.compile(r"""getElementById\(\s*['"]([\w-]+)['"]|querySelector(?:All)?\(\s*['"]#([\w-]+)""")
+_JS_DOM_CLASS = re.compile(r"""classList\.\w+\(\s*['"]([\w-]+)['"]|querySelector(?:All)?\(\s*['"]\.([\w-]+)""")
+
+_HTML_ID = re.compile(r"""\bid\s*=\s*['"]([^'"]+)['"]""", re.I)
+_HTML_CLASS = re.compile(r"""\bclass(?:Name)?\s*=\s*['"]([^'"]+)['"]""", re.I)
+_HTML_ASSET = re.compile(r"""<(?:script|link)\b[^>]*?\b(?:src|href)\s*=\s*['"]([^'"]+)['"]""", re.I)
+
+_CSS_BLOCK = re.compile(r"\{[^{}]*\}")
+_CSS_CLASS = re.compile(r"\.(-?[A-Za-z_][\w-]*)")
+_CSS_ID = re.compile(r"#(-?[A-Za-z_][\w-]*)")
+_CSS_IMPORT = re.compile(r"""@import\s+(?:url\()?['"]?([^'")\s;]+)""")
+
+_PY_DEF = re.compile(r"^(?:async\s+)?def\s+([A-Za-z_]\w*)", re.M)
+_PY_CLASS = re.compile(r"^class\s+([A-Za-z_]\w*)", re.M)
+_PY_IMPORT = re.compile(r"^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))", re.M)
+
+
+@dataclass
+class FileSymbols:
+    """Names a file defines or refers to that other files may need to match."""
+    exports: List[str] = field(default_factory=list)
+    classes: List[str] = field(default_factory=list)
+    element_ids: List[str] = field(default_factory=list)
+    css_classes: List[str] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+
+
+def _unique(names) -> List[str]:
+    return list(dict.fromkeys(n.strip() for n in names if n and n.strip()))
+
+
+def _names(export_list: str) -> List[str]:
+    # "a, b as c" -> ["a", "c"]
+    return [part.split(" as ")[-1].strip() for part in export_list.split(",")]
+
+
+def extract_symbols(path: str, content: str) -> FileSymbols:
+    """Extracts the symbols of a file with a few regular expressions per file type."""
+    ext = posixpath.splitext(path)[1].lower()
+    symbols = FileSymbols()
+    if ext in _JS_EXTENSIONS:
+        exports = _JS_EXPORT.findall(content)
+        for export_list in _JS_EXPORT_LIST.findall(content):
+            exports += _names(export_list)
+        for name, export_list in _JS_MODULE_EXPORTS.findall(content):
+            exports += [name] if name else _names(export_list.replace(":", " as "))
+        symbols.exports = _unique(exports)
+        symbols.classes = _unique(_JS_CLASS.findall(content))
+        symbols.imports = _unique(_JS_IMPORT.findall(content))
+        symbols.element_ids = _unique(a or b for a, b in _JS_DOM_ID.findall(content))
+        symbols.css_classes = _unique(a or b for a, b in _JS_DOM_CLASS.findall(content))
+        if ext in {".jsx", ".tsx", ".vue", ".svelte"}:
+            symbols.element_ids += [i for i in _unique(_HTML_ID.findall(content)) if i not in symbols.element_ids]
+            symbols.css_classes = _unique(
+                symbols.css_classes + [c for value in _HTML_CLASS.findall(content) for c in value.split()]
+            )
+    elif ext in _HTML_EXTENSIONS:
+        symbols.element_ids = _unique(_HTML_ID.findall(content))
+        symbols.css_classes = _unique(c for value in _HTML_CLASS.findall(content) for c in value.split())
+        symbols.imports = _unique(_HTML_ASSET.findall(content))
+    elif ext in _CSS_EXTENSIONS:
+        # Drop comments, strings (@import targets, urls) and declarations, keeping selectors
+        selectors = re.sub(r"/\*.*?\*/|(['\"]).*?\1|url\([^)]*\)", "", content, flags=re.S)
+        selectors = _CSS_BLOCK.sub("\n", selectors)
+        symbols.css_classes = _unique(_CSS_CLASS.findall(selectors))
+        symbols.element_ids = _unique(i for i in _CSS_ID.findall(selectors) if not re.fullmatch(r"[0-9a-fA-F]{3,8}", i))
+        symbols.imports = _unique(_CSS_IMPORT.findall(content))
+    elif ext == ".py":
+        symbols.exports = _unique(n for n in _PY_DEF.findall(content) if not n.startswith("_"))
+        symbols.classes = _unique(_PY_CLASS.findall(content))
+        symbols.imports = _unique(a or b for a, b in _PY_IMPORT.findall(content))
+    return symbols
+
+
+def _format_names(label: str, names: List[str], prefix: str = "", limit: int = 12) -> str:
+    shown = ", ".join(prefix + n for n in names[:limit])
+    more = f" (+{len(names) - limit} more)" if len(names) > limit else ""
+    return f"{label} {shown}{more}"
+
+
+def format_symbols(path: str, symbols: FileSymbols) -> str:
+    """One line describing the symbols of a file, or "" if it has none."""
+    parts = []
+    if symbols.exports:
+        parts.append(_format_names("exports", symbols.exports))
+    classes = [c for c in symbols.classes if c not in symbols.exports]
+    if classes:
+        parts.append(_format_names("classes", classes))
+    if symbols.element_ids:
+        parts.append(_format_names("ids", symbols.element_ids, "#"))
+    if symbols.css_classes:
+        parts.append(_format_names("css", symbols.css_classes, "."))
+    if symbols.imports:
+        parts.append(_format_names("imports", symbols.imports, limit=8))
+    return f"- {path}: " + "; ".join(parts) if parts else ""
+
+
+def summarize_symbols(index: Dict[str, FileSymbols], priority: List[str], max_chars: int) -> str:
+    """Summary of a symbol index in at most ``max_chars``.
+
+    Files in ``priority`` come first, the rest in path order; once a file
+    does not fit, the remaining ones are only counted.
+    """
+    order = list(dict.fromkeys([p for p in priority if p in index] + sorted(index)))
+    lines, used, skipped = [], 0, 0
+    for path in order:
+        symbols = index[path]
+        if skipped:
+            skipped += any(vars(symbols).values())
+            continue
+        line = format_symbols(path, symbols)
+        if not line:
+            continue
+        if used + len(line) + 1 > max_chars:
+            skipped += 1
+            continue
+        lines.append(line)
+        used += len(line) + 1
+    if skipped:
+        lines.append(f"- ... {skipped} more files not shown (use read_file if you need them)")
+    return "\n".join(lines)
@@ -1,62 +1,121 @@
 import pathlib
 import subprocess
-from typing import Tuple
+from typing import List, Tuple
 
 from langchain_core.tools import tool
+from langgraph.config import get_stream_writer
+from pydantic import BaseModel, Field
 
-PROJECT_ROOT = pathlib.Path.cwd() / "generated_project"
+# The directory settings live in tools.workspace, which the entry points can
+# import without loading LangChain.
+from tools.workspace import PROJECT_ROOT, Workspace, active_workspace, get_workspace
+
+# Index of PROJECT_ROOT, used when no run selected another workspace. Writes
+# are buffered and reach the disk when flush() runs at the end of each coder step.
+workspace = get_workspace(PROJECT_ROOT)
+
+
+def current_workspace() -> Workspace:
+    """Workspace of the running generation, PROJECT_ROOT's outside of one."""
+    return active_workspace() or workspace
+
+
+def emit_event(event: dict) -> None:
+    """Publishes a progress event on the "custom" stream of the running graph.
+
+    Outside of a graph run the event is dropped.
+    """
+    try:
+        writer = get_stream_writer()
+    except (RuntimeError, KeyError):
+        return
+    writer(event)
 
 
 def safe_path_for_project(path: str) -> pathlib.Path:
-    p = (PROJECT_ROOT / path).resolve()
-    if PROJECT_ROOT.resolve() not in p.parents and PROJECT_ROOT.resolve() != p.parent and PROJECT_ROOT.resolve() != p:
-        raise ValueError("Attempt to write outside project root")
-    return p
+    return current_workspace().path(path)
 
 
 @tool
 def write_file(path: str, content: str) -> str:
     """Writes content to a file at the specified path within the project root."""
-    p = safe_path_for_project(path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    with open(p, "w", encoding="utf-8") as f:
-        f.write(content)
-    return f"WROTE:{p}"
+    ws = current_workspace()
+    rel = ws.write(path, content)
+    emit_event({"event": "file_written", "path": rel, "size": len(content)})
+    return f"WROTE:{ws.path(rel)}"
+
+
+class FileEdit(BaseModel):
+    """A single search/replace hunk"""
+    search: str = Field(description="Exact text to replace; must occur exactly once in the file, so include enough surrounding lines to make it unique")
+    replace: str = Field(description="Text that replaces the search text")
+
+
+def apply_edits(content: str, edits: List[FileEdit]) -> str:
+    """Applies search/replace hunks in order, raising ValueError if one does not match exactly once."""
+    for n, edit in enumerate(edits, start=1):
+        if isinstance(edit, dict):
+            edit = FileEdit(**edit)
+        if not edit.search:
+            raise ValueError(f"edit {n}: search text is empty")
+        count = content.count(edit.search)
+        if count != 1:
+            where = "not found" if count == 0 else f"found {count} times"
+            raise ValueError(f"edit {n}: search text {where}")
+        content = content.replace(edit.search, edit.replace, 1)
+    return content
+
+
+@tool
+def edit_file(path: str, edits: List[FileEdit]) -> str:
+    """Edits an existing file within the project root by applying search/replace hunks.
+
+    All hunks are validated before anything is written; if one fails, the file is left unchanged.
+    """
+    ws = current_workspace()
+    content = ws.read(path)
+    if content is None:
+        return f"ERROR: {path} does not exist, use write_file to create it"
+    try:
+        content = apply_edits(content, edits)
+    except ValueError as e:
+        return f"ERROR: {e}; no changes were written to {path}"
+    rel = ws.write(path, content)
+    emit_event({"event": "file_written", "path": rel, "size": len(content)})
+    return f"EDITED:{ws.path(rel)} ({len(edits)} hunks)"
 
 
 @tool
 def read_file(path: str) -> str:
     """Reads content from a file at the specified path within the project root."""
-    p = safe_path_for_project(path)
-    if not p.exists():
-        return ""
-    with open(p, "r", encoding="utf-8") as f:
-        return f.read()
+    content = current_workspace().read(path)
+    return "" if content is None else content
 
 
 @tool
 def get_current_directory() -> str:
     """Returns the current working directory."""
-    return str(PROJECT_ROOT)
+    return str(current_workspace().root)
 
 
 @tool
 def list_files(directory: str = ".") -> str:
     """Lists all files in the specified directory within the project root."""
-    p = safe_path_for_project(directory)
-    if not p.is_dir():
-        return f"ERROR: {p} is not a directory"
-    files = [str(f.relative_to(PROJECT_ROOT)) for f in p.glob("**/*") if f.is_file()]
+    ws = current_workspace()
+    if not ws.is_dir(directory):
+        return f"ERROR: {ws.path(directory)} is not a directory"
+    files = ws.list(directory)
     return "\n".join(files) if files else "No files found."
 
 @tool
 def run_cmd(cmd: str, cwd: str = None, timeout: int = 30) -> Tuple[int, str, str]:
     """Runs a shell command in the specified directory and returns the result."""
-    cwd_dir = safe_path_for_project(cwd) if cwd else PROJECT_ROOT
-    res = subprocess.run(cmd, shell=True, cwd=str(cwd_dir), capture_output=True, text=True, timeout=timeout)
+    ws = current_workspace()
+    cwd_dir = ws.path(cwd) if cwd else ws.root
+    # The command sees the buffered writes and may change files itself.
+    ws.flush()
+    try:
+        res = subprocess.run(cmd, shell=True, cwd=str(cwd_dir), capture_output=True, text=True, timeout=timeout)
+    finally:
+        ws.refresh()
     return res.returncode, res.stdout, res.stderr
-
-
-def init_project_root():
-    PROJECT_ROOT.mkdir(parents=True, exist_ok=True)
-    return str(PROJECT_ROOT)
\ No newline at end of file
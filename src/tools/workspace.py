@@ -0,0 +1,414 @@
+import hashlib
+import json
+import os
+import pathlib
+import posixpath
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from tools.symbols import FileSymbols, extract_symbols
+
+PROJECT_ROOT = pathlib.Path.cwd() / "generated_project"
+
+# Every run of the app gets its own workspace below this directory.
+WORKSPACES_DIR = pathlib.Path(os.getenv("WORKSPACES_DIR", str(pathlib.Path.cwd() / "workspaces")))
+WORKSPACE_MAX_AGE_HOURS = float(os.getenv("WORKSPACE_MAX_AGE_HOURS", "24"))
+
+# Pending writes are flushed once they add up to this many bytes, even if
+# nobody calls flush() before.
+FLUSH_THRESHOLD_BYTES = int(os.getenv("WORKSPACE_FLUSH_BYTES", str(4 * 1024 * 1024)))
+
+# Directory of a workspace for data about the generation rather than the
+# project (see agent/incremental.py); it is not part of the index.
+METADATA_DIR = ".generator"
+
+# File contents up to this size are kept in memory after the first read.
+_MAX_CACHED_FILE_BYTES = 1024 * 1024
+
+
+# Read once, as os.umask can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(p: pathlib.Path, content: str) -> None:
+    """Writes a file through a temporary file and a rename, so readers never see partial content.
+
+    The file keeps the mode of the file it replaces; new files get the
+    mode the umask allows, like files opened with open().
+    """
+    fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        try:
+            mode = os.stat(p).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, p)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class WriteJournal:
+    """Append-only record of what a run wrote, one compact JSON line per event.
+
+    ``{"t": time, "path": ..., "size": ..., "sha256": ..., "writes": n}`` is
+    appended once a file is on disk, ``writes`` counting the buffered writes
+    coalesced into it; ``{"t": time, "steps": [...]}`` once implementation
+    steps have completed.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+
+    def append(self, records: List[dict]) -> None:
+        if not records:
+            return
+        lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+
+def journal_path(root: pathlib.Path, run_id: str) -> pathlib.Path:
+    return pathlib.Path(root) / METADATA_DIR / "journal" / f"{run_id}.jsonl"
+
+
+def read_journal(root: pathlib.Path, run_id: str) -> List[dict]:
+    """Records of the write journal of ``run_id`` in the workspace at ``root``, oldest first.
+
+    A last line cut short by a crash is skipped.
+    """
+    try:
+        with open(journal_path(root, run_id), "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+@dataclass
+class FileEntry:
+    """Index entry of one workspace file."""
+    size: int
+    sha256: str
+    content: Optional[str] = None
+    symbols: Optional[FileSymbols] = None
+
+
+class Workspace:
+    """In-memory index of a project directory.
+
+    The directory is scanned once; afterwards paths, sizes, hashes and the
+    symbols each file defines are served from the index and kept up to
+    date by ``write``. Written content
+    is buffered and reaches the disk in batches through ``flush``, one
+    atomic rename per file, so tool latency does not grow with the number
+    of files in the project. Writes to a path that is still buffered
+    replace the buffered content, so a file rewritten several times in a
+    step reaches the disk once. Files that reach the disk are recorded in
+    the write journal of the run set with ``use_journal``.
+    """
+
+    def __init__(self, root: pathlib.Path):
+        self.root = pathlib.Path(root)
+        self._root = self.root.resolve()
+        self._entries: Optional[Dict[str, FileEntry]] = None
+        self._pending: Dict[str, str] = {}
+        self._pending_bytes = 0
+        # Writes buffered per pending path since the last flush
+        self._pending_writes: Dict[str, int] = {}
+        self.journal: Optional[WriteJournal] = None
+        self._lock = threading.RLock()
+
+    def use_journal(self, run_id: str) -> None:
+        """Journals the writes of ``run_id`` from now on, see WriteJournal."""
+        path = journal_path(self._root, run_id)
+        with self._lock:
+            if self.journal is None or self.journal.path != path:
+                self.journal = WriteJournal(path)
+
+    def record(self, record: dict) -> None:
+        """Appends a record to the write journal, if the workspace has one."""
+        if self.journal is not None:
+            self.journal.append([{"t": round(time.time(), 3), **record}])
+
+    def relative(self, path: str) -> str:
+        """Normalizes ``path`` to a POSIX path relative to the root.
+
+        Raises ValueError for paths that leave the workspace.
+        """
+        raw = str(path).replace("\\", "/")
+        if os.path.isabs(raw):
+            raw = os.path.relpath(os.path.normpath(raw), self._root).replace(os.sep, "/")
+        rel = posixpath.normpath(raw or ".")
+        if rel == ".." or rel.startswith("../") or posixpath.isabs(rel):
+            raise ValueError("Attempt to write outside project root")
+        return rel
+
+    def path(self, path: str) -> pathlib.Path:
+        """Absolute path of a workspace file."""
+        rel = self.relative(path)
+        return self._root if rel == "." else self._root / rel
+
+    def _index(self) -> Dict[str, FileEntry]:
+        if self._entries is None:
+            entries = {}
+            if self._root.is_dir():
+                for dirpath, dirnames, filenames in os.walk(self._root):
+                    if dirpath == str(self._root) and METADATA_DIR in dirnames:
+                        dirnames.remove(METADATA_DIR)
+                    for name in filenames:
+                        full = pathlib.Path(dirpath) / name
+                        data = full.read_bytes()
+                        rel = full.relative_to(self._root).as_posix()
+                        entries[rel] = FileEntry(size=len(data), sha256=content_hash(data))
+            self._entries = entries
+        return self._entries
+
+    def write(self, path: str, content: str) -> str:
+        """Buffers a write and updates the index; returns the relative path.
+
+        Raises ValueError for paths that name a directory or lie below a file,
+        as they could never be written to disk.
+        """
+        rel = self.relative(path)
+        if rel == "." or str(path).rstrip().endswith(("/", "\\")):
+            raise ValueError(f"{path!r} is a directory, not a file")
+        data = content.encode("utf-8")
+        with self._lock:
+            index = self._index()
+            if rel not in index and self.is_dir(rel):
+                raise ValueError(f"{path!r} is a directory, not a file")
+            parent = posixpath.dirname(rel)
+            while parent:
+                if parent in index:
+                    raise ValueError(f"cannot write {path!r}: {parent!r} is a file")
+                parent = posixpath.dirname(parent)
+            if rel in self._pending:
+                # The index entry of a pending file has the size of its buffered content
+                self._pending_bytes -= index[rel].size
+            cached = content if len(data) <= _MAX_CACHED_FILE_BYTES else None
+            index[rel] = FileEntry(
+                size=len(data), sha256=content_hash(data), content=cached, symbols=extract_symbols(rel, content)
+            )
+            self._pending[rel] = content
+            self._pending_bytes += len(data)
+            self._pending_writes[rel] = self._pending_writes.get(rel, 0) + 1
+            if self._pending_bytes >= FLUSH_THRESHOLD_BYTES:
+                self.flush()
+        return rel
+
+    def read(self, path: str) -> Optional[str]:
+        """Content of a file, or None if it does not exist."""
+        rel = self.relative(path)
+        with self._lock:
+            if rel in self._pending:
+                return self._pending[rel]
+            entry = self._index().get(rel)
+            if entry is None:
+                return None
+            if entry.content is not None:
+                return entry.content
+            with open(self._root / rel, "r", encoding="utf-8") as f:
+                content = f.read()
+            if entry.size <= _MAX_CACHED_FILE_BYTES:
+                entry.content = content
+            return content
+
+    def exists(self, path: str) -> bool:
+        rel = self.relative(path)
+        with self._lock:
+            return rel in self._index()
+
+    def stat(self, path: str) -> Optional[FileEntry]:
+        """Size and hash of a file without reading it."""
+        rel = self.relative(path)
+        with self._lock:
+            return self._index().get(rel)
+
+    def symbols(self) -> Dict[str, FileSymbols]:
+        """Symbols of every file; files found on disk are parsed on first use."""
+        with self._lock:
+            paths = list(self._index())
+        index = {}
+        for rel in paths:
+            entry = self.stat(rel)
+            if entry is None:
+                continue
+            if entry.symbols is None:
+                try:
+                    content = self.read(rel) if entry.size <= _MAX_CACHED_FILE_BYTES else None
+                except (OSError, UnicodeDecodeError):
+                    content = None
+                entry.symbols = extract_symbols(rel, content or "")
+            index[rel] = entry.symbols
+        return index
+
+    def is_dir(self, path: str) -> bool:
+        rel = self.relative(path)
+        if rel == ".":
+            return True
+        prefix = rel + "/"
+        with self._lock:
+            if any(p.startswith(prefix) for p in self._index()):
+                return True
+        return (self._root / rel).is_dir()
+
+    def list(self, directory: str = ".") -> List[str]:
+        """Sorted relative paths of all files below ``directory``."""
+        rel = self.relative(directory)
+        with self._lock:
+            paths = list(self._index())
+        if rel != ".":
+            prefix = rel + "/"
+            paths = [p for p in paths if p.startswith(prefix)]
+        return sorted(paths)
+
+    def flush(self) -> int:
+        """Writes all buffered files to disk; returns how many were written.
+
+        A file is taken off the buffer only once it is on disk, so if one
+        write fails, it and the files after it stay buffered for the next
+        flush and the error is raised.
+        """
+        with self._lock:
+            entries = self._index()
+            written = []
+            try:
+                for rel, content in list(self._pending.items()):
+                    p = self._root / rel
+                    p.parent.mkdir(parents=True, exist_ok=True)
+                    atomic_write(p, content)
+                    del self._pending[rel]
+                    self._pending_bytes -= entries[rel].size
+                    written.append((rel, self._pending_writes.pop(rel, 1)))
+            finally:
+                if self.journal is not None and written:
+                    now = round(time.time(), 3)
+                    self.journal.append([
+                        {"t": now, "path": rel, "size": entries[rel].size, "sha256": entries[rel].sha256,
+                         "writes": writes}
+                        for rel, writes in written
+                    ])
+            return len(written)
+
+    def refresh(self) -> None:
+        """Flushes pending writes and drops the index, e.g. after files were changed outside the workspace."""
+        with self._lock:
+            self.flush()
+            self._entries = None
+
+    def clear(self) -> None:
+        """Deletes every file of the workspace."""
+        with self._lock:
+            self._pending, self._pending_bytes, self._pending_writes = {}, 0, {}
+            if self._root.exists():
+                for item in self._root.iterdir():
+                    if item.is_dir():
+                        shutil.rmtree(item)
+                    else:
+                        item.unlink()
+            self._entries = {}
+
+
+def init_project_root(root: pathlib.Path = PROJECT_ROOT):
+    root.mkdir(parents=True, exist_ok=True)
+    return str(root)
+
+
+_registry: Dict[pathlib.Path, Workspace] = {}
+_in_use: Dict[pathlib.Path, int] = {}
+_registry_lock = threading.Lock()
+_active: ContextVar[Optional[Workspace]] = ContextVar("active_workspace", default=None)
+
+
+def get_workspace(root: pathlib.Path) -> Workspace:
+    """Returns the workspace of ``root``, shared by every caller in the process."""
+    key = pathlib.Path(root).resolve()
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = Workspace(key)
+        return _registry[key]
+
+
+def active_workspace() -> Optional[Workspace]:
+    """Workspace selected with use_workspace in the current context, if any."""
+    return _active.get()
+
+
+@contextmanager
+def use_workspace(workspace: Workspace) -> Iterator[Workspace]:
+    """Makes ``workspace`` the target of the file tools in this context.
+
+    Threads started through ContextThreadPoolExecutor and asyncio tasks
+    inherit it, so concurrent runs each see their own workspace.
+    """
+    token = _active.set(workspace)
+    with _registry_lock:
+        _in_use[workspace._root] = _in_use.get(workspace._root, 0) + 1
+    try:
+        yield workspace
+    finally:
+        _active.reset(token)
+        with _registry_lock:
+            _in_use[workspace._root] -= 1
+            if not _in_use[workspace._root]:
+                del _in_use[workspace._root]
+
+
+def _last_modified(root: pathlib.Path) -> float:
+    latest = root.stat().st_mtime
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                latest = max(latest, os.stat(os.path.join(dirpath, name)).st_mtime)
+            except OSError:
+                pass
+    return latest
+
+
+def cleanup_workspaces(base_dir: pathlib.Path, max_age_seconds: float) -> List[pathlib.Path]:
+    """Deletes workspaces below ``base_dir`` that were not modified for ``max_age_seconds``.
+
+    Workspaces that are in use are kept. Returns the deleted directories.
+    """
+    base_dir = pathlib.Path(base_dir)
+    if not base_dir.is_dir() or max_age_seconds <= 0:
+        return []
+    cutoff = time.time() - max_age_seconds
+    removed = []
+    for root in base_dir.iterdir():
+        if not root.is_dir():
+            continue
+        key = root.resolve()
+        if _last_modified(root) > cutoff:
+            continue
+        with _registry_lock:
+            if key in _in_use:
+                continue
+            _registry.pop(key, None)
+        shutil.rmtree(root, ignore_errors=True)
+        removed.append(root)
+    return removed